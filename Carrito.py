@@ -2,134 +2,646 @@ import pybullet as p
 import pybullet_data
 import time
 import math
+import os
 import numpy as np
 import socket
 import threading
+import queue
 import json
+import itertools
+import sqlite3
+import contextlib
+import glob
+import http.server
+from collections import deque
+from datetime import datetime
+
+from memoria_compartida import PoseRingBuffer
+from pistas import TRACK_SPACING, load_track_definitions, load_track_geometry
+
+# Parámetros del controlador (mismos valores que antes estaban fijos en el código)
+CONTROL_PARAMS_DEFAULT = {
+    "max_force": 60.0,      # Fuerza máxima hacia adelante
+    "min_force": 20.0,      # Fuerza mínima para no quedarse quieto en curvas
+    "steering_gain": 20.0,  # Ganancia del torque de giro
+    "max_steering": 40.0,   # Límite del torque para evitar giros bruscos
+    "lookahead": 1.5,       # Distancia de anticipación (m) del pure pursuit
+    "max_speed": 8.0        # Velocidad máxima (m/s)
+}
+
+# Perfiles por pista generados por optimizador.py (se cargan al crear cada carro)
+CONTROL_PROFILES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perfiles_control.json")
+
+# Vueltas grabadas (un .npz comprimido por vuelta) para reproducirlas sin física
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorridos")
+RECORDINGS_KEEP = 20  # Vueltas grabadas que se conservan por pista (las más antiguas se borran)
+
+# Resultados de las vueltas (modo TCP/IP) guardados por lotes en SQLite
+LAP_STORE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vueltas.db")
+LAP_STORE_BATCH = 20             # Vueltas acumuladas antes de escribir
+LAP_STORE_FLUSH_INTERVAL = 5.0   # Segundos máximos que una vuelta espera en memoria
+
+# Estado grabado por paso de simulación
+TRAJECTORY_DTYPE = np.dtype([
+    ("t", "f4"),                # Tiempo simulado (s)
+    ("pos", "f4", 3),           # Posición x, y, z relativa al origen de la pista
+    ("orn", "f4", 4),           # Orientación (cuaternión)
+    ("vel", "f4", 2),           # Velocidad lineal x, y
+    ("forward_force", "f4"),
+    ("steering_force", "f4"),
+    ("target", "i4")            # Índice sobre la trayectoria densa
+])
+
+TRACK_SEARCH_WINDOW = 40  # Muestras revisadas hacia adelante para ubicar el carro
+
+# Detección de atascos sobre una ventana con las últimas muestras de cada carro
+STUCK_WINDOW = 120            # Pasos en la ventana (0.5 s de tiempo simulado)
+STUCK_CHECK_INTERVAL = 12     # Pasos entre evaluaciones de la ventana (20 Hz)
+STUCK_WARMUP = 240            # Pasos sin evaluar tras el arranque o una recuperación (1 s)
+STUCK_CONFIRM_CHECKS = 20     # Evaluaciones seguidas con el mismo motivo antes de recuperar (1 s)
+STALL_DISTANCE = 0.1          # Desplazamiento neto (m) mínimo en la ventana
+OSCILLATION_TRAVEL = 1.0      # Recorrido (m) en la ventana desde el cual se evalúa oscilación
+OSCILLATION_PROGRESS = 0.1    # Avance sobre la pista (fracción del recorrido) bajo el cual el carro oscila
+OSCILLATION_CROSS_TRACK = 1.0 # Distancia media (m) a la pista desde la cual un carro que no avanza está fuera de la línea
+OSCILLATION_DISPLACEMENT = 0.5  # Desplazamiento neto (fracción del recorrido) bajo el cual va y viene
+OFF_TRACK_DISTANCE = 3.0      # Distancia (m) a la pista sostenida (y creciendo) durante toda la ventana
+STUCK_RECOVERY_SPEED = 1.0    # Velocidad (m/s) con la que se saca a un carro detenido
+STUCK_STALLED = 1
+STUCK_OSCILLATING = 2
+STUCK_OFF_TRACK = 3
+STUCK_MESSAGES = {
+    STUCK_STALLED: "parece atascado, impulsándolo",
+    STUCK_OSCILLATING: "oscila sin avanzar, alineándolo con la pista",
+    STUCK_OFF_TRACK: "se salió de la pista, regresándolo"
+}
+
+PHYSICS_TIMESTEP = 1. / 240.  # Paso de tiempo por defecto de PyBullet
+MAX_CATCHUP_STEPS = 24        # Pasos máximos por cuadro para alcanzar el tiempo real
+
+# Frecuencia (Hz) de las tareas de GUI, independientes del paso de física
+SCHEDULER_RATES = {
+    "camera": 30,
+    "keyboard": 10,
+    "log": 1
+}
+
+# Pistas definidas en pistas/*.json (ver pistas.py): nombres, tiempos límite (s) y
+# desplazamiento de cada pista cuando las tres comparten el mismo mundo
+TRACK_DEFINITIONS = load_track_definitions()
+TRACK_TYPES = tuple(TRACK_DEFINITIONS)
+TRACK_NAMES = {t: d["name"] for t, d in TRACK_DEFINITIONS.items()}
+CAR_NAMES = {t: d["car_name"] for t, d in TRACK_DEFINITIONS.items()}
+TRACK_TIME_LIMITS = {t: d["time_limit"] for t, d in TRACK_DEFINITIONS.items()}
+WORLD_TRACK_ORIGINS = {t: d["world_origin"] for t, d in TRACK_DEFINITIONS.items()}
+
+# Métricas del servidor
+LAP_HISTORY_SIZE = 50       # Vueltas recientes guardadas en el historial
+COMMAND_RATE_WINDOW = 10.0  # Ventana (s) para calcular comandos por segundo
+COMMAND_RATE_SAMPLES = 1024 # Marcas de tiempo de comandos guardadas para la ventana
+WORLD_STOP_TIMEOUT = 5.0    # Segundos que se espera al hilo de simulación al detener el mundo
+CLIENT_SEND_TIMEOUT = 2.0   # Segundos máximos de un envío a un cliente antes de desconectarlo
+
+# Telemetría UDP en vivo (pose, objetivo y eventos de vuelta)
+TELEMETRY_PORT = 9870   # Puerto UDP local por defecto
+TELEMETRY_RATE = 30     # Datagramas de pose por segundo
+
+# Formato binario (little-endian, sin relleno): cada datagrama es una cabecera seguida
+# de `count` registros de pose o de un registro de evento de vuelta
+TELEMETRY_POSE = 1
+TELEMETRY_LAP = 2
+TELEMETRY_HEADER_DTYPE = np.dtype([
+    ("kind", "u1"),         # TELEMETRY_POSE o TELEMETRY_LAP
+    ("count", "u1"),        # Registros que siguen a la cabecera
+    ("seq", "<u4"),         # Secuencia para detectar datagramas perdidos
+    ("sim_time", "<f4")     # Tiempo simulado del mundo (s)
+])
+TELEMETRY_POSE_DTYPE = np.dtype([
+    ("track", "u1"),
+    ("target", "<u2"),      # Índice sobre la trayectoria densa
+    ("x", "<f4"),           # Posición relativa al origen de la pista
+    ("y", "<f4"),
+    ("yaw", "<f4"),
+    ("speed", "<f4")
+])
+TELEMETRY_LAP_DTYPE = np.dtype([
+    ("track", "u1"),
+    ("status", "u1"),       # Código de LAP_STATUS_CODES
+    ("lap_time", "<f4"),
+    ("stuck_events", "<u2")
+])
+LAP_STATUS_CODES = {
+    "completed": 0,
+    "timeout": 1,
+    "interrupted": 2,
+    "replayed": 3
+}
+
+
+def load_control_profile(track_type, path=CONTROL_PROFILES_FILE):
+    """Lee los parámetros del controlador guardados para una pista; {} si no hay perfil"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            profiles = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"⚠️ No se pudo leer el archivo de perfiles {path}: {e}")
+        return {}
+    profile = profiles.get(str(track_type), {})
+    return {key: float(value) for key, value in profile.items() if key in CONTROL_PARAMS_DEFAULT}
+
+
+def pure_pursuit_batch(positions, headings, targets, paths, path_lengths, params):
+    """Controlador pure pursuit vectorizado para varios carros a la vez.
+
+    positions (n, 2), headings (n,), targets (n,) índices actuales sobre la pista,
+    paths (n, max_len, 2) trayectorias densas rellenadas con su último punto,
+    path_lengths (n,) muestras válidas de cada trayectoria. Los valores de params
+    pueden ser escalares o arreglos (n,). Retorna (targets, forward_force, steering_force).
+    """
+    rows = np.arange(len(targets))
+    last = path_lengths - 1
+
+    # Punto más cercano dentro de una ventana fija hacia adelante
+    window_idx = np.minimum(targets[:, None] + np.arange(TRACK_SEARCH_WINDOW), last[:, None])
+    window = paths[rows[:, None], window_idx]
+    distances = np.sum((window - positions[:, None, :]) ** 2, axis=2)
+    targets = window_idx[rows, np.argmin(distances, axis=1)]
+
+    # Punto de anticipación a 'lookahead' metros sobre la pista
+    lookahead_steps = np.rint(np.asarray(params["lookahead"]) / TRACK_SPACING).astype(int)
+    target_points = paths[rows, np.minimum(targets + lookahead_steps, last)]
+
+    # Error de ángulo hacia el punto de anticipación, normalizado a [-pi, pi)
+    delta = target_points - positions
+    angle_error = (np.arctan2(delta[:, 1], delta[:, 0]) - headings + np.pi) % (2 * np.pi) - np.pi
+
+    forward_force = np.maximum(params["min_force"], params["max_force"] * (1 - np.abs(angle_error) / np.pi))
+    steering_force = np.clip(angle_error * params["steering_gain"], -np.asarray(params["max_steering"]),
+                             params["max_steering"])
+    return targets, forward_force, steering_force
+
+
+class StuckDetector:
+    """Detección vectorizada de atascos para n carros. Guarda en una ventana circular las
+    últimas STUCK_WINDOW muestras de cada carro (posición, avance sobre la pista y distancia
+    a ella) y evalúa a la vez, para todos los carros, tres casos: carro detenido, carro que
+    se mueve sin avanzar (oscila alrededor de un punto) y carro alejado de la pista.
+    Todos los carros comparten la posición de escritura del anillo, así cada paso es una
+    sola escritura y la evaluación usa cortes contiguos; se evalúa cada
+    STUCK_CHECK_INTERVAL pasos.
+    Para no tocar vueltas sanas, un carro no se evalúa durante STUCK_WARMUP pasos tras el
+    arranque o una recuperación, y un motivo solo se reporta cuando se repite en
+    STUCK_CONFIRM_CHECKS evaluaciones seguidas."""
+    
+    def __init__(self, n, window=STUCK_WINDOW, check_interval=STUCK_CHECK_INTERVAL, warmup=STUCK_WARMUP,
+                 confirm_checks=STUCK_CONFIRM_CHECKS):
+        self.window = window
+        self.check_interval = check_interval
+        self.warmup = max(warmup, window)
+        self.confirm_checks = confirm_checks
+        self.samples = np.zeros((window, n, 4))    # x, y, avance (m), distancia a la pista (m)
+        self.counts = np.zeros(n, dtype=int)       # Muestras desde el último reinicio de cada carro
+        self.pending = np.zeros(n, dtype=int)      # Motivo visto en la última evaluación
+        self.confirmations = np.zeros(n, dtype=int)  # Evaluaciones seguidas con ese motivo
+        self.head = 0
+        self.steps = 0
+    
+    def reset(self, rows):
+        """Vacía la ventana de los carros indicados (vuelta nueva o recién recuperados)"""
+        self.counts[rows] = 0
+        self.pending[rows] = 0
+        self.confirmations[rows] = 0
+    
+    def update(self, rows, positions, progress, cross_track):
+        """Agrega una muestra por carro (se llama una vez por paso de física) y retorna el
+        motivo de atasco confirmado de cada uno: STUCK_STALLED, STUCK_OSCILLATING,
+        STUCK_OFF_TRACK o 0. rows puede ser un arreglo de índices o un solo índice (entonces
+        retorna un escalar). Solo se evalúan los carros que pasaron el calentamiento."""
+        sample = self.samples[self.head]
+        sample[rows, :2] = positions
+        sample[rows, 2] = progress
+        sample[rows, 3] = cross_track
+        self.counts[rows] += 1
+        self.head = (self.head + 1) % self.window
+        self.steps += 1
+        if self.steps % self.check_interval:
+            return np.zeros_like(self.counts[rows])
+        
+        # Ventana de la muestra más antigua (la siguiente a sobrescribir) a la más nueva
+        window = np.concatenate((self.samples[self.head:], self.samples[:self.head]))[:, rows]
+        change = window[-1] - window[0]
+        displacement = np.hypot(change[..., 0], change[..., 1])
+        # Recorrido sobre muestras espaciadas check_interval pasos: sumar los pasos de 240 Hz
+        # acumula la vibración del carro y hace parecer que oscila uno que avanza normal
+        steps = np.diff(window[::-self.check_interval, ..., :2], axis=0)
+        travel = np.hypot(steps[..., 0], steps[..., 1]).sum(axis=0)
+        
+        off_track = (window[..., 3].min(axis=0) > OFF_TRACK_DISTANCE) & (change[..., 3] > 0)
+        stalled = displacement < STALL_DISTANCE
+        # Se mueve sin avanzar sobre la pista, y además está fuera de la línea o va y viene
+        oscillating = ((travel > OSCILLATION_TRAVEL) & (change[..., 2] < OSCILLATION_PROGRESS * travel)
+                       & ((window[..., 3].mean(axis=0) > OSCILLATION_CROSS_TRACK)
+                          | (displacement < OSCILLATION_DISPLACEMENT * travel)))
+        reasons = np.select([off_track, stalled, oscillating],
+                            [STUCK_OFF_TRACK, STUCK_STALLED, STUCK_OSCILLATING], 0)
+        reasons = reasons * (self.counts[rows] >= self.warmup)
+        
+        # Confirmar: el mismo motivo en varias evaluaciones seguidas
+        confirmations = np.where((reasons > 0) & (reasons == self.pending[rows]), self.confirmations[rows] + 1,
+                                 (reasons > 0).astype(int))
+        self.pending[rows] = reasons
+        self.confirmations[rows] = confirmations
+        return reasons * (confirmations >= self.confirm_checks)
+
+
+def recover_car(car_id, reason, heading, speed, path, target, physics_client=0):
+    """Saca a un carro de un atasco según el motivo, orientándose con la tangente de la
+    pista en su punto más cercano (target). Un carro detenido recibe velocidad a lo largo
+    de su propio eje, hacia adelante o en reversa según hacia dónde sigue la pista; uno que
+    oscila o que se alejó de la pista se coloca en ese punto, alineado con la tangente y
+    conservando su velocidad (speed, ya limitada por quien llama) en esa dirección.
+    Solo se llama con motivos confirmados por StuckDetector: reubicar a un carro sano
+    cambiaría su tiempo de vuelta."""
+    tangent = path[min(target + 1, len(path) - 1)] - path[max(target - 1, 0)]
+    track_heading = math.atan2(tangent[1], tangent[0])
+    
+    if reason == STUCK_STALLED:
+        direction = math.copysign(STUCK_RECOVERY_SPEED, math.cos(track_heading - heading))
+        p.resetBaseVelocity(car_id, [direction * math.cos(heading), direction * math.sin(heading), 0], [0, 0, 0],
+                            physicsClientId=physics_client)
+        return
+    
+    point = path[target]
+    p.resetBasePositionAndOrientation(car_id, [point[0], point[1], 0.5],
+                                      p.getQuaternionFromEuler([0, 0, track_heading]), physicsClientId=physics_client)
+    p.resetBaseVelocity(car_id, [speed * math.cos(track_heading), speed * math.sin(track_heading), 0], [0, 0, 0],
+                        physicsClientId=physics_client)
+
+
+class FixedStepScheduler:
+    """Planificador de paso fijo: la física avanza siempre PHYSICS_TIMESTEP por paso y se
+    ejecutan tantos pasos como el tiempo real transcurrido indique (acumulador). Las tareas
+    de GUI (cámara, teclado, logs) corren a su propia frecuencia, más baja.
+    Con realtime=False se ejecuta un paso por iteración sin dormir (modo sin GUI)."""
+    
+    def __init__(self, physics_dt=PHYSICS_TIMESTEP, realtime=True, max_catchup_steps=MAX_CATCHUP_STEPS):
+        self.physics_dt = physics_dt
+        self.realtime = realtime
+        self.max_catchup_steps = max_catchup_steps
+        self.accumulator = 0.0
+        self.last_time = time.perf_counter()
+        self.sim_time = 0.0
+        self.tasks = []
+    
+    def add_task(self, rate_hz, callback):
+        """Registra una tarea periódica; rate_hz <= 0 la desactiva"""
+        if rate_hz > 0:
+            self.tasks.append([1.0 / rate_hz, 0.0, callback])
+    
+    def due_steps(self):
+        """Número de pasos de física pendientes para alcanzar el tiempo real"""
+        if not self.realtime:
+            return 1
+        now = time.perf_counter()
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        steps = int(self.accumulator / self.physics_dt)
+        if steps > self.max_catchup_steps:
+            # Muy atrasados: se descarta el sobrante en lugar de acumular retraso
+            steps = self.max_catchup_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * self.physics_dt
+        return steps
+    
+    def advance(self):
+        """Registra un paso de física ejecutado"""
+        self.sim_time += self.physics_dt
+    
+    def run_tasks(self):
+        """Ejecuta las tareas periódicas que ya vencieron"""
+        now = time.perf_counter()
+        for task in self.tasks:
+            period, next_time, callback = task
+            if now >= next_time:
+                task[1] = max(next_time + period, now)
+                callback()
+    
+    def wait(self):
+        """Duerme hasta que toque el siguiente paso de física"""
+        if self.realtime:
+            remaining = self.physics_dt - self.accumulator - (time.perf_counter() - self.last_time)
+            if remaining > 0:
+                time.sleep(remaining)
+
+
+class TelemetryPublisher:
+    """Publica la telemetría de los carros por UDP en el formato binario de
+    TELEMETRY_HEADER_DTYPE. El socket no es bloqueante: si no hay quién escuche o el
+    búfer está lleno el datagrama se descarta sin frenar la simulación."""
+    
+    def __init__(self, host="127.0.0.1", port=TELEMETRY_PORT, rate_hz=TELEMETRY_RATE):
+        self.address = (host, port)
+        self.rate_hz = rate_hz
+        self.seq = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+    
+    def _send(self, kind, sim_time, records):
+        header = np.array([(kind, len(records), self.seq, sim_time)], dtype=TELEMETRY_HEADER_DTYPE)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        try:
+            self.sock.sendto(header.tobytes() + records.tobytes(), self.address)
+        except OSError:
+            pass
+    
+    def publish_poses(self, sim_time, tracks, targets, poses):
+        """Envía la pose de varios carros; poses es un arreglo (n, 4) con x, y, yaw, velocidad"""
+        records = np.empty(len(tracks), dtype=TELEMETRY_POSE_DTYPE)
+        records["track"] = tracks
+        records["target"] = targets
+        records["x"] = poses[:, 0]
+        records["y"] = poses[:, 1]
+        records["yaw"] = poses[:, 2]
+        records["speed"] = poses[:, 3]
+        self._send(TELEMETRY_POSE, sim_time, records)
+    
+    def publish_lap(self, sim_time, track, status, lap_time, stuck_events):
+        """Envía el evento de fin de vuelta de un carro"""
+        records = np.array([(track, LAP_STATUS_CODES[status], lap_time, stuck_events)], dtype=TELEMETRY_LAP_DTYPE)
+        self._send(TELEMETRY_LAP, sim_time, records)
+    
+    def close(self):
+        self.sock.close()
+
+
+def decode_telemetry(data):
+    """Decodifica un datagrama de telemetría; retorna (cabecera, registros) sin copiar los datos"""
+    header = np.frombuffer(data, dtype=TELEMETRY_HEADER_DTYPE, count=1)[0]
+    dtype = TELEMETRY_POSE_DTYPE if header["kind"] == TELEMETRY_POSE else TELEMETRY_LAP_DTYPE
+    records = np.frombuffer(data, dtype=dtype, count=int(header["count"]), offset=TELEMETRY_HEADER_DTYPE.itemsize)
+    return header, records
+
+
+class TrajectoryRecorder:
+    """Graba el estado del carro en cada paso en un arreglo NumPy preasignado.
+    Las posiciones se guardan relativas al origen de la pista, así una vuelta grabada
+    con CarLineFollower se puede reproducir en MultiCarWorld y viceversa."""
+    
+    def __init__(self, track_type, max_time, origin=(0, 0)):
+        self.track_type = track_type
+        self.origin = (origin[0], origin[1], 0)
+        self.samples = np.empty(int(max_time / PHYSICS_TIMESTEP) + 1, dtype=TRAJECTORY_DTYPE)
+        self.count = 0
+    
+    def append(self, t, pos, orn, vel, forward_force, steering_force, target):
+        """Agrega una muestra (se ignora si el arreglo ya está lleno)"""
+        if self.count < len(self.samples):
+            rel_pos = (pos[0] - self.origin[0], pos[1] - self.origin[1], pos[2])
+            self.samples[self.count] = (t, rel_pos, orn, vel[:2], forward_force, steering_force, target)
+            self.count += 1
+    
+    def save(self, status, directory=RECORDINGS_DIR):
+        """Guarda la vuelta en su propio .npz comprimido y retorna la ruta. Se conservan
+        las RECORDINGS_KEEP vueltas más recientes de la pista."""
+        os.makedirs(directory, exist_ok=True)
+        path = recording_path(self.track_type, directory)
+        # Escritura atómica: la reproducción nunca lee un archivo a medio escribir
+        tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp.npz")
+        np.savez_compressed(tmp_path, samples=self.samples[:self.count], track=self.track_type, status=status)
+        os.replace(tmp_path, path)
+        for old_path in recording_paths(self.track_type, directory)[:-RECORDINGS_KEEP]:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+        return path
+
+
+class LapStore:
+    """Guarda los resultados de las vueltas en SQLite por lotes: se acumulan en memoria y se
+    escriben con un solo executemany cada `batch_size` vueltas o cada `flush_interval` segundos"""
+    
+    def __init__(self, path=LAP_STORE_FILE, batch_size=LAP_STORE_BATCH, flush_interval=LAP_STORE_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.last_flush = time.time()
+        with contextlib.closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS laps ("
+                "finished_at TEXT, track INTEGER, status TEXT, lap_time REAL, stuck_events INTEGER, client TEXT)"
+            )
+    
+    def add(self, record, client=None):
+        """Agrega una vuelta; escribe el lote si ya se llenó"""
+        self.pending.append((record["finished_at"], record["track"], record["status"], record["lap_time"],
+                             record["stuck_events"], client))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+    
+    def flush_if_due(self):
+        """Escribe las vueltas pendientes si ya pasó el intervalo máximo de espera"""
+        if self.pending and time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+    
+    def flush(self):
+        """Escribe todas las vueltas pendientes en una sola transacción"""
+        self.last_flush = time.time()
+        if not self.pending:
+            return
+        with contextlib.closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.executemany("INSERT INTO laps VALUES (?, ?, ?, ?, ?, ?)", self.pending)
+        self.pending = []
+
+
+def recording_path(track_type, directory=RECORDINGS_DIR):
+    """Ruta nueva para una vuelta de la pista: pista_N_<fecha y hora>.npz, así cada vuelta
+    queda en su propio archivo y el orden por nombre es el orden cronológico"""
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(directory, f"pista_{track_type}_{stamp}.npz")
+
+
+def recording_paths(track_type, directory=RECORDINGS_DIR):
+    """Vueltas grabadas de una pista, de la más antigua a la más reciente. El archivo único
+    de versiones anteriores (pista_N.npz) cuenta como la más antigua."""
+    paths = sorted(glob.glob(os.path.join(directory, f"pista_{track_type}_*.npz")))
+    legacy_path = os.path.join(directory, f"pista_{track_type}.npz")
+    return ([legacy_path] if os.path.exists(legacy_path) else []) + paths
+
+
+def load_recording(track_type, directory=RECORDINGS_DIR):
+    """Carga la vuelta completada más reciente de una pista; None si no hay ninguna"""
+    for path in reversed(recording_paths(track_type, directory)):
+        with np.load(path) as data:
+            if str(data["status"]) == "completed":
+                return data["samples"]
+    return None
+
+
+def iter_recording(samples, realtime=False):
+    """Recorre una vuelta grabada muestra por muestra (opcionalmente al ritmo real),
+    para consumidores que no necesitan la física"""
+    start = time.perf_counter()
+    for sample in samples:
+        if realtime:
+            delay = sample["t"] - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        yield sample
+
 
 class CarLineFollower:
-    def __init__(self, track_type=1):
+    def __init__(self, track_type=1, origin=(0, 0), gui=True, control_params=None, seed=None, record=False,
+                 telemetry=None, shared_state=None):
         self.physics_client = None
+        self.record = record
+        # TelemetryPublisher opcional para publicar la pose en vivo
+        self.telemetry = telemetry
+        # PoseRingBuffer opcional: estado de cada paso en memoria compartida
+        self.shared_state = shared_state
+        self.recorder = None
+        self.last_state = None
+        self.owns_client = False
+        self.gui = gui
+        # Semilla para perturbar la pose inicial en corridas repetidas (None = sin perturbación)
+        self.seed = seed
         self.car_id = None
         self.plane_id = None
         self.track_points = []
+        self.path = np.zeros((0, 2))
+        self.path_s = np.zeros(0)
+        self.waypoint_indices = np.zeros(0, dtype=int)
         self.current_target = 0
+        self.current_waypoint = 0
+        # Valores por defecto, luego el perfil optimizado de la pista y por último los explícitos
+        self.control_params = dict(CONTROL_PARAMS_DEFAULT)
+        self.control_params.update(load_control_profile(track_type))
+        if control_params:
+            self.control_params.update(control_params)
         self.coins = 0
         self.track_type = track_type
-        # Rojo para óvalo, Verde para serpiente, Amarillo para figura 8
-        self.car_color = [1, 0, 0, 1] if track_type == 1 else [0, 1, 0, 1] if track_type == 2 else [1, 1, 0, 1]
+        self.origin = origin
         self.setup_track()
         
+        # Estado de la vuelta en curso (se reinicia en run_simulation)
+        self.sim_time = 0.0
+        self.stuck_detector = StuckDetector(1)
+        self.stuck_events = 0
+        self.quit_requested = False
+        
     def setup_track(self, track_type=None):
-        """Define los puntos de la pista según el tipo seleccionado"""
+        """Carga la definición de la pista (pistas/*.json) y su geometría compilada"""
         if track_type is None:
             track_type = self.track_type
-            
-        if track_type == 1:
-            # Pista tipo óvalo con curvas suaves (50 monedas)
-            self.track_points = [
-                [0, 0],      # Inicio
-                [3, 0],      # Recta inicial más larga
-                [6, 0],
-                [9, 1],      # Primera curva suave (derecha)
-                [11, 3],
-                [12, 6],
-                [11, 9],     # Continuación curva
-                [9, 11],     # Segunda curva (izquierda)
-                [6, 12],
-                [3, 11],
-                [0, 9],      # Curva de regreso más amplia
-                [-1, 6],
-                [-1, 3],
-                [0, 0]       # Regreso al inicio
-            ]
-        elif track_type == 2:
-            self.track_points = [
-                [0, 0],
-                [2, 0],
-                [4, 0.5],
-                [6, 1.5],
-                [8, 2.5],
-                [10, 3],
-                [12, 3],
-                [14, 2.5],
-                [16, 1.5],
-                [18, 0.5],
-                [20, 0],
-                [22, -0.3],
-                [24, 0.5],
-                [26, 1.5],
-                [28, 2.5]
-            ]
-        elif track_type == 3:
-            # Pista en forma de 8 (1000 monedas)
-            self.track_points = [
-                [0, 0],
-                [2, -1],
-                [4, 0],
-                [5, 2],
-                [5, 4],
-                [4, 6],
-                [2, 7],
-                [-1, 6]
-            ]
-    
-    def init_simulation(self):
-        """Inicializa la simulación de PyBullet"""
-        # Conectar a PyBullet
-        self.physics_client = p.connect(p.GUI)
-        p.setAdditionalSearchPath(pybullet_data.getDataPath())
+        if track_type not in TRACK_DEFINITIONS:
+            raise ValueError(f"Pista desconocida: {track_type}")
+        self.track = TRACK_DEFINITIONS[track_type]
+        self.car_color = self.track["car_color"]
+        
+        # Desplazar la pista si no está en el origen del mundo
+        offset = np.asarray(self.origin, dtype=float)
+        self.track_points = (np.asarray(self.track["waypoints"], dtype=float) + offset).tolist()
+        
+        # Trayectoria densa, curvatura, límites de velocidad y marcadores (de la caché si existe)
+        geometry = load_track_geometry(self.track)
+        self.path = geometry["points"] + offset
+        self.path_s = geometry["s"]
+        self.waypoint_indices = geometry["waypoint_indices"]
+        self.curvature = geometry["curvature"]
+        self.speed_limits = geometry["speed_limits"]
+        self.marker_points = geometry["markers"] + offset
+        self.current_target = 0
+        self.current_waypoint = 0
+    
+    def init_simulation(self, physics_client=None):
+        """Inicializa la simulación de PyBullet. Si se pasa physics_client se reutiliza
+        esa conexión (limpiando su contenido) en lugar de abrir una nueva."""
+        if physics_client is None:
+            # Conectar a PyBullet
+            self.physics_client = p.connect(p.GUI if self.gui else p.DIRECT)
+            self.owns_client = True
+        else:
+            self.physics_client = physics_client
+            self.owns_client = False
+            p.resetSimulation(physicsClientId=self.physics_client)
+        p.setAdditionalSearchPath(pybullet_data.getDataPath(), physicsClientId=self.physics_client)
         
         # Configurar gravedad
-        p.setGravity(0, 0, -9.81)
+        p.setGravity(0, 0, -9.81, physicsClientId=self.physics_client)
+        
+        # Pausar el render mientras se construye la escena
+        p.configureDebugVisualizer(p.COV_ENABLE_RENDERING, 0, physicsClientId=self.physics_client)
         
         # Crear plano
-        self.plane_id = p.loadURDF("plane.urdf")
+        self.plane_id = p.loadURDF("plane.urdf", physicsClientId=self.physics_client)
         
         # Crear marcadores visuales para la pista
         self.create_track_markers()
         
-        # Cargar el carro (usando el carro simple de PyBullet)
-        car_start_pos = [0, 0, 0.5]
+        # Cargar el carro
+        self.spawn_car()
+        
+        p.configureDebugVisualizer(p.COV_ENABLE_RENDERING, 1, physicsClientId=self.physics_client)
+        
+        if not self.gui:
+            return
+        
+        # Configurar la cámara según la definición de la pista
+        camera_target = self.track["camera"]["target"]
+        p.resetDebugVisualizerCamera(
+            cameraDistance=self.track["camera"]["distance"],
+            cameraYaw=20,
+            cameraPitch=-20,
+            cameraTargetPosition=[camera_target[0] + self.origin[0], camera_target[1] + self.origin[1], 0],
+            physicsClientId=self.physics_client
+        )
+        
+    def spawn_car(self):
+        """Crea el carro al inicio de la pista y reinicia el avance del controlador"""
+        car_start_pos = [self.path[0][0], self.path[0][1], 0.5]
         car_start_orientation = p.getQuaternionFromEuler([0, 0, 0])
         
+        if self.seed is not None:
+            # Pequeña perturbación reproducible de la pose inicial
+            rng = np.random.default_rng(self.seed)
+            dx, dy = rng.uniform(-0.2, 0.2, size=2)
+            car_start_pos = [car_start_pos[0] + dx, car_start_pos[1] + dy, 0.5]
+            car_start_orientation = p.getQuaternionFromEuler([0, 0, rng.uniform(-0.1, 0.1)])
+        
         try:
             # Intentar cargar un carro personalizado o usar el por defecto
-            self.car_id = p.loadURDF("racecar/racecar.urdf", car_start_pos, car_start_orientation)
+            self.car_id = p.loadURDF("racecar/racecar.urdf", car_start_pos, car_start_orientation,
+                                     physicsClientId=self.physics_client)
         except:
             # Si no existe, crear un carro simple con formas básicas
             self.car_id = self.create_simple_car(car_start_pos, car_start_orientation)
         
-        # Configurar la cámara según el tipo de pista
-        if self.track_type == 1:
-            camera_target = [6, 6, 0]
-            camera_distance = 2
-        elif self.track_type == 2:
-            camera_target = [3, 1, 0]
-            camera_distance = 2
-        else:  # track_type == 3
-            camera_target = [0, 0, 0]
-            camera_distance = 2
-            
-        p.resetDebugVisualizerCamera(
-            cameraDistance=camera_distance,
-            cameraYaw=20,
-            cameraPitch=-20,
-            cameraTargetPosition=camera_target
-        )
+        # Agregar fricción para evitar deslizamiento
+        p.changeDynamics(self.car_id, -1, lateralFriction=0.8, spinningFriction=0.3,
+                         physicsClientId=self.physics_client)
+        
+        self.current_target = 0
+        self.current_waypoint = 0
+        return self.car_id
         
     def create_simple_car(self, position, orientation):
         """Crea un carro simple con el color correspondiente al tipo de pista"""
         # Crear el chasis con color específico
-        chassis_shape = p.createCollisionShape(p.GEOM_BOX, halfExtents=[1, 0.5, 0.2])
-        chassis_visual = p.createVisualShape(p.GEOM_BOX, halfExtents=[1, 0.5, 0.2], rgbaColor=self.car_color)
+        chassis_shape = p.createCollisionShape(p.GEOM_BOX, halfExtents=[1, 0.5, 0.2],
+                                               physicsClientId=self.physics_client)
+        chassis_visual = p.createVisualShape(p.GEOM_BOX, halfExtents=[1, 0.5, 0.2], rgbaColor=self.car_color,
+                                             physicsClientId=self.physics_client)
         
         car_id = p.createMultiBody(
             baseMass=1000,
             baseCollisionShapeIndex=chassis_shape,
             baseVisualShapeIndex=chassis_visual,
             basePosition=position,
-            baseOrientation=orientation
+            baseOrientation=orientation,
+            physicsClientId=self.physics_client
         )
         
         # Crear ruedas (visual) con color negro
@@ -140,87 +652,65 @@ class CarLineFollower:
             [-0.7, -0.7, -0.2]  # Rueda trasera izquierda
         ]
         
-        for wheel_pos in wheel_positions:
-            wheel_shape = p.createCollisionShape(p.GEOM_CYLINDER, radius=0.3, height=0.1)
-            wheel_visual = p.createVisualShape(p.GEOM_CYLINDER, radius=0.3, length=0.1, rgbaColor=[0.2, 0.2, 0.2, 1])
-            p.createMultiBody(
-                baseMass=10,
-                baseCollisionShapeIndex=wheel_shape,
-                baseVisualShapeIndex=wheel_visual,
-                basePosition=[position[0] + wheel_pos[0], position[1] + wheel_pos[1], position[2] + wheel_pos[2]]
-            )
+        # Las cuatro ruedas comparten las mismas formas y se crean en una sola llamada
+        wheel_shape = p.createCollisionShape(p.GEOM_CYLINDER, radius=0.3, height=0.1,
+                                             physicsClientId=self.physics_client)
+        wheel_visual = p.createVisualShape(p.GEOM_CYLINDER, radius=0.3, length=0.1, rgbaColor=[0.2, 0.2, 0.2, 1],
+                                           physicsClientId=self.physics_client)
+        p.createMultiBody(
+            baseMass=10,
+            baseCollisionShapeIndex=wheel_shape,
+            baseVisualShapeIndex=wheel_visual,
+            batchPositions=[[position[0] + wheel_pos[0], position[1] + wheel_pos[1], position[2] + wheel_pos[2]]
+                            for wheel_pos in wheel_positions],
+                            physicsClientId=self.physics_client
+        )
         
         return car_id
     
     def create_track_markers(self):
-        """Crea marcadores visuales para la pista con colores según el tipo"""
-        if self.track_type == 1:
-            marker_color = [0, 1, 0, 1]  # Verde para óvalo
-        elif self.track_type == 2:
-            marker_color = [1, 1, 0, 1]  # Amarillo para serpiente
-        else:
-            marker_color = [1, 0, 1, 1]  # Magenta para figura 8
-            
-        for i, point in enumerate(self.track_points):
-            # Crear esferas pequeñas para marcar la pista
-            marker_visual = p.createVisualShape(p.GEOM_SPHERE, radius=0.15, rgbaColor=marker_color)
-            p.createMultiBody(
-                baseMass=0,
-                baseCollisionShapeIndex=-1,
-                baseVisualShapeIndex=marker_visual,
-                basePosition=[point[0], point[1], 0.1]
-            )
+        """Crea marcadores visuales para la pista con el color de su definición"""
+        # Marcadores precalculados en la geometría de la pista, todos con la misma
+        # forma visual y creados en una sola llamada por lotes
+        marker_visual = p.createVisualShape(p.GEOM_SPHERE, radius=0.15, rgbaColor=self.track["marker_color"],
+                                            physicsClientId=self.physics_client)
+        p.createMultiBody(
+            baseMass=0,
+            baseCollisionShapeIndex=-1,
+            baseVisualShapeIndex=marker_visual,
+            batchPositions=[[point[0], point[1], 0.1] for point in self.marker_points],
+            physicsClientId=self.physics_client
+        )
     
     def get_car_position(self):
         """Obtiene la posición actual del carro"""
         if self.car_id is not None:
-            pos, _ = p.getBasePositionAndOrientation(self.car_id)
+            pos, _ = p.getBasePositionAndOrientation(self.car_id, physicsClientId=self.physics_client)
             return pos[:2]  # Solo x, y
         return [0, 0]
     
     def calculate_steering(self):
-        """Calcula la dirección hacia el siguiente punto de la pista con mejor manejo"""
-        if len(self.track_points) == 0:
+        """Calcula la dirección con pure pursuit sobre la trayectoria densa de la pista"""
+        if len(self.path) == 0:
             return 0, 0
         
-        car_pos = self.get_car_position()
-        target_point = self.track_points[self.current_target]
-        
-        # Calcular distancia al objetivo actual
-        distance = math.sqrt((target_point[0] - car_pos[0])**2 + (target_point[1] - car_pos[1])**2)
-        
-        # Si está cerca del objetivo, pasar al siguiente (distancia más amplia)
-        if distance < 1.5:  # Aumentado de 0.5 a 1.5
-            if self.current_target < len(self.track_points) - 1:
-                self.current_target += 1
-                target_point = self.track_points[self.current_target]
-                print(f"🎯 Avanzando al punto {self.current_target}: {target_point}")
-        
-        # Calcular ángulo hacia el objetivo
-        angle_to_target = math.atan2(target_point[1] - car_pos[1], target_point[0] - car_pos[0])
-        
-        # Obtener orientación actual del carro
-        _, orientation = p.getBasePositionAndOrientation(self.car_id)
-        euler = p.getEulerFromQuaternion(orientation)
-        car_angle = euler[2]
-        
-        # Calcular error de ángulo
-        angle_error = angle_to_target - car_angle
+        car_pos, orientation = p.getBasePositionAndOrientation(self.car_id, physicsClientId=self.physics_client)
+        car_angle = p.getEulerFromQuaternion(orientation)[2]
         
-        # Normalizar el error de ángulo
-        while angle_error > math.pi:
-            angle_error -= 2 * math.pi
-        while angle_error < -math.pi:
-            angle_error += 2 * math.pi
-        
-        # Calcular fuerzas de movimiento (más suaves)
-        forward_force = max(20, 60 * (1 - abs(angle_error) / math.pi))  # Fuerza mínima de 20
-        steering_force = angle_error * 20  # Reducido de 30 a 20
+        # Mismo controlador vectorizado que usa MultiCarWorld, con un solo carro
+        targets, forward_force, steering_force = pure_pursuit_batch(
+            np.array([car_pos[:2]]), np.array([car_angle]), np.array([self.current_target]),
+            self.path[None], np.array([len(self.path)]), self.control_params
+        )
+        self.current_target = int(targets[0])
         
-        # Limitar el steering para evitar giros bruscos
-        steering_force = max(-40, min(40, steering_force))
+        # Reportar cuando se pasa por uno de los waypoints originales
+        while (self.current_waypoint < len(self.waypoint_indices) - 1 and
+               self.current_target >= self.waypoint_indices[self.current_waypoint + 1]):
+            self.current_waypoint += 1
+            print(f"🎯 Avanzando al punto {self.current_waypoint}: {self.track_points[self.current_waypoint]}")
         
-        return forward_force, steering_force
+        return float(forward_force[0]), float(steering_force[0])
     
     def move_car(self):
         """Mueve el carro basado en el seguimiento de línea con mejor control"""
@@ -230,15 +720,15 @@ class CarLineFollower:
         forward_force, steering_force = self.calculate_steering()
         
         # Obtener velocidad actual para evitar acelerar demasiado
-        linear_vel, angular_vel = p.getBaseVelocity(self.car_id)
+        linear_vel, angular_vel = p.getBaseVelocity(self.car_id, physicsClientId=self.physics_client)
         current_speed = math.sqrt(linear_vel[0]**2 + linear_vel[1]**2)
         
-        # Limitar la velocidad máxima
-        if current_speed > 8.0:  # Velocidad máxima
+        # Limitar la velocidad máxima (y la de la curva en la que está el carro)
+        if current_speed > min(self.control_params["max_speed"], self.speed_limits[self.current_target]):
             forward_force *= 0.5
         
         # Aplicar fuerzas al carro de manera más controlada
-        car_pos, car_orientation = p.getBasePositionAndOrientation(self.car_id)
+        car_pos, car_orientation = p.getBasePositionAndOrientation(self.car_id, physicsClientId=self.physics_client)
         
         # Convertir fuerza local a mundial
         euler = p.getEulerFromQuaternion(car_orientation)
@@ -251,53 +741,116 @@ class CarLineFollower:
             self.car_id, -1,
             [force_x, force_y, 0],
             car_pos,
-            p.WORLD_FRAME
+            p.WORLD_FRAME,
+            physicsClientId=self.physics_client
         )
         
         # Aplicar torque para girar (más suave)
         p.applyExternalTorque(
             self.car_id, -1,
             [0, 0, steering_force],
-            p.WORLD_FRAME
+            p.WORLD_FRAME,
+            physicsClientId=self.physics_client
         )
         
-        # Agregar fricción para evitar deslizamiento
-        p.changeDynamics(self.car_id, -1, lateralFriction=0.8, spinningFriction=0.3)
+        # Estado de este paso (para la grabación de la vuelta)
+        self.last_state = (car_pos, car_orientation, linear_vel, forward_force, steering_force)
         
         # Verificar si completó el recorrido
         return self.has_completed_lap()
     
     def has_completed_lap(self):
-        """Verifica si el carro ha completado una vuelta completa mejorado"""
-        car_pos = self.get_car_position()
-        start_pos = self.track_points[0]
-        distance_to_start = math.sqrt((start_pos[0] - car_pos[0])**2 + (start_pos[1] - car_pos[1])**2)
+        """Verifica si el carro llegó al final de la trayectoria (o volvió al inicio en pistas cerradas)"""
+        if len(self.path) == 0:
+            return False
         
-        # Debe haber pasado por la mayoría de puntos y estar cerca del inicio
-        points_passed = self.current_target >= len(self.track_points) - 2
-        near_start = distance_to_start < 2.0
+        # Distancia que falta recorrer sobre la pista
+        remaining = self.path_s[-1] - self.path_s[self.current_target]
         
-        if points_passed and near_start:
-            print(f"🏁 Vuelta completada! Puntos visitados: {self.current_target}/{len(self.track_points)}")
+        if remaining < 2.0:
+            print(f"🏁 Vuelta completada! Puntos visitados: {self.current_waypoint + 1}/{len(self.track_points)}")
             return True
         
         return False
     
-    def run_simulation(self):
-        """Ejecuta la simulación del carro con mejor seguimiento"""
-        track_names = {
-            1: "Circular",
-            2: "en S",
-            3: "Media Luna"
-        }
-        car_names = {
-            1: "Carro 1",
-            2: "Carro 2",
-            3: "Carro 3"
-        }
+    def step(self):
+        """Un paso de física: control, detección de atasco y avance de PyBullet.
+        Retorna True si el carro completó la vuelta (en ese caso no avanza la física)."""
+        # Mover el carro
+        if self.move_car():
+            return True
         
-        track_name = track_names.get(self.track_type, "Pista Desconocida")
-        car_name = car_names.get(self.track_type, "Carro Desconocido")
+        # Verificar si el carro está atascado (ventana de sus últimas muestras)
+        car_pos, car_orientation, linear_vel = self.last_state[:3]
+        track_point = self.path[self.current_target]
+        reason = self.stuck_detector.update(
+            0, car_pos[:2], self.path_s[self.current_target],
+            math.hypot(car_pos[0] - track_point[0], car_pos[1] - track_point[1])
+        )
+        if reason:
+            print(f"🔧 El carro {STUCK_MESSAGES[reason]}...")
+            speed = min(math.hypot(linear_vel[0], linear_vel[1]), self.control_params["max_speed"],
+                        self.speed_limits[self.current_target])
+            recover_car(self.car_id, reason, p.getEulerFromQuaternion(car_orientation)[2], speed,
+                        self.path, self.current_target, self.physics_client)
+            self.stuck_detector.reset(0)
+            self.stuck_events += 1
+        
+        if self.recorder is not None:
+            self.recorder.append(self.sim_time, *self.last_state, self.current_target)
+        if self.shared_state is not None:
+            self.shared_state.write(self.sim_time, [self.track_type], [self.current_target], self.current_pose(),
+                                    self.last_state[3], self.last_state[4])
+        
+        # Avanzar la simulación
+        p.stepSimulation(physicsClientId=self.physics_client)
+        self.sim_time += PHYSICS_TIMESTEP
+        return False
+    
+    def update_camera(self):
+        """Actualiza la cámara para seguir al carro"""
+        car_pos = self.get_car_position()
+        p.resetDebugVisualizerCamera(
+            cameraDistance=3,
+            cameraYaw=20,
+            cameraPitch=-20,
+            cameraTargetPosition=[car_pos[0], car_pos[1], 0],
+            physicsClientId=self.physics_client
+        )
+    
+    def poll_keyboard(self):
+        """Revisa si el usuario presionó 'q' en la ventana de simulación"""
+        if ord('q') in p.getKeyboardEvents(physicsClientId=self.physics_client):
+            self.quit_requested = True
+    
+    def current_pose(self):
+        """Pose del último paso como arreglo (1, 4): x, y relativas al origen, yaw y velocidad"""
+        car_pos, car_orientation, linear_vel = self.last_state[:3]
+        return np.array([[
+            car_pos[0] - self.origin[0],
+            car_pos[1] - self.origin[1],
+            p.getEulerFromQuaternion(car_orientation)[2],
+            math.hypot(linear_vel[0], linear_vel[1])
+        ]])
+    
+    def publish_telemetry(self):
+        """Publica la pose del último paso por el canal de telemetría"""
+        if self.last_state is not None:
+            self.telemetry.publish_poses(self.sim_time, [self.track_type], [self.current_target],
+                                         self.current_pose())
+    
+    def log_progress(self):
+        """Muestra el avance del carro sobre la pista"""
+        progress = 100 * self.path_s[self.current_target] / self.path_s[-1]
+        print(f"📍 Avance: {progress:.0f}% de la pista")
+    
+    def run_simulation(self, rates=None):
+        """Ejecuta la simulación del carro con un planificador de paso fijo. Con GUI la física
+        corre en tiempo real y cámara/teclado/logs a las frecuencias de SCHEDULER_RATES
+        (o de rates); sin GUI corre tan rápido como se pueda. El tiempo límite se mide en
+        tiempo simulado. Retorna un diccionario con el resultado de la vuelta."""
+        track_name = TRACK_NAMES.get(self.track_type, "Pista Desconocida")
+        car_name = CAR_NAMES.get(self.track_type, "Carro Desconocido")
         
         print(f"🏁 Iniciando simulación: {track_name}")
         print(f"🚗 {car_name} en pista")
@@ -306,107 +859,581 @@ class CarLineFollower:
         
         start_time = time.time()
         # Más tiempo para pistas más complejas
-        max_simulation_time = {
-            1: 180,   # Óvalo
-            2: 220,   # Serpiente
-            3: 180    # Figura 8
-        }.get(self.track_type, 180)
+        max_simulation_time = TRACK_TIME_LIMITS.get(self.track_type, 180)
         
-        last_position = [0, 0]
-        stuck_counter = 0
+        self.stuck_detector.reset(0)
+        self.stuck_events = 0
+        self.quit_requested = False
+        self.sim_time = 0.0
+        self.recorder = TrajectoryRecorder(self.track_type, max_simulation_time, self.origin) if self.record else None
         
+        scheduler = FixedStepScheduler(realtime=self.gui)
+        if self.gui:
+            rates = dict(SCHEDULER_RATES, **(rates or {}))
+            scheduler.add_task(rates["camera"], self.update_camera)
+            scheduler.add_task(rates["keyboard"], self.poll_keyboard)
+            scheduler.add_task(rates["log"], self.log_progress)
+        if self.telemetry is not None:
+            scheduler.add_task(self.telemetry.rate_hz, self.publish_telemetry)
+        
+        steps = 0
+        status = None
+        while status is None:
+            for _ in range(scheduler.due_steps()):
+                # Verificar tiempo límite
+                if scheduler.sim_time > max_simulation_time:
+                    print("⏰ Tiempo límite alcanzado")
+                    status = "timeout"
+                    break
+                
+                if self.step():
+                    print(f"🏆 ¡El {car_name} ha completado el recorrido {track_name}!")
+                    status = "completed"
+                    break
+                scheduler.advance()
+                steps += 1
+            
+            if status is None:
+                scheduler.run_tasks()
+                if self.quit_requested:
+                    print("🛑 Simulación terminada por el usuario")
+                    status = "interrupted"
+                scheduler.wait()
+        
+        print("✅ Recorrido completado.")
+        if self.telemetry is not None:
+            self.telemetry.publish_lap(self.sim_time, self.track_type, status, steps * PHYSICS_TIMESTEP,
+                                       self.stuck_events)
+        if self.recorder is not None:
+            print(f"💾 Vuelta grabada en {self.recorder.save(status)}")
+        return {
+            "track": self.track_type,
+            "status": status,
+            "completed": status == "completed",
+            "lap_time": steps * PHYSICS_TIMESTEP,
+            "steps": steps,
+            "stuck_events": self.stuck_events,
+            "wall_time": time.time() - start_time
+        }
+    
+    def replay_simulation(self, samples, frame_rate=60):
+        """Reproduce una vuelta grabada moviendo el carro directamente, sin avanzar la física.
+        Requiere init_simulation (escena y carro ya creados)."""
+        print(f"🎬 Reproduciendo vuelta grabada de la pista {TRACK_NAMES.get(self.track_type, '')}")
+        times = samples["t"]
+        start = time.perf_counter()
         while True:
-            # Verificar tiempo límite
-            if time.time() - start_time > max_simulation_time:
-                print("⏰ Tiempo límite alcanzado")
+            i = int(np.searchsorted(times, time.perf_counter() - start))
+            if i >= len(samples):
                 break
+            pos = samples["pos"][i]
+            p.resetBasePositionAndOrientation(
+                self.car_id,
+                [pos[0] + self.origin[0], pos[1] + self.origin[1], pos[2]],
+                samples["orn"][i].tolist(),
+                physicsClientId=self.physics_client
+            )
+            if self.gui:
+                self.update_camera()
+                if ord('q') in p.getKeyboardEvents(physicsClientId=self.physics_client):
+                    print("🛑 Reproducción terminada por el usuario")
+                    break
+            time.sleep(1. / frame_rate)
+        print("✅ Reproducción completada.")
+    
+    def cleanup(self):
+        """Limpia la simulación (solo cierra la conexión si la abrió este objeto)"""
+        if self.physics_client is not None:
+            if self.owns_client:
+                p.disconnect(self.physics_client)
+            self.physics_client = None
+
+
+class MultiCarWorld:
+    """Mundo con un carro por pista (1, 2 y 3) corriendo al mismo tiempo en un solo
+    cliente de PyBullet. El estado de control de todos los carros se guarda como
+    arreglos (una fila por carro) y se calcula en una sola pasada vectorizada."""
+    
+    def __init__(self, gui=True, record=True, replay=False, lap_history=None, telemetry=None,
+                 shared_state=None, on_lap_finished=None):
+        self.gui = gui
+        # Función llamada (desde el hilo de simulación) con el resultado de cada vuelta y
+        # quien la pidió; no debe bloquear
+        self.on_lap_finished = on_lap_finished
+        # TelemetryPublisher opcional para publicar la pose de los carros en vivo
+        self.telemetry = telemetry
+        # PoseRingBuffer opcional: estado de cada carro en cada paso en memoria compartida
+        self.shared_state = shared_state
+        # record: grabar cada vuelta; replay: si la pista ya tiene una vuelta grabada,
+        # reproducirla en lugar de simularla
+        self.record = record
+        self.replay = replay
+        self.physics_client = None
+        self.plane_id = None
+        self.running = False
+        self.commands = queue.Queue()
+        self.camera_car = 0
+        self.quit_requested = False
+        self.sim_time = 0.0
+        
+        # Un CarLineFollower por pista: aporta la geometría, los colores y la creación del carro
+        self.cars = [CarLineFollower(track_type=t, origin=WORLD_TRACK_ORIGINS[t]) for t in TRACK_TYPES]
+        n = len(self.cars)
+        
+        # Trayectorias rellenadas con su último punto para poder indexarlas juntas
+        self.path_lengths = np.array([len(car.path) for car in self.cars])
+        max_len = self.path_lengths.max()
+        self.paths = np.zeros((n, max_len, 2))
+        self.path_s = np.zeros((n, max_len))
+        for i, car in enumerate(self.cars):
+            self.paths[i, :len(car.path)] = car.path
+            self.paths[i, len(car.path):] = car.path[-1]
+            self.path_s[i, :len(car.path)] = car.path_s
+            self.path_s[i, len(car.path):] = car.path_s[-1]
+        self.speed_limits = np.zeros((n, max_len))
+        for i, car in enumerate(self.cars):
+            self.speed_limits[i, :len(car.path)] = car.speed_limits
+            self.speed_limits[i, len(car.path):] = car.speed_limits[-1]
+        
+        # Estado por carro (struct-of-arrays)
+        self.track_types = np.asarray(TRACK_TYPES)
+        self.car_ids = np.full(n, -1)
+        self.active = np.zeros(n, dtype=bool)
+        self.markers_built = np.zeros(n, dtype=bool)
+        self.targets = np.zeros(n, dtype=int)
+        self.start_times = np.zeros(n)
+        self.time_limits = np.array([TRACK_TIME_LIMITS.get(t, 180) for t in TRACK_TYPES], dtype=float)
+        self.stuck_detector = StuckDetector(n)
+        self.replaying = np.zeros(n, dtype=bool)
+        # Latencia entre la llegada del comando y la primera fuerza aplicada (s)
+        self.trigger_times = np.full(n, np.nan)
+        self.trigger_latencies = np.full(n, np.nan)
+        self.stuck_events = np.zeros(n, dtype=int)
+        # Última pose de cada carro relativa al origen de su pista: x, y, yaw, velocidad
+        self.origins = np.array([car.origin for car in self.cars], dtype=float)
+        self.poses = np.zeros((n, 4))
+        self.recorders = [None] * n
+        self.requesters = [None] * n  # Quién pidió la vuelta en curso de cada carro
+        self.replay_samples = [None] * n
+        self.params = {key: np.array([car.control_params[key] for car in self.cars], dtype=float)
+                       for key in CONTROL_PARAMS_DEFAULT}
+        
+        # Métricas: solo el hilo de simulación las escribe y los demás hilos solo las leen,
+        # así que consultarlas no necesita candados ni detiene el bucle de física
+        self.physics_steps = 0
+        self.step_time = 0.0
+        self.steps_per_sec = 0.0
+        self.avg_step_cost = 0.0
+        self._rate_mark = (time.perf_counter(), 0, 0.0)
+        # Historial de vueltas (deque: append atómico); el servidor puede compartir el suyo
+        self.lap_history = lap_history if lap_history is not None else deque(maxlen=LAP_HISTORY_SIZE)
+    
+    def request_start(self, track_type, received_at=None, requester=None):
+        """Pide (desde cualquier hilo) iniciar o reiniciar el carro de una pista.
+        received_at (time.perf_counter) permite medir la latencia hasta el primer movimiento;
+        requester se entrega a on_lap_finished junto con el resultado de la vuelta."""
+        self.commands.put(("start", track_type, received_at, requester))
+    
+    def request_stop(self):
+        """Pide detener todos los carros y cerrar el mundo"""
+        self.commands.put(("stop", None, None, None))
+    
+    def active_tracks(self):
+        """Retorna las pistas que tienen un carro en recorrido"""
+        return [t for t, is_active in zip(TRACK_TYPES, self.active) if is_active]
+    
+    def connect(self):
+        """Conecta a PyBullet y crea el plano"""
+        self.physics_client = p.connect(p.GUI if self.gui else p.DIRECT)
+        p.setAdditionalSearchPath(pybullet_data.getDataPath(), physicsClientId=self.physics_client)
+        p.setGravity(0, 0, -9.81, physicsClientId=self.physics_client)
+        self.plane_id = p.loadURDF("plane.urdf", physicsClientId=self.physics_client)
+        # Los carros crean sus cuerpos y marcadores en el cliente del mundo
+        for car in self.cars:
+            car.physics_client = self.physics_client
+            car.owns_client = False
+    
+    def start_car(self, track_type, received_at=None, requester=None):
+        """Crea (o reinicia) el carro de una pista sin afectar a los demás"""
+        i = TRACK_TYPES.index(track_type)
+        car = self.cars[i]
+        if self.active[i]:
+            self.interrupt_car(i)
+        self.requesters[i] = requester
+        
+        p.configureDebugVisualizer(p.COV_ENABLE_RENDERING, 0, physicsClientId=self.physics_client)
+        if not self.markers_built[i]:
+            car.create_track_markers()
+            self.markers_built[i] = True
+        if self.car_ids[i] >= 0:
+            p.removeBody(int(self.car_ids[i]), physicsClientId=self.physics_client)
+        self.car_ids[i] = car.spawn_car()
+        p.configureDebugVisualizer(p.COV_ENABLE_RENDERING, 1, physicsClientId=self.physics_client)
+        
+        self.active[i] = True
+        self.targets[i] = 0
+        self.start_times[i] = self.sim_time
+        self.stuck_detector.reset(i)
+        self.stuck_events[i] = 0
+        self.camera_car = i
+        self.trigger_times[i] = received_at if received_at is not None else time.perf_counter()
+        
+        # Reproducir la vuelta grabada si existe; si no, simularla (y grabarla)
+        self.replay_samples[i] = load_recording(track_type) if self.replay else None
+        self.replaying[i] = self.replay_samples[i] is not None
+        self.recorders[i] = None
+        if self.replaying[i]:
+            print(f"🎬 {CAR_NAMES[track_type]} reproduciendo vuelta grabada de la pista {TRACK_NAMES[track_type]}")
+        else:
+            if self.record:
+                self.recorders[i] = TrajectoryRecorder(track_type, self.time_limits[i], car.origin)
+            print(f"🚗 {CAR_NAMES[track_type]} en pista {TRACK_NAMES[track_type]}")
+    
+    def finish_car(self, i, message, status="completed"):
+        """Marca un carro como terminado; su cuerpo queda en la escena"""
+        self.active[i] = False
+        print(f"{message} - {CAR_NAMES[TRACK_TYPES[i]]}")
+        lap_time = float(self.sim_time - self.start_times[i])
+        record = {
+            "track": TRACK_TYPES[i],
+            "status": status,
+            "lap_time": round(lap_time, 3),
+            "stuck_events": int(self.stuck_events[i]),
+            "finished_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        self.lap_history.append(record)
+        if self.telemetry is not None:
+            self.telemetry.publish_lap(self.sim_time, TRACK_TYPES[i], status, lap_time, self.stuck_events[i])
+        if self.on_lap_finished is not None:
+            self.on_lap_finished(record, self.requesters[i])
+        self.requesters[i] = None
+        if self.recorders[i] is not None:
+            # Una vuelta interrumpida está incompleta: no se guarda como grabación
+            if status != "interrupted":
+                self.recorders[i].save(status)
+            self.recorders[i] = None
+    
+    def interrupt_car(self, i):
+        """Termina la vuelta en curso sin guardar su grabación (reinicio o cierre del mundo)"""
+        self.finish_car(i, "🛑 Recorrido interrumpido", status="interrupted")
+    
+    def replay_step(self, i):
+        """Coloca un carro en reproducción en la pose grabada para el tiempo actual"""
+        samples = self.replay_samples[i]
+        k = int(np.searchsorted(samples["t"], self.sim_time - self.start_times[i]))
+        if k >= len(samples):
+            self.finish_car(i, "🏆 Reproducción completada", status="replayed")
+            return
+        pos = samples["pos"][k]
+        origin = self.cars[i].origin
+        p.resetBasePositionAndOrientation(
+            int(self.car_ids[i]),
+            [pos[0] + origin[0], pos[1] + origin[1], pos[2]],
+            samples["orn"][k].tolist(),
+            physicsClientId=self.physics_client
+        )
+        self.targets[i] = samples["target"][k]
+        vel = samples["vel"][k]
+        self.poses[i] = (pos[0], pos[1], p.getEulerFromQuaternion(samples["orn"][k].tolist())[2],
+                         math.hypot(vel[0], vel[1]))
+    
+    def process_commands(self, timeout=None):
+        """Atiende los comandos pendientes; retorna False si se pidió detener.
+        Con timeout espera hasta ese tiempo por el primer comando (mundo sin carros activos)."""
+        while True:
+            try:
+                command, track_type, received_at, requester = \
+                    self.commands.get(timeout=timeout) if timeout else self.commands.get_nowait()
+            except queue.Empty:
+                return True
+            timeout = None
+            if command == "stop":
+                return False
+            self.start_car(track_type, received_at, requester)
+    
+    def step(self):
+        """Calcula el control de todos los carros activos y avanza la física un paso.
+        Los carros en reproducción solo se reubican; si no hay carros simulados no se
+        avanza la física."""
+        start = time.perf_counter()
+        for i in np.flatnonzero(self.active & self.replaying):
+            self.replay_step(i)
+        
+        idx = np.flatnonzero(self.active & ~self.replaying)
+        if len(idx) > 0:
+            # Leer el estado de cada carro (PyBullet no tiene lectura por lotes)
+            positions = np.zeros((len(idx), 2))
+            headings = np.zeros(len(idx))
+            speeds = np.zeros(len(idx))
+            raw_states = []
+            for k, i in enumerate(idx):
+                pos, orientation = p.getBasePositionAndOrientation(int(self.car_ids[i]),
+                                                                   physicsClientId=self.physics_client)
+                linear_vel, _ = p.getBaseVelocity(int(self.car_ids[i]), physicsClientId=self.physics_client)
+                raw_states.append((pos, orientation, linear_vel))
+                positions[k] = pos[:2]
+                headings[k] = p.getEulerFromQuaternion(orientation)[2]
+                speeds[k] = math.hypot(linear_vel[0], linear_vel[1])
             
-            # Verificar si el carro está atascado
-            current_position = self.get_car_position()
-            distance_moved = math.sqrt((current_position[0] - last_position[0])**2 + 
-                                     (current_position[1] - last_position[1])**2)
+            params = {key: values[idx] for key, values in self.params.items()}
+            targets, forward_force, steering_force = pure_pursuit_batch(
+                positions, headings, self.targets[idx], self.paths[idx], self.path_lengths[idx], params
+            )
+            self.targets[idx] = targets
+            self.poses[idx] = np.column_stack((positions - self.origins[idx], headings, speeds))
             
-            if distance_moved < 0.1:  # Si no se ha movido mucho
-                stuck_counter += 1
-            else:
-                stuck_counter = 0
-                last_position = current_position
+            # Limitar la velocidad máxima (y la de la curva en la que está cada carro)
+            max_speed = np.minimum(params["max_speed"], self.speed_limits[idx, targets])
+            forward_force = np.where(speeds > max_speed, forward_force * 0.5, forward_force)
+            force_x = forward_force * np.cos(headings)
+            force_y = forward_force * np.sin(headings)
             
-            if stuck_counter > 120:  # 2 segundos a 60 FPS
-                print("🔧 El carro parece atascado, aplicando impulso...")
-
-                # Asegurar que la posición tenga tres coordenadas y sea lista
-                current_position = list(current_position)
-                if len(current_position) == 2:
-                    current_position.append(0.1)  # altura sobre el plano
-
-                # Aplicar un impulso para desatascar
-                p.applyExternalForce(
-                    self.car_id, -1,
-                    [100, 0, 0],
-                    current_position,
-                    p.WORLD_FRAME
-                )
-                stuck_counter = 0
+            # Detección de atasco: una sola evaluación vectorizada sobre la ventana de cada carro
+            cross_track = np.linalg.norm(positions - self.paths[idx, targets], axis=1)
+            stuck_reasons = self.stuck_detector.update(idx, positions, self.path_s[idx, targets], cross_track)
             
-            # Mover el carro
-            lap_completed = self.move_car()
+            for k, i in enumerate(idx):
+                car_id = int(self.car_ids[i])
+                car_pos = [positions[k][0], positions[k][1], 0.1]
+                p.applyExternalForce(car_id, -1, [force_x[k], force_y[k], 0], car_pos, p.WORLD_FRAME,
+                                     physicsClientId=self.physics_client)
+                p.applyExternalTorque(car_id, -1, [0, 0, steering_force[k]], p.WORLD_FRAME,
+                                      physicsClientId=self.physics_client)
+                if stuck_reasons[k]:
+                    print(f"🔧 {CAR_NAMES[TRACK_TYPES[i]]} {STUCK_MESSAGES[stuck_reasons[k]]}...")
+                    recover_car(car_id, stuck_reasons[k], headings[k], min(speeds[k], max_speed[k]), self.paths[i],
+                                targets[k], self.physics_client)
+                if self.recorders[i] is not None:
+                    self.recorders[i].append(self.sim_time - self.start_times[i], *raw_states[k],
+                                             forward_force[k], steering_force[k], targets[k])
+            stuck = idx[stuck_reasons > 0]
+            self.stuck_detector.reset(stuck)
+            self.stuck_events[stuck] += 1
             
-            if lap_completed:
-                print(f"🏆 ¡El {car_name} ha completado el recorrido {track_name}!")
-                break
+            if self.shared_state is not None:
+                self.shared_state.write(self.sim_time, self.track_types[idx], targets, self.poses[idx],
+                                        forward_force, steering_force)
             
-            # Verificar si el usuario quiere salir
-            keys = p.getKeyboardEvents()
-            if ord('q') in keys:
-                print("🛑 Simulación terminada por el usuario")
-                break
+            # Latencia del disparo: desde el comando hasta la primera fuerza aplicada
+            pending = idx[~np.isnan(self.trigger_times[idx])]
+            if len(pending) > 0:
+                self.trigger_latencies[pending] = time.perf_counter() - self.trigger_times[pending]
+                self.trigger_times[pending] = np.nan
             
-            # Actualizar cámara para seguir al carro
-            car_pos = self.get_car_position()
-            camera_distance = {
-                1: 3,
-                2: 3,
-                3: 3
-            }.get(self.track_type, 20)
+            # Vuelta completada o tiempo agotado, evaluado para todos a la vez
+            remaining = self.path_s[idx, self.path_lengths[idx] - 1] - self.path_s[idx, targets]
+            timed_out = self.sim_time - self.start_times[idx] > self.time_limits[idx]
+            for i in idx[remaining < 2.0]:
+                self.finish_car(i, "🏆 Recorrido completado")
+            for i in idx[(remaining >= 2.0) & timed_out]:
+                self.finish_car(i, "⏰ Tiempo límite alcanzado", status="timeout")
             
+            p.stepSimulation(physicsClientId=self.physics_client)
+            self.physics_steps += 1
+            self.step_time += time.perf_counter() - start
+        self.sim_time += PHYSICS_TIMESTEP
+    
+    def update_rates(self):
+        """Recalcula pasos de física por segundo y costo promedio por paso (cada segundo)"""
+        now = time.perf_counter()
+        mark_time, mark_steps, mark_cost = self._rate_mark
+        if now - mark_time >= 1.0:
+            steps = self.physics_steps - mark_steps
+            self.steps_per_sec = steps / (now - mark_time)
+            # Sin pasos en la ventana (mundo sin carros) se conserva el último costo medido
+            if steps:
+                self.avg_step_cost = (self.step_time - mark_cost) / steps
+            self._rate_mark = (now, self.physics_steps, self.step_time)
+    
+    def metrics(self):
+        """Instantánea de las métricas del mundo; se puede llamar desde cualquier hilo"""
+        targets = self.targets.copy()
+        cars = []
+        for i in np.flatnonzero(self.active):
+            total = self.path_s[i, self.path_lengths[i] - 1]
+            cars.append({
+                "track": TRACK_TYPES[i],
+                "replaying": bool(self.replaying[i]),
+                "current_target": int(targets[i]),
+                "path_points": int(self.path_lengths[i]),
+                "progress": round(float(100 * self.path_s[i, targets[i]] / total), 1),
+                "elapsed": round(float(self.sim_time - self.start_times[i]), 2),
+                "stuck_events": int(self.stuck_events[i])
+            })
+        latencies = {
+            str(track): round(float(latency) * 1000, 2)
+            for track, latency in zip(TRACK_TYPES, self.trigger_latencies) if not np.isnan(latency)
+        }
+        current = self.camera_car
+        return {
+            "running": self.running,
+            "current_track": TRACK_TYPES[current] if self.active[current] else None,
+            "queue_depth": self.commands.qsize(),
+            "cars": cars,
+            "sim_time": round(self.sim_time, 3),
+            "physics_steps": self.physics_steps,
+            "steps_per_sec": round(self.steps_per_sec, 1),
+            "avg_step_cost_ms": round(self.avg_step_cost * 1000, 4),
+            "trigger_latency_ms": latencies
+        }
+    
+    def publish_telemetry(self):
+        """Publica en un solo datagrama la pose de todos los carros activos"""
+        idx = np.flatnonzero(self.active)
+        if len(idx) > 0:
+            self.telemetry.publish_poses(self.sim_time, self.track_types[idx], self.targets[idx], self.poses[idx])
+    
+    def update_camera(self):
+        """La cámara sigue al último carro iniciado mientras esté en recorrido"""
+        if self.active[self.camera_car]:
+            car_pos, _ = p.getBasePositionAndOrientation(int(self.car_ids[self.camera_car]),
+                                                         physicsClientId=self.physics_client)
             p.resetDebugVisualizerCamera(
-                cameraDistance=camera_distance,
+                cameraDistance=3,
                 cameraYaw=20,
                 cameraPitch=-20,
-                cameraTargetPosition=[car_pos[0], car_pos[1], 0]
+                cameraTargetPosition=[car_pos[0], car_pos[1], 0],
+                physicsClientId=self.physics_client
             )
-            
-            # Avanzar la simulación
-            p.stepSimulation()
-            time.sleep(1./60.)  # 60 Hz para mejor rendimiento
-
-            # Verificar si terminó la pista en opción 2 o 3
-            if self.track_type in [2, 3] and self.current_target >= len(self.track_points) - 1:
-                final_point = self.track_points[-1]
-                dist_to_final = math.sqrt((final_point[0] - current_position[0])**2 +
-                                          (final_point[1] - current_position[1])**2)
-                if dist_to_final < 2.0:
-                    print("✅ Pista completada. Finalizando simulación.")
-                    break
+    
+    def poll_keyboard(self):
+        """Revisa si el usuario presionó 'q' en la ventana de simulación"""
+        if ord('q') in p.getKeyboardEvents(physicsClientId=self.physics_client):
+            self.quit_requested = True
+    
+    def log_progress(self):
+        """Muestra el avance de cada carro activo"""
+        idx = np.flatnonzero(self.active)
+        if len(idx) > 0:
+            progress = 100 * self.path_s[idx, self.targets[idx]] / self.path_s[idx, self.path_lengths[idx] - 1]
+            print("📍 Avance: " + ", ".join(f"{CAR_NAMES[TRACK_TYPES[i]]} {pct:.0f}%" for i, pct in zip(idx, progress)))
+    
+    def run(self, exit_when_idle=False, rates=None):
+        """Bucle principal del mundo con planificador de paso fijo (ver FixedStepScheduler).
+        Con exit_when_idle termina cuando ningún carro está activo."""
+        self.connect()
+        self.running = True
+        self.quit_requested = False
         
-        print("✅ Recorrido completado.")
+        scheduler = FixedStepScheduler(realtime=self.gui)
+        if self.gui:
+            rates = dict(SCHEDULER_RATES, **(rates or {}))
+            scheduler.add_task(rates["camera"], self.update_camera)
+            scheduler.add_task(rates["keyboard"], self.poll_keyboard)
+            scheduler.add_task(rates["log"], self.log_progress)
+        if self.telemetry is not None:
+            scheduler.add_task(self.telemetry.rate_hz, self.publish_telemetry)
+        try:
+            while self.running:
+                # Sin carros activos no hay física que avanzar: esperar comandos sin consumir CPU
+                idle_wait = 0.05 if not self.active.any() and not exit_when_idle else None
+                if not self.process_commands(timeout=idle_wait):
+                    print("🛑 Simulación detenida")
+                    break
+                
+                if exit_when_idle and not self.active.any() and self.commands.empty():
+                    print("✅ Todos los recorridos terminaron.")
+                    break
+                
+                for _ in range(scheduler.due_steps()):
+                    self.step()
+                    scheduler.advance()
+                self.update_rates()
+                
+                scheduler.run_tasks()
+                if self.quit_requested:
+                    print("🛑 Simulación terminada por el usuario")
+                    break
+                scheduler.wait()
+        finally:
+            for i in np.flatnonzero(self.active):
+                self.interrupt_car(i)
+            self.running = False
+            self.cleanup()
     
     def cleanup(self):
-        """Limpia la simulación"""
+        """Cierra la conexión con PyBullet"""
         if self.physics_client is not None:
-            p.disconnect()
+            p.disconnect(self.physics_client)
             self.physics_client = None
 
 
+class AtomicCounter:
+    """Contador que varios hilos incrementan sin candados: next() sobre itertools.count
+    es atómico con el GIL. El valor leído puede ir momentáneamente un incremento atrás
+    si dos hilos se cruzan, pero se corrige con el siguiente incremento."""
+    
+    def __init__(self):
+        self._count = itertools.count(1)
+        self.value = 0
+    
+    def increment(self):
+        value = next(self._count)
+        if value > self.value:
+            self.value = value
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Responde GET /metrics con las métricas del TCPServer en JSON"""
+    
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.tcp_server.get_metrics()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        # Las consultas de métricas no se muestran en consola
+        pass
+
+
 class TCPServer:
-    def __init__(self, host='localhost', port=8080):
+    def __init__(self, host='localhost', port=8080, replay=False, gui=True, metrics_port=None,
+                 telemetry_port=None, telemetry_rate=TELEMETRY_RATE, shared_state=False, lap_store=LAP_STORE_FILE):
         self.host = host
         self.port = port
+        self.gui = gui
+        # Reproducir vueltas grabadas en lugar de simular pistas que ya se recorrieron
+        self.replay = replay
         self.server_socket = None
         self.running = False
-        self.car_simulator = None
+        self.world = None
         self.simulation_thread = None
+        # Crear, iniciar carros y detener el mundo desde los hilos de clientes, uno a la vez
+        self.world_lock = threading.Lock()
+        
+        # Métricas (ver get_metrics); se actualizan sin candados desde los hilos de clientes
+        self.started_at = time.time()
+        # dirección -> socket, candado de envío y hora de conexión de los clientes activos
+        self.clients = {}
+        self.connections_total = AtomicCounter()
+        self.commands_total = AtomicCounter()
+        self.recent_commands = deque(maxlen=COMMAND_RATE_SAMPLES)
+        # El historial de vueltas se conserva aunque el mundo se detenga y se vuelva a crear
+        self.lap_history = deque(maxlen=LAP_HISTORY_SIZE)
+        # Puerto del endpoint HTTP de métricas en localhost (None lo desactiva)
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        # Telemetría UDP en localhost (None la desactiva); se comparte entre mundos sucesivos
+        self.telemetry = TelemetryPublisher(port=telemetry_port, rate_hz=telemetry_rate) \
+            if telemetry_port is not None else None
+        # Anillo de estado en memoria compartida para procesos del mismo equipo
+        self.shared_state = None
+        if shared_state:
+            try:
+                self.shared_state = PoseRingBuffer()
+            except FileExistsError as e:
+                print(f"❌ {e}; estado en memoria compartida desactivado")
+        # Resultados de vuelta: el hilo de simulación solo los encola; otro hilo los envía
+        # al dispositivo que pidió la vuelta y los guarda por lotes (None desactiva el guardado)
+        self.lap_events = queue.Queue()
+        self.lap_store = LapStore(lap_store) if lap_store else None
+        self.notifier_thread = None
         
     def start_server(self):
         """Inicia el servidor TCP"""
@@ -416,20 +1443,31 @@ class TCPServer:
             self.server_socket.bind((self.host, self.port))
             self.server_socket.listen(5)
             self.running = True
+            self.notifier_thread = threading.Thread(target=self.notify_laps, daemon=True)
+            self.notifier_thread.start()
             
             print(f"🌐 Servidor TCP iniciado en {self.host}:{self.port}")
+            if self.metrics_port is not None:
+                self.start_metrics_server()
+            if self.shared_state is not None:
+                print(f"🧠 Estado de los carros en memoria compartida '{self.shared_state.name}'")
+            if self.telemetry is not None:
+                print(f"📡 Telemetría UDP en {self.telemetry.address[0]}:{self.telemetry.address[1]} "
+                      f"a {self.telemetry.rate_hz} Hz")
             print("📡 Esperando conexiones del microcontrolador...")
             print("📋 Comandos disponibles:")
-            print("   - 'START_TRACK_1' : Iniciar pista circular (50 monedas)")
-            print("   - 'START_TRACK_2' : Iniciar pista en S (200 monedas)")
-            print("   - 'START_TRACK_3' : Iniciar pista figura 8 (1000 monedas)")
+            for track_type, track in TRACK_DEFINITIONS.items():
+                print(f"   - 'START_TRACK_{track_type}' : Iniciar pista {track['description']}")
             print("   - 'STOP_SIMULATION' : Detener simulación actual")
             print("   - 'STATUS' : Obtener estado del servidor")
+            print("   - 'METRICS' : Obtener métricas del servidor y la simulación (JSON)")
+            print("📬 Al terminar cada vuelta se envía 'LAP: track=N status=... lap_time=... stuck_events=...'")
             
             while self.running:
                 try:
                     client_socket, address = self.server_socket.accept()
                     print(f"🔗 Cliente conectado desde {address}")
+                    self.connections_total.increment()
                     
                     # Manejar cliente en un hilo separado
                     client_thread = threading.Thread(
@@ -449,75 +1487,103 @@ class TCPServer:
             self.cleanup_server()
     
     def handle_client(self, client_socket, address):
-        """Maneja la comunicación con un cliente"""
+        """Maneja la comunicación con un cliente. Los comandos terminan en salto de línea, así
+        varios pueden llegar en un solo recv o un comando partido en dos. Un cliente que nunca
+        envía salto de línea (firmware anterior del microcontrolador) manda un comando por recv.
+        Cada respuesta termina en salto de línea, igual que las notificaciones LAP."""
+        client = {"socket": client_socket, "lock": threading.Lock(), "connected_at": time.time()}
+        # Un cliente que no lee no puede bloquear indefinidamente un envío (ni la cola de vueltas)
+        client_socket.settimeout(CLIENT_SEND_TIMEOUT)
+        self.clients[address] = client
+        buffer = b""
+        framed = False  # El cliente ya envió un salto de línea: se separa por líneas
         try:
             while self.running:
-                # Recibir datos del cliente
-                data = client_socket.recv(1024).decode('utf-8').strip()
+                # Recibir datos del cliente (el timeout del socket solo indica que no envió nada)
+                try:
+                    data = client_socket.recv(1024)
+                except socket.timeout:
+                    continue
+                received_at = time.perf_counter()
                 
                 if not data:
                     break
                 
-                print(f"📨 Comando recibido de {address}: {data}")
+                buffer += data
+                framed = framed or b"\n" in data
+                if framed:
+                    # La última parte es un comando incompleto (o vacía): queda para el siguiente recv
+                    *lines, buffer = buffer.split(b"\n")
+                else:
+                    lines, buffer = [buffer], b""
                 
-                # Procesar comando
-                response = self.process_command(data)
-                
-                # Enviar respuesta
-                client_socket.send(response.encode('utf-8'))
+                for line in lines:
+                    command = line.decode('utf-8', errors='replace').strip()
+                    if not command:
+                        continue
+                    self.commands_total.increment()
+                    self.recent_commands.append(received_at)
+                    print(f"📨 Comando recibido de {address}: {command}")
+                    
+                    # Procesar comando
+                    response = self.process_command(command, received_at, address)
+                    
+                    # Enviar respuesta (el candado evita mezclarla con una notificación de vuelta)
+                    with client["lock"]:
+                        client_socket.sendall((response + "\n").encode('utf-8'))
                 
         except socket.error as e:
             print(f"❌ Error de conexión con {address}: {e}")
         finally:
+            self.clients.pop(address, None)
             client_socket.close()
             print(f"🔌 Cliente {address} desconectado")
     
-    def process_command(self, command):
+    def process_command(self, command, received_at=None, address=None):
         """Procesa los comandos recibidos del microcontrolador"""
         command = command.upper().strip()
         
         try:
-            if command == "START_TRACK_1":
-                return self.start_track_simulation(1)
-            elif command == "START_TRACK_2":
-                return self.start_track_simulation(2)
-            elif command == "START_TRACK_3":
-                return self.start_track_simulation(3)
+            track_number = command[len("START_TRACK_"):]
+            if command.startswith("START_TRACK_") and track_number.isdigit() and int(track_number) in TRACK_DEFINITIONS:
+                return self.start_track_simulation(int(track_number), received_at, address)
             elif command == "STOP_SIMULATION":
                 return self.stop_simulation()
             elif command == "STATUS":
                 return self.get_status()
+            elif command == "METRICS":
+                return json.dumps(self.get_metrics())
             else:
-                return "ERROR: Comando no reconocido. Comandos válidos: START_TRACK_1, START_TRACK_2, START_TRACK_3, STOP_SIMULATION, STATUS"
+                start_commands = ", ".join(f"START_TRACK_{t}" for t in TRACK_TYPES)
+                return f"ERROR: Comando no reconocido. Comandos válidos: {start_commands}, STOP_SIMULATION, STATUS, METRICS"
                 
         except Exception as e:
             return f"ERROR: {str(e)}"
     
-    def start_track_simulation(self, track_type):
-        """Inicia una simulación de pista específica"""
+    def start_track_simulation(self, track_type, received_at=None, address=None):
+        """Inicia el carro de una pista; los carros de las otras pistas siguen corriendo"""
         try:
-            # Detener simulación actual si existe
-            if self.car_simulator is not None:
-                self.car_simulator.cleanup()
-            
-            # Crear nueva simulación
-            self.car_simulator = CarLineFollower(track_type=track_type)
-            self.car_simulator.init_simulation()
-            
-            # Ejecutar simulación en hilo separado
-            self.simulation_thread = threading.Thread(
-                target=self.car_simulator.run_simulation
-            )
-            self.simulation_thread.daemon = True
-            self.simulation_thread.start()
-            
-            track_names = {
-                1: "Circular (50 monedas)",
-                2: "en S (200 monedas)", 
-                3: "Figura 8 (1000 monedas)"
-            }
+            with self.world_lock:
+                # Un mundo que terminó por su cuenta (p. ej. se cerró su ventana) se libera primero
+                if self.world is not None and not self.world.running and not self._stop_world():
+                    error_msg = "ERROR: No se pudo iniciar la simulación - la anterior no terminó a tiempo"
+                    print(f"❌ {error_msg}")
+                    return error_msg
+                
+                # Crear el mundo compartido si no hay uno en ejecución
+                if self.world is None:
+                    self.world = MultiCarWorld(gui=self.gui, replay=self.replay, lap_history=self.lap_history,
+                                               telemetry=self.telemetry, shared_state=self.shared_state,
+                                               on_lap_finished=self.lap_finished)
+                    self.world.running = True
+                    self.simulation_thread = threading.Thread(target=self.world.run)
+                    self.simulation_thread.daemon = True
+                    self.simulation_thread.start()
+                
+                # El hilo de simulación crea (o reinicia) el carro de esta pista
+                self.world.request_start(track_type, received_at, address)
             
-            track_name = track_names.get(track_type, "Desconocida")
+            track_name = TRACK_DEFINITIONS[track_type]["description"]
             response = f"OK: Simulación iniciada - Pista {track_name}"
             print(f"✅ {response}")
             return response
@@ -528,14 +1594,16 @@ class TCPServer:
             return error_msg
     
     def stop_simulation(self):
-        """Detiene la simulación actual"""
+        """Detiene todos los carros y cierra la simulación"""
         try:
-            if self.car_simulator is not None:
-                self.car_simulator.cleanup()
-                self.car_simulator = None
-                response = "OK: Simulación detenida"
-            else:
-                response = "INFO: No hay simulación activa"
+            with self.world_lock:
+                was_running = self.world is not None and self.world.running
+                if not self._stop_world():
+                    response = "ERROR: La simulación no se detuvo a tiempo"
+                elif was_running:
+                    response = "OK: Simulación detenida"
+                else:
+                    response = "INFO: No hay simulación activa"
             
             print(f"🛑 {response}")
             return response
@@ -545,26 +1613,142 @@ class TCPServer:
             print(f"❌ {error_msg}")
             return error_msg
     
+    def _stop_world(self):
+        """Pide detener el mundo y espera su hilo; se llama con world_lock tomado.
+        Solo suelta la referencia cuando el hilo terminó: si sigue vivo retorna False y el
+        mundo se conserva, así un comando posterior no crea otro encima de él."""
+        if self.world is None:
+            return True
+        self.world.request_stop()
+        self.simulation_thread.join(timeout=WORLD_STOP_TIMEOUT)
+        if self.simulation_thread.is_alive():
+            return False
+        self.world = None
+        self.simulation_thread = None
+        return True
+    
     def get_status(self):
         """Obtiene el estado actual del servidor"""
-        if self.car_simulator is not None:
-            status = "OK: Servidor activo - Simulación en ejecución"
+        active_tracks = self.world.active_tracks() if self.world is not None and self.world.running else []
+        if active_tracks:
+            status = f"OK: Servidor activo - Simulación en ejecución (pistas {', '.join(map(str, active_tracks))})"
         else:
             status = "OK: Servidor activo - Sin simulación"
         
         print(f"📊 {status}")
         return status
     
+    def lap_finished(self, record, address):
+        """Llamada desde el hilo de simulación al terminar una vuelta: solo encola el resultado"""
+        self.lap_events.put((record, address))
+    
+    def notify_laps(self):
+        """Envía a cada cliente el resultado de las vueltas que pidió y las guarda por lotes"""
+        while True:
+            try:
+                event = self.lap_events.get(timeout=1.0)
+            except queue.Empty:
+                if self.lap_store is not None:
+                    self.lap_store.flush_if_due()
+                continue
+            if event is None:
+                break
+            record, address = event
+            
+            client = self.clients.get(address)
+            if client is not None:
+                message = (f"LAP: track={record['track']} status={record['status']} "
+                           f"lap_time={record['lap_time']:.3f} stuck_events={record['stuck_events']}\n")
+                try:
+                    with client["lock"]:
+                        client["socket"].sendall(message.encode('utf-8'))
+                except socket.timeout:
+                    # El cliente no lee: se desconecta (pudo quedar una línea a medias) para no
+                    # retrasar las demás notificaciones; handle_client cierra el socket
+                    print(f"⚠️ Cliente {address} no recibe datos, se desconecta")
+                    try:
+                        client["socket"].shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+                except OSError:
+                    # El cliente se desconectó; la vuelta igual queda guardada
+                    pass
+            
+            if self.lap_store is not None:
+                self.lap_store.add(record, f"{address[0]}:{address[1]}" if address else None)
+        
+        if self.lap_store is not None:
+            self.lap_store.flush()
+    
+    def commands_per_sec(self):
+        """Comandos por segundo en la ventana reciente (COMMAND_RATE_WINDOW)"""
+        now = time.perf_counter()
+        stamps = [t for t in list(self.recent_commands) if now - t <= COMMAND_RATE_WINDOW]
+        if not stamps:
+            return 0.0
+        # Con el deque lleno la ventana efectiva es más corta que COMMAND_RATE_WINDOW
+        full = len(stamps) == self.recent_commands.maxlen
+        span = now - stamps[0] if full else COMMAND_RATE_WINDOW
+        return len(stamps) / span if span > 0 else 0.0
+    
+    def get_metrics(self):
+        """Métricas del servidor y de la simulación como diccionario serializable a JSON.
+        Solo lee contadores, así que no bloquea el hilo de simulación."""
+        world = self.world
+        return {
+            "uptime": round(time.time() - self.started_at, 1),
+            "connections": {
+                "active": len(self.clients),
+                "total": self.connections_total.value
+            },
+            "commands": {
+                "total": self.commands_total.value,
+                "per_sec": round(self.commands_per_sec(), 2)
+            },
+            "simulation": world.metrics() if world is not None and world.running else None,
+            "lap_history": list(self.lap_history)
+        }
+    
+    def start_metrics_server(self):
+        """Inicia el endpoint HTTP de métricas (solo en localhost) en un hilo aparte"""
+        try:
+            self.metrics_server = http.server.ThreadingHTTPServer(("localhost", self.metrics_port), MetricsHandler)
+        except OSError as e:
+            print(f"❌ No se pudo iniciar el endpoint de métricas: {e}")
+            return
+        self.metrics_server.tcp_server = self
+        threading.Thread(target=self.metrics_server.serve_forever, daemon=True).start()
+        print(f"📈 Métricas en http://localhost:{self.metrics_port}/metrics")
+    
     def cleanup_server(self):
         """Limpia recursos del servidor"""
         self.running = False
         
-        if self.car_simulator is not None:
-            self.car_simulator.cleanup()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+        
+        with self.world_lock:
+            if not self._stop_world():
+                print("⚠️ El hilo de simulación no terminó a tiempo")
+        
+        # Enviar y guardar las vueltas pendientes (incluidas las interrumpidas al cerrar el mundo)
+        if self.notifier_thread is not None:
+            self.lap_events.put(None)
+            self.notifier_thread.join(timeout=5)
+            self.notifier_thread = None
         
         if self.server_socket is not None:
             self.server_socket.close()
         
+        if self.telemetry is not None:
+            self.telemetry.close()
+        
+        if self.shared_state is not None:
+            self.shared_state.close()
+            self.shared_state = None
+        
         print("🧹 Servidor cerrado")
 
 
@@ -580,12 +1764,12 @@ def show_menu():
     print("="*70)
 
 
-def get_user_choice():
+def get_user_choice(max_option=2):
     """Obtiene la elección del usuario"""
     while True:
         try:
-            choice = int(input("👉 Ingresa tu opción (0-2): "))
-            if choice in [0, 1, 2]:
+            choice = int(input(f"👉 Ingresa tu opción (0-{max_option}): "))
+            if 0 <= choice <= max_option:
                 return choice
             else:
                 print("❌ Opción inválida. Intenta de nuevo.")
@@ -600,6 +1784,7 @@ def show_track_menu():
     print("1️⃣  Monedas de 50  - 🔴 Carro 1 - Pista Circular")
     print("2️⃣  Monedas de 200 - 🟢 Carro 2 - Pista en S")
     print("3️⃣  Monedas de 1000 - 🟡 Carro 3 - Pista Figura 8")
+    print("4️⃣  Las tres pistas al mismo tiempo")
     print("0️⃣  Volver al menú principal")
     print("="*60)
 
@@ -611,10 +1796,19 @@ def manual_mode():
     try:
         while True:
             show_track_menu()
-            choice = get_user_choice()
+            choice = get_user_choice(max_option=4)
             
             if choice == 0:
                 break
+            elif choice == 4:
+                print("🔧 Inicializando las tres pistas en un mismo mundo...")
+                world = MultiCarWorld()
+                for track_type in TRACK_TYPES:
+                    world.request_start(track_type)
+                world.run(exit_when_idle=True)
+                
+                print("🎯 Simulación completada. Regresando al menú...")
+                time.sleep(2)
             elif choice in [1, 2, 3]:
                 track_names = {
                     1: "50 monedas - Pista Circular",
@@ -623,11 +1817,19 @@ def manual_mode():
                 }
                 
                 print(f"💸 Has seleccionado {track_names[choice]}")
-                print("🔧 Inicializando simulación...")
                 
-                car_simulator = CarLineFollower(track_type=choice)
+                # Si ya hay una vuelta grabada se puede reproducir sin simular la física
+                samples = load_recording(choice)
+                replay = samples is not None and \
+                    input("🎬 Hay una vuelta grabada, ¿reproducirla? (s/N): ").strip().lower() == "s"
+                
+                print("🔧 Inicializando simulación...")
+                car_simulator = CarLineFollower(track_type=choice, record=True)
                 car_simulator.init_simulation()
-                car_simulator.run_simulation()
+                if replay:
+                    car_simulator.replay_simulation(samples)
+                else:
+                    car_simulator.run_simulation()
                 car_simulator.cleanup()
                 
                 print("🎯 Simulación completada. Regresando al menú...")
@@ -658,8 +1860,27 @@ def tcp_mode():
         print("❌ Puerto inválido, usando 8080")
         port = 8080
     
+    replay = input("🎬 ¿Reproducir vueltas ya grabadas en lugar de simularlas? (s/N): ").strip().lower() == "s"
+    
+    metrics_input = input("📈 Puerto HTTP de métricas (presiona Enter para desactivarlo): ").strip()
+    try:
+        metrics_port = int(metrics_input) if metrics_input else None
+    except ValueError:
+        print("❌ Puerto de métricas inválido, endpoint desactivado")
+        metrics_port = None
+    
+    telemetry_input = input(f"📡 Puerto UDP de telemetría (presiona Enter para desactivarla, ej. {TELEMETRY_PORT}): ").strip()
+    try:
+        telemetry_port = int(telemetry_input) if telemetry_input else None
+    except ValueError:
+        print("❌ Puerto de telemetría inválido, telemetría desactivada")
+        telemetry_port = None
+    
+    shared_state = input("🧠 ¿Publicar el estado de los carros en memoria compartida? (s/N): ").strip().lower() == "s"
+    
     # Crear y iniciar servidor
-    server = TCPServer(host, port)
+    server = TCPServer(host, port, replay=replay, metrics_port=metrics_port, telemetry_port=telemetry_port,
+                       shared_state=shared_state)
     
     try:
         server.start_server()
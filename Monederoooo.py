@@ -224,7 +224,7 @@ def enviar_comando_tcp(tcp_socket, comando):
     if tcp_socket is not None and comando is not None:
         try:
             print("🖥️ Enviando comando al simulador:", comando)
-            tcp_socket.send(comando.encode("utf-8"))
+            tcp_socket.send((comando + "\n").encode("utf-8"))
             return True
         except Exception as e:
             print("❌ Error enviando comando TCP:", e)
@@ -0,0 +1,245 @@
+"""
+Benchmarks del simulador (Carrito.py).
+
+Mide, sin GUI:
+  - Pasos de simulación por segundo de cada pista (control + física).
+  - Latencia desde que llega START_TRACK_N al TCPServer hasta la primera fuerza aplicada.
+  - Tiempos de vuelta, tasa de vueltas completadas y de atascos sobre varias semillas.
+  - Comandos por segundo atendidos con muchos clientes TCP concurrentes.
+
+Los resultados se guardan en JSON y se comparan contra una línea base guardada
+(benchmark_baseline.json); si alguna métrica empeora más que la tolerancia el
+programa termina con código 1.
+
+Ejemplo:
+    python benchmark_carrito.py --save-baseline     # primera vez, en la máquina de referencia
+    python benchmark_carrito.py                     # comparar contra la línea base
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import numpy as np
+
+from Carrito import CarLineFollower, TCPServer, TRACK_TYPES
+from lotes import build_jobs, run_batch
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Cambio relativo permitido antes de considerar una métrica como regresión
+TOLERANCE = 0.15
+
+# Sentido de cada familia de métricas: True si un valor mayor es mejor
+HIGHER_IS_BETTER = {
+    "steps_per_sec": True,
+    "trigger_latency_ms": False,
+    "lap_time": False,
+    "completion_rate": True,
+    "stuck_rate": False,
+    "clients_commands_per_sec": True
+}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Oculta los mensajes del simulador mientras se mide"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def free_port():
+    """Puerto TCP libre en localhost"""
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def bench_steps_per_sec(track, repeats):
+    """Pasos por segundo de una vuelta completa sin GUI (mejor de varias repeticiones)"""
+    rates = []
+    for _ in range(repeats):
+        car = CarLineFollower(track_type=track, gui=False)
+        with quiet():
+            car.init_simulation()
+            result = car.run_simulation()
+        car.cleanup()
+        rates.append(result["steps"] / result["wall_time"])
+    return max(rates)
+
+
+def start_headless_server():
+    """Levanta un TCPServer sin GUI en un hilo y retorna (servidor, puerto)"""
+    port = free_port()
+    server = TCPServer("localhost", port, gui=False)
+    threading.Thread(target=server.start_server, daemon=True).start()
+    deadline = time.time() + 5
+    while not server.running and time.time() < deadline:
+        time.sleep(0.01)
+    return server, port
+
+
+def send_command(client, command):
+    """Envía un comando y espera la respuesta"""
+    client.sendall((command + "\n").encode("utf-8"))
+    return client.recv(1024).decode("utf-8")
+
+
+def bench_trigger_latency(server, port, track, repeats):
+    """Mediana (ms) desde la llegada de START_TRACK_N hasta la primera fuerza aplicada"""
+    i = TRACK_TYPES.index(track)
+    latencies = []
+    with socket.create_connection(("localhost", port)) as client:
+        for _ in range(repeats):
+            if server.world is not None:
+                server.world.trigger_latencies[i] = np.nan
+            send_command(client, f"START_TRACK_{track}")
+            deadline = time.time() + 5
+            while time.time() < deadline:
+                latency = server.world.trigger_latencies[i]
+                if not np.isnan(latency):
+                    latencies.append(latency * 1000)
+                    break
+                time.sleep(0.0005)
+    return statistics.median(latencies) if latencies else float("nan")
+
+
+def bench_concurrent_clients(port, clients, commands_per_client):
+    """Comandos STATUS por segundo atendidos con varios clientes concurrentes"""
+    barrier = threading.Barrier(clients + 1)
+    errors = []
+
+    def client_worker():
+        try:
+            with socket.create_connection(("localhost", port)) as client:
+                barrier.wait()
+                for _ in range(commands_per_client):
+                    send_command(client, "STATUS")
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=client_worker) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return (clients * commands_per_client - len(errors) * commands_per_client) / elapsed
+
+
+def bench_laps(tracks, seeds, workers):
+    """Tiempo de vuelta promedio, tasa de completadas y atascos por vuelta sobre varias semillas"""
+    rows = run_batch(build_jobs(tracks, range(seeds)), workers)
+    metrics = {}
+    for track in tracks:
+        track_rows = [row for row in rows if row["track"] == track]
+        completed = [row["lap_time"] for row in track_rows if row["completed"]]
+        metrics[f"lap_time.track_{track}"] = float(np.mean(completed)) if completed else float("nan")
+        metrics[f"completion_rate.track_{track}"] = len(completed) / len(track_rows)
+        metrics[f"stuck_rate.track_{track}"] = float(np.mean([row["stuck_events"] for row in track_rows]))
+    return metrics
+
+
+def run_benchmarks(args):
+    """Ejecuta todas las mediciones y retorna el diccionario de métricas"""
+    metrics = {}
+    for track in args.tracks:
+        print(f"⏱️  Pasos por segundo, pista {track}...")
+        metrics[f"steps_per_sec.track_{track}"] = bench_steps_per_sec(track, args.repeats)
+
+    print("⏱️  Latencia de disparo y clientes concurrentes...")
+    with quiet():
+        server, port = start_headless_server()
+        for track in args.tracks:
+            metrics[f"trigger_latency_ms.track_{track}"] = bench_trigger_latency(server, port, track, args.repeats)
+        with socket.create_connection(("localhost", port)) as client:
+            send_command(client, "STOP_SIMULATION")
+        metrics["clients_commands_per_sec"] = bench_concurrent_clients(port, args.clients, args.commands)
+        server.cleanup_server()
+
+    print("⏱️  Vueltas sobre varias semillas...")
+    metrics.update(bench_laps(args.tracks, args.seeds, args.workers))
+    return metrics
+
+
+def compare(metrics, baseline, tolerance=TOLERANCE):
+    """Compara contra la línea base; retorna la lista de métricas que empeoraron"""
+    regressions = []
+    print(f"{'Métrica':<34} {'Base':>12} {'Actual':>12} {'Cambio':>9}")
+    for name, value in metrics.items():
+        base = baseline.get(name)
+        if base is None or not np.isfinite(base) or not np.isfinite(value):
+            print(f"{name:<34} {'-':>12} {value:>12.3f}")
+            continue
+        change = (value - base) / abs(base) if base else 0.0
+        higher_is_better = HIGHER_IS_BETTER[name.split(".")[0]]
+        worse = -change if higher_is_better else change
+        # Las tasas pueden partir de cero; se compara la diferencia absoluta
+        if base == 0:
+            worse = value if not higher_is_better else 0.0
+        flag = ""
+        if worse > tolerance:
+            regressions.append(name)
+            flag = "  ❌"
+        print(f"{name:<34} {base:>12.3f} {value:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del simulador del carro seguidor de línea")
+    parser.add_argument("--tracks", type=int, nargs="+", default=list(TRACK_TYPES), choices=TRACK_TYPES)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=50, help="Clientes TCP concurrentes")
+    parser.add_argument("--commands", type=int, default=20, help="Comandos STATUS por cliente")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default="benchmark_resultados.json")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Guardar los resultados como línea base")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    metrics = run_benchmarks(args)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "metrics": metrics
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Resultados guardados en {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📌 Línea base guardada en {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("ℹ️ No hay línea base para comparar; usa --save-baseline para crearla.")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["metrics"]
+    regressions = compare(metrics, baseline, args.tolerance)
+    if regressions:
+        print(f"❌ {len(regressions)} métrica(s) empeoraron más de {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("✅ Sin regresiones respecto a la línea base")
+
+
+if __name__ == "__main__":
+    main()
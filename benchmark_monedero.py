@@ -0,0 +1,164 @@
+"""
+Benchmark del procesamiento de datos del monedero (monedero_datos.py).
+
+Genera registros sintéticos con la forma de los que sube el ESP8266 (conteos y pesos
+acumulados, con algunas lecturas anómalas que bajan) y compara contra las
+implementaciones anteriores, verificando que den el mismo resultado:
+  - Carga: registros_a_dataframe() (columnas con tipos compactos y fecha con formato
+    fijo) contra DataFrame(registros) con tipos por defecto; tiempo y bytes por registro.
+  - Preprocesamiento: corregir_ceros por filas sobre cada columna (con una copia del
+    DataFrame) y luego los valores monetarios, contra preprocesar().
+  - Gráficas: tiempo de reducir_para_grafica() y puntos que quedan por serie para el
+    ancho de las figuras del dashboard (matplotlib no se usa aquí).
+
+Ejemplo:
+    python benchmark_monedero.py --filas 100000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from monedero_datos import (ANCHO_GRAFICAS, COLUMNAS_ACUMULADAS, COLUMNAS_CONTEO, COLUMNAS_PESO, VALORES_MONEDAS,
+                            memoria_por_registro, preprocesar, reducir_para_grafica, registros_a_dataframe)
+
+
+def generar_registros(filas, seed=0):
+    """Registros sintéticos de /Monedero, uno cada 5 s, con 1% de lecturas en cero"""
+    rng = np.random.default_rng(seed)
+    conteos = np.cumsum(rng.integers(0, 2, size=(filas, 3)), axis=0)
+    pesos = np.round(np.cumsum(rng.uniform(0, 5, size=(filas, 3)), axis=0), 2)
+    anomalas = rng.random(filas) < 0.01
+    conteos[anomalas] = 0
+    pesos[anomalas] = 0.0
+    inicio = np.datetime64("2025-01-01T00:00:00")
+    fechas = (inicio + np.arange(filas) * np.timedelta64(5, "s")).astype(str)
+
+    registros = []
+    for i in range(filas):
+        registros.append({
+            "fecha_hora_recoleccion": fechas[i].replace("T", " "),
+            "conteo_caja1": int(conteos[i, 0]),
+            "conteo_caja2": int(conteos[i, 1]),
+            "conteo_caja3": int(conteos[i, 2]),
+            "conteo_global": int(conteos[i].sum()),
+            "errores_clasificacion": int(rng.integers(0, 3)),
+            "caja1": float(pesos[i, 0]),
+            "caja2": float(pesos[i, 1]),
+            "caja3": float(pesos[i, 2]),
+            "movimiento_carro": bool(i % 7 == 0),
+            "posicion_carro": int(i % 4)
+        })
+    return registros
+
+
+def cargar_con_tipos_por_defecto(registros):
+    """Carga anterior de dashboard.py: DataFrame de la lista de dicts y conversión por columna"""
+    df = pd.DataFrame(registros)
+    for col in COLUMNAS_CONTEO + COLUMNAS_PESO:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int if "conteo" in col else float)
+    df["Fecha"] = pd.to_datetime(df["fecha_hora_recoleccion"], errors='coerce')
+    return df.sort_values("Fecha").dropna(subset=["Fecha"])
+
+
+def corregir_ceros_por_filas(df_local, columna):
+    """Implementación anterior de dashboard.py (recorrido por filas), como referencia"""
+    if columna not in df_local.columns or df_local[columna].empty:
+        return df_local
+
+    valores_corregidos = df_local[columna].copy()
+    maximo_hasta_ahora = valores_corregidos.iloc[0] if not valores_corregidos.empty else 0
+
+    for i in range(1, len(valores_corregidos)):
+        valor_actual = valores_corregidos.iloc[i]
+        if valor_actual < maximo_hasta_ahora:
+            valores_corregidos.iloc[i] = maximo_hasta_ahora
+        maximo_hasta_ahora = valores_corregidos.iloc[i]
+
+    df_local[columna] = valores_corregidos
+    return df_local
+
+
+def preprocesar_por_filas(df):
+    """Preprocesamiento anterior de mostrar_dashboard()"""
+    for col in COLUMNAS_ACUMULADAS:
+        if col in df.columns:
+            df = corregir_ceros_por_filas(df.copy(), col)
+    df["valor_caja1"] = df["conteo_caja1"] * VALORES_MONEDAS["caja1"]["valor"]
+    df["valor_caja2"] = df["conteo_caja2"] * VALORES_MONEDAS["caja2"]["valor"]
+    df["valor_caja3"] = df["conteo_caja3"] * VALORES_MONEDAS["caja3"]["valor"]
+    df["valor_total"] = df["valor_caja1"] + df["valor_caja2"] + df["valor_caja3"]
+    return df
+
+
+def medir(funcion, repeticiones):
+    """Mejor tiempo (s) de varias repeticiones y el último resultado"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del procesamiento de datos del monedero")
+    parser.add_argument("--filas", type=int, default=100000)
+    parser.add_argument("--repeticiones", type=int, default=5, help="Repeticiones de cada medición rápida")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Guardar los resultados en un JSON")
+    args = parser.parse_args()
+
+    print(f"⏳ Generando {args.filas} registros sintéticos...")
+    registros = generar_registros(args.filas, args.seed)
+
+    t_carga_anterior, df_anterior = medir(lambda: cargar_con_tipos_por_defecto(registros), args.repeticiones)
+    t_carga, df = medir(lambda: registros_a_dataframe(registros), args.repeticiones)
+    # Los pesos en float32 se comparan con su precisión (~7 cifras)
+    iguales = all(np.array_equal(df[col].to_numpy(), df_anterior[col].to_numpy()) for col in COLUMNAS_CONTEO + ["Fecha"])
+    iguales &= all(np.allclose(df[col].to_numpy(), df_anterior[col].to_numpy(), rtol=1e-6) for col in COLUMNAS_PESO)
+    if not iguales:
+        raise SystemExit("❌ registros_a_dataframe() no coincide con la carga anterior")
+
+    # La versión por filas tarda segundos: una sola repetición
+    t_filas, esperado = medir(lambda: preprocesar_por_filas(df), 1)
+    t_vectorizado, obtenido = medir(lambda: preprocesar(df), args.repeticiones)
+
+    columnas = COLUMNAS_ACUMULADAS + ["valor_caja1", "valor_caja2", "valor_caja3", "valor_total"]
+    if not all(np.array_equal(obtenido[col].to_numpy(), esperado[col].to_numpy()) for col in columnas):
+        raise SystemExit("❌ preprocesar() no coincide con la implementación por filas")
+
+    fechas = obtenido["Fecha"].to_numpy()
+    t_reducir, indices = medir(lambda: reducir_para_grafica(fechas, obtenido["valor_total"].to_numpy(), ANCHO_GRAFICAS),
+                               args.repeticiones)
+
+    resultados = {
+        "filas": args.filas,
+        "carga_tipos_por_defecto_s": round(t_carga_anterior, 4),
+        "carga_tipos_compactos_s": round(t_carga, 4),
+        "bytes_por_registro_tipos_por_defecto": round(memoria_por_registro(df_anterior), 1),
+        "bytes_por_registro_tipos_compactos": round(memoria_por_registro(df), 1),
+        "preprocesar_por_filas_s": round(t_filas, 4),
+        "preprocesar_vectorizado_s": round(t_vectorizado, 5),
+        "aceleracion": round(t_filas / t_vectorizado, 1),
+        "reducir_para_grafica_s": round(t_reducir, 5),
+        "puntos_por_grafica": len(indices)
+    }
+    print(f"📥 Carga anterior:  {t_carga_anterior * 1e3:10.1f} ms  "
+          f"{resultados['bytes_por_registro_tipos_por_defecto']:7.1f} B/registro")
+    print(f"📥 Carga compacta:  {t_carga * 1e3:10.1f} ms  "
+          f"{resultados['bytes_por_registro_tipos_compactos']:7.1f} B/registro")
+    print(f"🐢 Por filas:       {t_filas * 1e3:10.1f} ms")
+    print(f"🚀 Vectorizado:     {t_vectorizado * 1e3:10.2f} ms  ({resultados['aceleracion']}x)")
+    print(f"📉 Reducción:       {t_reducir * 1e3:10.2f} ms  {args.filas} → {len(indices)} puntos por gráfica")
+    print(json.dumps(resultados, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+        print(f"💾 Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Generador de carga y prueba de resistencia (soak) para el servidor TCP del simulador.
+
+Abre muchas conexiones concurrentes con asyncio y repite patrones de comandos
+(START_TRACK_N, STATUS, STOP_SIMULATION) con tres formas de envío:
+  - simple:    un comando y se espera su respuesta
+  - pipelined: varios comandos seguidos sin esperar, luego se leen las respuestas
+  - coalesced: varios comandos en un solo envío, separados por salto de línea
+               (como los junta TCP cuando una estación envía muy rápido)
+
+Cada comando debería recibir una respuesta (OK/ERROR/INFO). Se reportan por intervalo
+y al final: latencia p50/p99, comandos por segundo, respuestas ERROR, comandos sin
+respuesta (perdidos), errores de conexión y, si se conoce el PID del servidor, los
+hilos y la memoria (RSS) del proceso para detectar crecimiento en corridas largas.
+
+Ejemplos:
+    python carga_tcp.py --spawn-server --connections 2000 --duration 600
+    python carga_tcp.py --port 8080 --server-pid 1234 --connections 500 --mix status=1
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from Carrito import TRACK_TYPES
+
+# Cada línea del servidor es la respuesta a un comando (OK/ERROR/INFO, o el JSON de METRICS),
+# salvo las notificaciones LAP, que llegan sin pedirlas
+LAP_PREFIX = b"LAP: "
+ERROR_PREFIX = b"ERROR: "
+
+# Servidor sin GUI para --spawn-server (sin guardar vueltas en disco)
+SERVER_SNIPPET = (
+    "import sys\n"
+    "from Carrito import TCPServer\n"
+    "TCPServer('localhost', int(sys.argv[1]), gui=False, lap_store=None).start_server()\n"
+)
+
+
+def parse_weights(text):
+    """Convierte 'a=0.8,b=0.2' en {'a': 0.8, 'b': 0.2}"""
+    weights = {}
+    for item in text.split(","):
+        name, _, value = item.partition("=")
+        weights[name.strip()] = float(value)
+    return weights
+
+
+def process_stats(pid):
+    """Hilos y memoria residente (MB) de un proceso, leídos de /proc (solo Linux)"""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None
+    return {
+        "threads": int(fields["Threads"]),
+        "rss_mb": round(int(fields["VmRSS"].split()[0]) / 1024, 1)
+    }
+
+
+class LoadStats:
+    """Contadores de la carga; solo los modifica el bucle de asyncio (un hilo)"""
+
+    def __init__(self):
+        self.open_connections = 0
+        self.connect_errors = 0
+        self.connection_resets = 0
+        self.connect_times = []
+        self.sent = 0
+        self.replies = 0
+        self.error_replies = 0
+        self.dropped = 0
+        self.lap_notifications = 0
+        self.latencies = []         # Del intervalo actual
+        self.all_latencies = []     # De toda la corrida (muestras por intervalo)
+        self.interval_sent = 0
+
+    def take_interval(self):
+        """Retorna y reinicia las latencias y envíos del intervalo"""
+        latencies, sent = self.latencies, self.interval_sent
+        self.latencies, self.interval_sent = [], 0
+        self.all_latencies.extend(latencies)
+        return latencies, sent
+
+
+def pick_commands(rng, count, mix, tracks):
+    """Elige `count` comandos según los pesos de --mix"""
+    names = list(mix)
+    weights = np.array([mix[name] for name in names])
+    commands = []
+    for name in rng.choice(names, size=count, p=weights / weights.sum()):
+        if name == "start":
+            commands.append(f"START_TRACK_{rng.choice(tracks)}")
+        elif name == "stop":
+            commands.append("STOP_SIMULATION")
+        else:
+            commands.append("STATUS")
+    return commands
+
+
+async def read_replies(reader, expected, sent_at, timeout, stats):
+    """Lee respuestas línea por línea hasta recibir `expected` o agotar el tiempo; retorna
+    cuántas llegaron. Una línea partida entre lecturas queda en el buffer del StreamReader
+    hasta que llega su salto de línea."""
+    received = 0
+    deadline = sent_at + timeout
+    while received < expected:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        try:
+            line = await asyncio.wait_for(reader.readline(), remaining)
+        except asyncio.TimeoutError:
+            break
+        if not line.endswith(b"\n"):
+            raise ConnectionResetError("El servidor cerró la conexión")
+        if not line.strip():
+            continue
+        if line.startswith(LAP_PREFIX):
+            stats.lap_notifications += 1
+            continue
+        received += 1
+        stats.replies += 1
+        stats.latencies.append(time.perf_counter() - sent_at)
+        if line.startswith(ERROR_PREFIX):
+            stats.error_replies += 1
+    return received
+
+
+async def run_client(index, args, stats, stop_at):
+    """Una conexión: envía lotes de comandos hasta el final de la corrida"""
+    rng = np.random.default_rng(args.seed + index)
+    modes = list(args.modes)
+    mode_weights = np.array([args.modes[m] for m in modes])
+    mode_weights = mode_weights / mode_weights.sum()
+
+    await asyncio.sleep(args.ramp * index / max(1, args.connections))
+    while time.monotonic() < stop_at:
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(args.host, args.port), args.timeout)
+        except (OSError, asyncio.TimeoutError):
+            stats.connect_errors += 1
+            await asyncio.sleep(1.0)
+            continue
+        stats.connect_times.append(time.perf_counter() - start)
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stats.open_connections += 1
+
+        try:
+            while time.monotonic() < stop_at:
+                mode = rng.choice(modes, p=mode_weights)
+                commands = pick_commands(rng, 1 if mode == "simple" else args.batch, args.mix, args.tracks)
+                sent_at = time.perf_counter()
+                if mode == "coalesced":
+                    writer.write("".join(command + "\n" for command in commands).encode("utf-8"))
+                    await writer.drain()
+                else:
+                    for command in commands:
+                        writer.write((command + "\n").encode("utf-8"))
+                        await writer.drain()
+                stats.sent += len(commands)
+                stats.interval_sent += len(commands)
+
+                received = await read_replies(reader, len(commands), sent_at, args.timeout, stats)
+                if received < len(commands):
+                    stats.dropped += len(commands) - received
+                    # Respuestas tardías se confundirían con las del siguiente lote: reconectar
+                    break
+                await asyncio.sleep(rng.exponential(args.think))
+        except (OSError, ConnectionResetError):
+            stats.connection_resets += 1
+        finally:
+            stats.open_connections -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+def percentile_ms(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else None
+
+
+async def report(args, stats, stop_at, history):
+    """Imprime un resumen por intervalo mientras dura la corrida"""
+    print(f"{'t (s)':>6} {'conex':>6} {'cmd/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'ERROR':>7} "
+          f"{'perdidos':>8} {'err conex':>9} {'hilos':>6} {'RSS MB':>7}")
+    start = time.monotonic()
+    while time.monotonic() < stop_at:
+        await asyncio.sleep(args.report_interval)
+        latencies, sent = stats.take_interval()
+        server = process_stats(args.server_pid) or {}
+        row = {
+            "t": round(time.monotonic() - start, 1),
+            "connections": stats.open_connections,
+            "commands_per_sec": round(sent / args.report_interval, 1),
+            "p50_ms": percentile_ms(latencies, 50),
+            "p99_ms": percentile_ms(latencies, 99),
+            "error_replies": stats.error_replies,
+            "dropped": stats.dropped,
+            "connect_errors": stats.connect_errors,
+            "server_threads": server.get("threads"),
+            "server_rss_mb": server.get("rss_mb")
+        }
+        history.append(row)
+        print(f"{row['t']:>6} {row['connections']:>6} {row['commands_per_sec']:>8} {str(row['p50_ms']):>8} "
+              f"{str(row['p99_ms']):>8} {row['error_replies']:>7} {row['dropped']:>8} {row['connect_errors']:>9} "
+              f"{str(row['server_threads']):>6} {str(row['server_rss_mb']):>7}")
+
+
+async def run_load(args):
+    stats = LoadStats()
+    history = []
+    stop_at = time.monotonic() + args.duration
+    clients = [run_client(i, args, stats, stop_at) for i in range(args.connections)]
+    await asyncio.gather(report(args, stats, stop_at, history), *clients)
+    stats.take_interval()
+    return stats, history
+
+
+def spawn_server(port):
+    """Inicia un servidor sin GUI en otro proceso y espera a que acepte conexiones"""
+    process = subprocess.Popen(
+        [sys.executable, "-c", SERVER_SNIPPET, str(port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("El servidor no empezó a aceptar conexiones")
+
+
+def raise_fd_limit():
+    """Sube el límite de descriptores abiertos al máximo permitido (miles de sockets)"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga y prueba de resistencia del servidor TCP del simulador")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--spawn-server", action="store_true", help="Iniciar un servidor sin GUI en otro proceso")
+    parser.add_argument("--server-pid", type=int, default=None, help="PID del servidor para medir hilos y memoria")
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=60.0, help="Duración de la corrida (s)")
+    parser.add_argument("--ramp", type=float, default=10.0, help="Segundos para abrir todas las conexiones")
+    parser.add_argument("--think", type=float, default=1.0, help="Pausa media (s) entre lotes de cada conexión")
+    parser.add_argument("--batch", type=int, default=4, help="Comandos por lote en los modos pipelined y coalesced")
+    parser.add_argument("--mix", type=parse_weights, default=parse_weights("status=0.8,start=0.19,stop=0.01"),
+                        help="Pesos de los comandos, ej. status=0.8,start=0.19,stop=0.01")
+    parser.add_argument("--modes", type=parse_weights, default=parse_weights("simple=0.7,pipelined=0.2,coalesced=0.1"),
+                        help="Pesos de las formas de envío, ej. simple=0.7,pipelined=0.2,coalesced=0.1")
+    parser.add_argument("--tracks", type=int, nargs="+", default=list(TRACK_TYPES))
+    parser.add_argument("--timeout", type=float, default=5.0, help="Espera máxima (s) por las respuestas de un lote")
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Guardar el resumen y los intervalos en JSON")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    server = None
+    if args.spawn_server:
+        server = spawn_server(args.port)
+        args.server_pid = server.pid
+    before = process_stats(args.server_pid)
+
+    print(f"🚀 {args.connections} conexiones contra {args.host}:{args.port} durante {args.duration:.0f} s")
+    try:
+        stats, history = asyncio.run(run_load(args))
+        # Después de cerrar las conexiones los hilos del servidor deberían volver a su nivel inicial
+        time.sleep(2.0)
+        after = process_stats(args.server_pid)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    summary = {
+        "sent": stats.sent,
+        "replies": stats.replies,
+        "error_replies": stats.error_replies,
+        "dropped": stats.dropped,
+        "dropped_rate": round(stats.dropped / stats.sent, 4) if stats.sent else 0.0,
+        "error_rate": round(stats.error_replies / stats.sent, 4) if stats.sent else 0.0,
+        "connect_errors": stats.connect_errors,
+        "connection_resets": stats.connection_resets,
+        "lap_notifications": stats.lap_notifications,
+        "p50_ms": percentile_ms(stats.all_latencies, 50),
+        "p99_ms": percentile_ms(stats.all_latencies, 99),
+        "connect_p99_ms": percentile_ms(stats.connect_times, 99),
+        "server_before": before,
+        "server_peak_threads": max((row["server_threads"] or 0 for row in history), default=None),
+        "server_peak_rss_mb": max((row["server_rss_mb"] or 0 for row in history), default=None),
+        "server_after": after
+    }
+    print("📋 Resumen:")
+    for key, value in summary.items():
+        print(f"   {key}: {value}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items()}, "summary": summary, "intervals": history},
+                      f, indent=2)
+        print(f"💾 Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
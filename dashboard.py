@@ -2,14 +2,23 @@ import streamlit as st
 import pandas as pd
 import firebase_admin
 from firebase_admin import credentials, db
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
 import plotly.express as px
+import io
 import json
+import threading
+import time
 import requests # Para API de DeepSeek
 from gtts import gTTS # Para Text-to-Speech
 import tempfile # Para manejar archivos temporales para gTTS
 import base64 # Para codificar audio para HTML
 
+from monedero_datos import (DPI_GRAFICAS, GRANULARIDADES, TAMANO_GRAFICAS, VALORES_MONEDAS, AlmacenMonedero,
+                            extraer_registros, indices_por_fecha, memoria_por_registro, pagina_reciente, preprocesar,
+                            reducir_para_grafica)
+from perfilador import PerfiladorEtapas, etapa
+
 # ───────────────────────────────────────────────────────────────────────────────
 # CONFIGURACIÓN DE LA PÁGINA
 # ───────────────────────────────────────────────────────────────────────────────
@@ -20,12 +29,21 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Configuración de valores de monedas colombianas (constante global)
-VALORES_MONEDAS = {
-    "caja1": {"valor": 50, "nombre": "50 pesos"},
-    "caja2": {"valor": 200, "nombre": "200 pesos"},
-    "caja3": {"valor": 1000, "nombre": "1000 pesos"}
-}
+# Segundos que una sesión espera la carga inicial de Firebase
+TIEMPO_ESPERA_DATOS = 20
+# Segundos mínimos entre guardados de la caché local de /Monedero
+INTERVALO_GUARDADO_CACHE = 60
+# Segundos entre consultas de registros nuevos cuando se partió de la caché local
+INTERVALO_CONSULTA_FIREBASE = 5
+# Gráficas ya dibujadas que se guardan entre ejecuciones; al llenarse se descartan las más viejas
+MAX_GRAFICAS_EN_CACHE = 64
+# Cubetas (minutos, horas o días) que muestra la sección de actividad por periodo
+MAX_CUBETAS_ACTIVIDAD = 300
+NOMBRES_GRANULARIDAD = {"minuto": "Minuto", "hora": "Hora", "dia": "Día"}
+# Opciones de filas por página de la tabla de datos crudos
+FILAS_POR_PAGINA = [50, 100, 250, 500]
+# Ejecuciones de la página sobre las que se calculan los percentiles de cada etapa
+VENTANA_PERFIL = 200
 
 # ───────────────────────────────────────────────────────────────────────────────
 # CONFIGURACIÓN DEL MENÚ LATERAL (SIDEBAR)
@@ -73,6 +91,9 @@ with st.sidebar:
         except Exception as e: # Otro error
             st.error(f"❌ Error al leer API Key DeepSeek: {e}")
 
+    st.markdown("---")
+    mostrar_rendimiento = st.checkbox("⏱️ Mostrar rendimiento por etapa", value=False)
+
 
 # ───────────────────────────────────────────────────────────────────────────────
 # FUNCIONES AUXILIARES
@@ -96,76 +117,104 @@ def formatear_pesos(cantidad):
     """Formatea una cantidad numérica como pesos colombianos (COP)."""
     return f"${cantidad:,.0f} COP"
 
-@st.cache_data(ttl=300) # Cachear los datos por 5 minutos para optimizar
-def cargar_datos_firebase():
+def conectar_firebase():
     """
-    Carga los datos desde Firebase Realtime Database.
-    Utiliza st.cache_data para evitar recargas innecesarias y mejorar el rendimiento.
-    Los secretos de Firebase se leen de st.secrets, ideal para Streamlit Cloud.
+    Inicializa la app de Firebase (una sola vez) con los secretos de Streamlit,
+    ideal para Streamlit Cloud. Retorna la URL de la base de datos.
     """
-    try:
-        # Configuración Firebase usando Secrets de Streamlit
-        # Es crucial que estos secretos estén configurados en Streamlit Cloud
-        firebase_config_secrets = st.secrets["firebase"]
-        # El contenido de 'credentials' debe ser el string JSON de la cuenta de servicio
-        firebase_credentials_str = firebase_config_secrets["credentials"]
-        firebase_credentials_dict = json.loads(firebase_credentials_str)
-        database_url = firebase_config_secrets["database_url"]
-
-        # Inicializar la app de Firebase solo si no ha sido inicializada antes
-        if not firebase_admin._apps:
-            cred = credentials.Certificate(firebase_credentials_dict)
-            firebase_admin.initialize_app(cred, {
-                "databaseURL": database_url
-            })
-
-        # Referencia a la ruta donde están los datos en Firebase
-        # ASEGÚRATE DE QUE "/Monedero" ES LA RUTA CORRECTA EN TU BASE DE DATOS
-        ref = db.reference("/Monedero")
-        datos = ref.get()
+    # Es crucial que estos secretos estén configurados en Streamlit Cloud
+    firebase_config_secrets = st.secrets["firebase"]
+    # El contenido de 'credentials' debe ser el string JSON de la cuenta de servicio
+    firebase_credentials_str = firebase_config_secrets["credentials"]
+    firebase_credentials_dict = json.loads(firebase_credentials_str)
+    database_url = firebase_config_secrets["database_url"]
+
+    # Inicializar la app de Firebase solo si no ha sido inicializada antes
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(firebase_credentials_dict)
+        firebase_admin.initialize_app(cred, {
+            "databaseURL": database_url
+        })
+    return database_url
 
-        registros = []
-        if isinstance(datos, dict):
-            for _, valor in datos.items(): # La clave (push ID) no se usa directamente en el DataFrame
-                if isinstance(valor, dict):
-                    registros.append(valor)
-                elif isinstance(valor, list): # Si algún nodo es una lista de registros
-                    registros.extend(item for item in valor if isinstance(item, dict))
-        elif isinstance(datos, list): # Si la raíz "/Monedero" es directamente una lista
-             registros.extend(item for item in datos if isinstance(item, dict))
+@st.cache_resource
+def almacen_monedero():
+    """
+    Almacén de registros compartido por todas las sesiones del servidor y por el chatbot.
+    Se crea una sola vez por proceso y se mantiene actualizado en segundo plano, así las
+    sesiones no consultan Firebase por su cuenta:
+    - Sin caché local: un listener de Firebase (db.Reference.listen) trae el árbol completo
+      y luego cada registro nuevo apenas el ESP8266 lo sube.
+    - Con caché de una ejecución anterior: se parte de ella y cada INTERVALO_CONSULTA_FIREBASE
+      segundos se piden solo los registros posteriores a la última clave. No se usa listen():
+      no acepta consultas y su primer evento volvería a descargar todo /Monedero.
+    """
+    database_url = conectar_firebase()
+    # ASEGÚRATE DE QUE "/Monedero" ES LA RUTA CORRECTA EN TU BASE DE DATOS
+    referencia = db.reference("/Monedero")
 
+    def guardar_cache():
+        try:
+            almacen.guardar(origen=database_url, intervalo=INTERVALO_GUARDADO_CACHE)
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar la caché de /Monedero: {e}")
 
-        if not registros:
-            return pd.DataFrame(), "ℹ️ No se encontraron registros en la base de datos."
+    almacen = AlmacenMonedero.desde_cache(origen=database_url)
+    if almacen is None:
+        almacen = AlmacenMonedero()
 
-        df = pd.DataFrame(registros)
+        def al_recibir_evento(evento):
+            almacen.aplicar_evento(evento.event_type, evento.path, evento.data)
+            guardar_cache()
 
-        # Asegurar que las columnas esperadas existan antes de procesar
-        columnas_requeridas_conteo = ["conteo_caja1", "conteo_caja2", "conteo_caja3"]
-        columnas_requeridas_peso = ["caja1", "caja2", "caja3"]
-        
-        # Convertir columnas de conteo y peso a numérico, errores a NaN para luego rellenar
-        for col in columnas_requeridas_conteo + columnas_requeridas_peso + ["conteo_global", "errores_clasificacion"]:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int if "conteo" in col else float)
-            else: # Si la columna no existe, la crea con ceros
-                df[col] = 0 if "conteo" in col else 0.0
+        almacen.listener = referencia.listen(al_recibir_evento)
+        return almacen
 
+    def traer_registros_nuevos():
+        datos = referencia.order_by_key().start_at(almacen.ultima_clave).get()
+        if isinstance(datos, dict):
+            # start_at incluye la última clave ya guardada: descartarla
+            datos.pop(almacen.ultima_clave, None)
+        almacen.agregar(*extraer_registros(datos))
+        guardar_cache()
+
+    def consultar_periodicamente():
+        while True:
+            time.sleep(INTERVALO_CONSULTA_FIREBASE)
+            try:
+                traer_registros_nuevos()
+            except Exception as e:
+                print(f"⚠️ No se pudieron consultar los registros nuevos de /Monedero: {e}")
+
+    traer_registros_nuevos()
+    almacen.sincronizado.set()
+    threading.Thread(target=consultar_periodicamente, daemon=True).start()
+    return almacen
+
+@st.cache_resource
+def perfilador_etapas():
+    """Perfilador compartido por todas las sesiones: tiempos por etapa de cada ejecución de la página"""
+    return PerfiladorEtapas(ventana=VENTANA_PERFIL)
 
-        if "fecha_hora_recoleccion" in df.columns:
-            df["Fecha"] = pd.to_datetime(df["fecha_hora_recoleccion"], errors='coerce')
-            df = df.sort_values("Fecha").dropna(subset=["Fecha"]) # Eliminar filas donde la fecha no se pudo parsear
-        else:
-            # Si no hay fecha, no se puede ordenar ni graficar por tiempo de forma fiable
+def cargar_datos_firebase():
+    """
+    Entrega los datos del almacén que se mantiene actualizado desde Firebase en segundo plano.
+    La primera sesión del proceso espera hasta TIEMPO_ESPERA_DATOS segundos la carga inicial.
+    El DataFrame retornado es compartido entre sesiones: no se debe modificar en el sitio.
+    """
+    try:
+        with etapa("firebase"):
+            almacen = almacen_monedero()
+            sincronizado = almacen.sincronizado.wait(TIEMPO_ESPERA_DATOS)
+        if not sincronizado:
+            return pd.DataFrame(), "⏳ Esperando la carga inicial de datos desde Firebase..."
+        with etapa("dataframe"):
+            df = almacen.dataframe()
+
+        if df.empty:
+            return pd.DataFrame(), "ℹ️ No se encontraron registros en la base de datos."
+        if df["Fecha"].isna().all():
             st.warning("⚠️ Columna 'fecha_hora_recoleccion' no encontrada. Algunas gráficas y ordenamientos pueden no funcionar.")
-            df["Fecha"] = pd.NaT # Añadir columna de fecha vacía para evitar errores posteriores
-
-        # Calcular valores monetarios para cada fila
-        df["valor_caja1"] = df["conteo_caja1"] * VALORES_MONEDAS["caja1"]["valor"]
-        df["valor_caja2"] = df["conteo_caja2"] * VALORES_MONEDAS["caja2"]["valor"]
-        df["valor_caja3"] = df["conteo_caja3"] * VALORES_MONEDAS["caja3"]["valor"]
-        df["valor_total"] = df["valor_caja1"] + df["valor_caja2"] + df["valor_caja3"]
-
         return df, "✅ Datos cargados y procesados correctamente desde Firebase."
 
     except json.JSONDecodeError as e:
@@ -175,43 +224,61 @@ def cargar_datos_firebase():
         st.error(f"❌ Error al cargar datos de Firebase: {e}")
         return pd.DataFrame(), f"❌ Error al cargar datos: {e}"
 
-def corregir_ceros(df_local, columna):
+def graficar_serie(fig, ax, fechas, valores, **estilo):
     """
-    Función para corregir valores anómalos (decrecientes) en mediciones de conteo o peso acumulado.
-    Asume que estos valores solo deben aumentar o mantenerse.
+    Dibuja la serie en ax reducida al ancho en píxeles de la figura (reducir_para_grafica):
+    el tiempo de dibujo no crece con el historial y la línea se ve igual.
     """
-    if columna not in df_local.columns or df_local[columna].empty:
-        return df_local # Retorna el DataFrame sin cambios si la columna no existe o está vacía
-
-    valores_corregidos = df_local[columna].copy()
-    maximo_hasta_ahora = valores_corregidos.iloc[0] if not valores_corregidos.empty else 0
-
-    for i in range(1, len(valores_corregidos)):
-        valor_actual = valores_corregidos.iloc[i]
-        if valor_actual < maximo_hasta_ahora:
-            # Si el valor actual es menor que el máximo visto, se asume un error
-            # y se corrige al máximo anterior.
-            # La lógica original de 'variable' y 'variable >= 2' parece muy específica
-            # y podría necesitar revisión si el comportamiento no es el esperado.
-            # Simplificando: si es menor, se iguala al anterior.
-            # Si se quiere la lógica original:
-            # valores_corregidos.iloc[i] = maximo_hasta_ahora
-            # if valor_actual >= 2: # Esta condición parece extraña para una corrección general
-            #     valores_corregidos.iloc[i] += 1 # Incrementa en 1 si era >= 2 y menor que el máximo
-            
-            # Lógica simplificada más robusta:
-            valores_corregidos.iloc[i] = maximo_hasta_ahora
-        
-        maximo_hasta_ahora = valores_corregidos.iloc[i]
+    indices = reducir_para_grafica(fechas.to_numpy(), valores.to_numpy(), int(fig.get_figwidth() * fig.dpi))
+    ax.plot(fechas.iloc[indices], valores.iloc[indices], **estilo)
 
-    df_local[columna] = valores_corregidos
-    return df_local
+@st.cache_data(max_entries=MAX_GRAFICAS_EN_CACHE, show_spinner=False)
+def imagen_serie(version, id_grafica, rango, _fechas, _valores, titulo, etiqueta_y, pesos=False, color=None, linewidth=1.5):
+    """
+    PNG de una gráfica histórica, en caché por (versión de los datos, gráfica, rango de
+    fechas): mientras no lleguen datos nuevos, volver a ejecutar la página (un clic, un
+    mensaje del chat) no vuelve a dibujar. _fechas y _valores no son parte de la clave.
+    Se usa Figure directamente y no pyplot: la figura no queda abierta en pyplot (se
+    libera al terminar) y se puede dibujar desde las sesiones, que corren en hilos distintos.
+    """
+    fig = Figure(figsize=TAMANO_GRAFICAS, dpi=DPI_GRAFICAS)
+    ax = fig.subplots()
+    graficar_serie(fig, ax, _fechas, _valores, marker=".", linestyle="-", linewidth=linewidth, color=color)
+    ax.set_title(titulo)
+    ax.set_xlabel("Fecha")
+    ax.set_ylabel(etiqueta_y)
+    if pesos:
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'${x:,.0f}'))
+    ax.grid(True, linestyle='--', alpha=0.7)
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+    imagen = io.BytesIO()
+    fig.savefig(imagen, format="png", bbox_inches="tight")
+    return imagen.getvalue()
+
+@st.cache_data(max_entries=MAX_GRAFICAS_EN_CACHE, show_spinner=False)
+def figura_barras(nombres, valores, etiqueta_y, titulo_eje_y, escala):
+    """Gráfica de barras de Plotly por caja, en caché por sus valores"""
+    fig = px.bar(
+        x=list(nombres), y=list(valores),
+        labels={"x": "Tipo de Caja", "y": etiqueta_y},
+        color=list(valores), color_continuous_scale=escala
+    )
+    fig.update_layout(xaxis_title="", yaxis_title=titulo_eje_y)
+    return fig
 
-def generar_resumen_proyecto(df_resumen):
+@st.cache_data(max_entries=MAX_GRAFICAS_EN_CACHE, show_spinner=False)
+def figura_torta(nombres, valores):
+    """Gráfica de torta (donut) de Plotly por caja, en caché por sus valores"""
+    return px.pie(values=list(valores), names=list(nombres), hole=0.3) # hole: efecto donut
+
+def generar_resumen_proyecto(df_resumen, agregados_dia=None):
     """
     Genera un resumen en formato de texto del estado actual del proyecto.
     Este texto será usado como contexto para el chatbot.
     El LLM "leerá" este texto plano para entender el estado.
+    agregados_dia (cubetas diarias del almacén) agrega la actividad de los últimos días
+    sin recorrer todos los registros.
     """
     if df_resumen.empty:
         return "No hay datos disponibles del proyecto para generar un resumen."
@@ -233,6 +300,11 @@ def generar_resumen_proyecto(df_resumen):
 
     fecha_min_str = df_resumen['Fecha'].min().strftime('%Y-%m-%d %H:%M') if 'Fecha' in df_resumen.columns and not df_resumen['Fecha'].empty and pd.notna(df_resumen['Fecha'].min()) else 'N/A'
     fecha_max_str = df_resumen['Fecha'].max().strftime('%Y-%m-%d %H:%M') if 'Fecha' in df_resumen.columns and not df_resumen['Fecha'].empty and pd.notna(df_resumen['Fecha'].max()) else 'N/A'
+
+    actividad_str = "\n".join(
+        f"    - {fila.Fecha:%Y-%m-%d}: {fila.monedas:,} monedas depositadas, {formatear_pesos(fila.valor)} agregados, {fila.errores} errores"
+        for fila in agregados_dia.tail(7).itertuples()
+    ) if agregados_dia is not None and not agregados_dia.empty else "    - Sin datos por día"
     
     # Construcción del texto de resumen.
     # Este formato es para que el LLM lo entienda bien.
@@ -260,6 +332,9 @@ def generar_resumen_proyecto(df_resumen):
     - Peso Caja 2: {ultimo_registro.get('caja2', 0.0):.2f} gramos
     - Peso Caja 3: {ultimo_registro.get('caja3', 0.0):.2f} gramos
 
+    ACTIVIDAD POR DIA (ultimos 7 dias con registros):
+{actividad_str}
+
     ESTADO DEL SISTEMA:
     - Numero de errores de clasificacion registrados: {int(ultimo_registro.get('errores_clasificacion', 0))}
     - Estado general del sistema: Operativo y recolectando datos.
@@ -388,22 +463,14 @@ def mostrar_dashboard():
         return # No continuar si no hay datos
     else:
         st.success(mensaje_carga)
-
-    # Aplicar correcciones a los datos (si es necesario y la lógica es validada)
-    # Esta función 'corregir_ceros' debe ser bien entendida. Si asume que los conteos
-    # siempre son crecientes, puede enmascarar problemas reales si hay reseteos.
-    # Considera si esta corrección es siempre deseable.
-    columnas_a_corregir_dashboard = ["conteo_caja1", "conteo_caja2", "conteo_caja3",
-                                     "caja1", "caja2", "caja3", "conteo_global"]
-    for col_corr in columnas_a_corregir_dashboard:
-        if col_corr in df.columns:
-            df = corregir_ceros(df.copy(), col_corr) # Usar .copy() para evitar SettingWithCopyWarning
-
-    # Recalcular valores monetarios después de posibles correcciones
-    df["valor_caja1"] = df["conteo_caja1"] * VALORES_MONEDAS["caja1"]["valor"]
-    df["valor_caja2"] = df["conteo_caja2"] * VALORES_MONEDAS["caja2"]["valor"]
-    df["valor_caja3"] = df["conteo_caja3"] * VALORES_MONEDAS["caja3"]["valor"]
-    df["valor_total"] = df["valor_caja1"] + df["valor_caja2"] + df["valor_caja3"]
+        st.caption(f"🗃️ {len(df):,} registros en memoria · {memoria_por_registro(df):.0f} bytes por registro")
+
+    version_datos = df.attrs.get("version")
+    # Corregir las mediciones acumuladas que bajan y calcular los valores monetarios.
+    # La corrección asume que los conteos siempre son crecientes: si hay reseteos reales
+    # del contador, quedarán enmascarados.
+    with etapa("preprocesar"):
+        df = preprocesar(df)
     
     st.markdown(f"""
     Este dashboard presenta los datos y mediciones del proyecto de Internet de las Cosas (IoT) 
@@ -470,70 +537,103 @@ def mostrar_dashboard():
             delta_color="off"
         )
 
+    # Rango de fechas para la tabla, las gráficas históricas y la actividad por periodo.
+    # Los registros están ordenados por Fecha: el rango se ubica por búsqueda binaria y
+    # df_rango es solo esa ventana
+    df_rango = df
+    desde = hasta = None
+    if df["Fecha"].notna().any():
+        st.subheader("🗓️ Rango de Fechas")
+        primera_fecha, ultima_fecha = df["Fecha"].iloc[0].date(), df["Fecha"].iloc[-1].date()
+        # Los widgets se controlan desde st.session_state con claves fijas y sin valores que
+        # dependan de los datos: así la selección no se reinicia cuando llegan registros nuevos.
+        # Si el rango terminaba en el último día con datos, sigue al día nuevo.
+        rango_guardado = st.session_state.get("rango_fechas")
+        if not rango_guardado:
+            st.session_state["rango_fechas"] = (primera_fecha, ultima_fecha)
+        elif rango_guardado[-1] == st.session_state.get("ultima_fecha_datos") and ultima_fecha > rango_guardado[-1]:
+            st.session_state["rango_fechas"] = (rango_guardado[0], ultima_fecha)
+        st.session_state["ultima_fecha_datos"] = ultima_fecha
+        seleccion_fechas = st.date_input("Mostrar registros entre", key="rango_fechas")
+        st.caption(f"Hay datos del {primera_fecha} al {ultima_fecha}")
+        if seleccion_fechas: # Mientras se elige el rango, date_input entrega una sola fecha
+            desde = pd.Timestamp(seleccion_fechas[0])
+            hasta = pd.Timestamp(seleccion_fechas[-1]) + pd.Timedelta(days=1) # Incluir todo el último día
+            inicio, fin = indices_por_fecha(df["Fecha"].to_numpy(), desde, hasta)
+            df_rango = df.iloc[inicio:fin]
+
+    # Tabla paginada: solo se envía al navegador la página visible (más reciente primero)
     st.subheader("📄 Tabla de Datos Crudos (Firebase Realtime Database)")
-    st.dataframe(df.sort_values("Fecha", ascending=False), use_container_width=True, height=300) # Mostrar más reciente primero
+    col_tabla1, col_tabla2 = st.columns(2)
+    with col_tabla1:
+        filas_por_pagina = st.selectbox("Filas por página", FILAS_POR_PAGINA, index=1, key="filas_por_pagina")
+    total_paginas = max(1, -(-len(df_rango) // filas_por_pagina))
+    with col_tabla2:
+        # Sin max_value (cambia con los datos): una página fuera de rango se muestra como la última
+        numero_pagina = min(int(st.number_input("Página (1 = más reciente)", min_value=1, step=1, key="pagina_tabla")),
+                            total_paginas)
+    with etapa("tabla"):
+        st.dataframe(pagina_reciente(df_rango, numero_pagina - 1, filas_por_pagina), use_container_width=True, height=300)
+    st.caption(f"Página {numero_pagina} de {total_paginas} · {len(df_rango):,} registros en el rango")
 
     # Gráficas
-    if "Fecha" in df.columns and not df["Fecha"].isnull().all():
-        st.subheader("📈 Visualización de Mediciones Históricas")
-        tab_conteo, tab_valor, tab_peso = st.tabs(["📊 Conteo de Monedas", "💰 Valores Monetarios", "⚖️ Peso por Caja"])
-
-        with tab_conteo:
-            st.markdown("#### Evolución del Conteo de Monedas por Caja")
-            for i, col_conteo in enumerate(["conteo_caja1", "conteo_caja2", "conteo_caja3"], 1):
-                if col_conteo in df.columns:
-                    fig_conteo, ax_conteo = plt.subplots(figsize=(10, 4))
-                    ax_conteo.plot(df["Fecha"], df[col_conteo], marker=".", linestyle="-", linewidth=1.5)
-                    ax_conteo.set_title(f"Conteo Caja {i} ({VALORES_MONEDAS[f'caja{i}']['nombre']}) vs. Fecha")
-                    ax_conteo.set_xlabel("Fecha")
-                    ax_conteo.set_ylabel("Cantidad de Monedas")
-                    ax_conteo.grid(True, linestyle='--', alpha=0.7)
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
-                    st.pyplot(fig_conteo)
-
-        with tab_valor:
-            st.markdown("#### Evolución del Valor Monetario Acumulado")
-            if "valor_total" in df.columns:
-                fig_vt, ax_vt = plt.subplots(figsize=(10, 4))
-                ax_vt.plot(df["Fecha"], df["valor_total"], marker=".", linestyle="-", linewidth=2, color="green")
-                ax_vt.set_title("Valor Total Acumulado (Todas las Cajas) vs. Fecha")
-                ax_vt.set_xlabel("Fecha")
-                ax_vt.set_ylabel("Valor (COP)")
-                ax_vt.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x:,.0f}'))
-                ax_vt.grid(True, linestyle='--', alpha=0.7)
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                st.pyplot(fig_vt)
-
-            for i, col_val in enumerate(["valor_caja1", "valor_caja2", "valor_caja3"], 1):
-                if col_val in df.columns:
-                    fig_val_caja, ax_val_caja = plt.subplots(figsize=(10, 4))
-                    ax_val_caja.plot(df["Fecha"], df[col_val], marker=".", linestyle="-", linewidth=1.5)
-                    ax_val_caja.set_title(f"Valor Acumulado Caja {i} ({VALORES_MONEDAS[f'caja{i}']['nombre']}) vs. Fecha")
-                    ax_val_caja.set_xlabel("Fecha")
-                    ax_val_caja.set_ylabel("Valor (COP)")
-                    ax_val_caja.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x:,.0f}'))
-                    ax_val_caja.grid(True, linestyle='--', alpha=0.7)
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
-                    st.pyplot(fig_val_caja)
+    with etapa("graficas_historicas"):
+        if "Fecha" in df_rango.columns and not df_rango["Fecha"].isnull().all():
+            st.subheader("📈 Visualización de Mediciones Históricas")
+            tab_conteo, tab_valor, tab_peso = st.tabs(["📊 Conteo de Monedas", "💰 Valores Monetarios", "⚖️ Peso por Caja"])
+            rango = (str(df_rango["Fecha"].iloc[0]), str(df_rango["Fecha"].iloc[-1]))
+
+            with tab_conteo:
+                st.markdown("#### Evolución del Conteo de Monedas por Caja")
+                for i, col_conteo in enumerate(["conteo_caja1", "conteo_caja2", "conteo_caja3"], 1):
+                    if col_conteo in df_rango.columns:
+                        st.image(imagen_serie(
+                            version_datos, col_conteo, rango, df_rango["Fecha"], df_rango[col_conteo],
+                            f"Conteo Caja {i} ({VALORES_MONEDAS[f'caja{i}']['nombre']}) vs. Fecha", "Cantidad de Monedas"
+                        ), use_container_width=True)
+
+            with tab_valor:
+                st.markdown("#### Evolución del Valor Monetario Acumulado")
+                if "valor_total" in df_rango.columns:
+                    st.image(imagen_serie(
+                        version_datos, "valor_total", rango, df_rango["Fecha"], df_rango["valor_total"],
+                        "Valor Total Acumulado (Todas las Cajas) vs. Fecha", "Valor (COP)",
+                        pesos=True, color="green", linewidth=2
+                    ), use_container_width=True)
+
+                for i, col_val in enumerate(["valor_caja1", "valor_caja2", "valor_caja3"], 1):
+                    if col_val in df_rango.columns:
+                        st.image(imagen_serie(
+                            version_datos, col_val, rango, df_rango["Fecha"], df_rango[col_val],
+                            f"Valor Acumulado Caja {i} ({VALORES_MONEDAS[f'caja{i}']['nombre']}) vs. Fecha", "Valor (COP)",
+                            pesos=True
+                        ), use_container_width=True)
         
-        with tab_peso:
-            st.markdown("#### Evolución del Peso por Caja")
-            for i, col_peso in enumerate(["caja1", "caja2", "caja3"], 1):
-                if col_peso in df.columns:
-                    fig_peso, ax_peso = plt.subplots(figsize=(10, 4))
-                    ax_peso.plot(df["Fecha"], df[col_peso], marker=".", linestyle="-", linewidth=1.5)
-                    ax_peso.set_title(f"Peso Registrado Caja {i} vs. Fecha")
-                    ax_peso.set_xlabel("Fecha")
-                    ax_peso.set_ylabel("Peso (gramos)")
-                    ax_peso.grid(True, linestyle='--', alpha=0.7)
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
-                    st.pyplot(fig_peso)
-    else:
-        st.info("ℹ️ No hay datos de fecha válidos para mostrar gráficas históricas.")
+            with tab_peso:
+                st.markdown("#### Evolución del Peso por Caja")
+                for i, col_peso in enumerate(["caja1", "caja2", "caja3"], 1):
+                    if col_peso in df_rango.columns:
+                        st.image(imagen_serie(
+                            version_datos, col_peso, rango, df_rango["Fecha"], df_rango[col_peso],
+                            f"Peso Registrado Caja {i} vs. Fecha", "Peso (gramos)"
+                        ), use_container_width=True)
+        else:
+            st.info("ℹ️ No hay datos de fecha válidos para mostrar gráficas históricas.")
+
+    # Actividad por periodo: sale de los agregados del almacén (unos cientos de cubetas),
+    # no de recorrer todos los registros
+    st.subheader("📅 Actividad por Periodo")
+    granularidad = st.radio("Agrupar por", list(GRANULARIDADES), index=1, horizontal=True,
+                            format_func=NOMBRES_GRANULARIDAD.get)
+    with etapa("actividad"):
+        agregados = almacen_monedero().consultar_agregados(granularidad, desde, hasta).tail(MAX_CUBETAS_ACTIVIDAD)
+        col_act1, col_act2 = st.columns(2)
+        with col_act1:
+            st.markdown(f"#### Monedas Depositadas por {NOMBRES_GRANULARIDAD[granularidad]}")
+            st.bar_chart(agregados, x="Fecha", y=["monedas_caja1", "monedas_caja2", "monedas_caja3"])
+        with col_act2:
+            st.markdown(f"#### Valor Agregado por {NOMBRES_GRANULARIDAD[granularidad]} (COP)")
+            st.bar_chart(agregados, x="Fecha", y="valor")
 
     # Gráficos de comparación (usando Plotly para interactividad)
     st.subheader("📊 Análisis Comparativo del Estado Actual")
@@ -552,41 +652,30 @@ def mostrar_dashboard():
             f"Caja 3 ({VALORES_MONEDAS['caja3']['nombre']})": valores_actuales_dash['caja3']
         })
 
-        with col_comp1:
-            st.markdown("#### Conteo de Monedas por Caja")
-            fig_bar_conteo = px.bar(
-                conteo_actual_cajas,
-                x=conteo_actual_cajas.index, y=conteo_actual_cajas.values,
-                labels={"x": "Tipo de Caja", "y": "Cantidad de Monedas"},
-                color=conteo_actual_cajas.values, color_continuous_scale=px.colors.sequential.Viridis
-            )
-            fig_bar_conteo.update_layout(xaxis_title="", yaxis_title="Cantidad")
-            st.plotly_chart(fig_bar_conteo, use_container_width=True)
-
-            st.markdown("#### Distribución de Monedas (Cantidad)")
-            fig_pie_conteo = px.pie(
-                values=conteo_actual_cajas.values, names=conteo_actual_cajas.index,
-                hole=0.3 # Para un efecto donut
-            )
-            st.plotly_chart(fig_pie_conteo, use_container_width=True)
-
-        with col_comp2:
-            st.markdown("#### Valor Monetario por Caja (COP)")
-            fig_bar_valor = px.bar(
-                valor_actual_cajas,
-                x=valor_actual_cajas.index, y=valor_actual_cajas.values,
-                labels={"x": "Tipo de Caja", "y": "Valor (COP)"},
-                color=valor_actual_cajas.values, color_continuous_scale=px.colors.sequential.Greens
-            )
-            fig_bar_valor.update_layout(xaxis_title="", yaxis_title="Valor (COP)")
-            st.plotly_chart(fig_bar_valor, use_container_width=True)
-
-            st.markdown("#### Distribución del Valor Monetario (%)")
-            fig_pie_valor = px.pie(
-                values=valor_actual_cajas.values, names=valor_actual_cajas.index,
-                hole=0.3
-            )
-            st.plotly_chart(fig_pie_valor, use_container_width=True)
+        with etapa("graficas_plotly"):
+            with col_comp1:
+                st.markdown("#### Conteo de Monedas por Caja")
+                fig_bar_conteo = figura_barras(
+                    tuple(conteo_actual_cajas.index), tuple(conteo_actual_cajas.values.tolist()),
+                    "Cantidad de Monedas", "Cantidad", px.colors.sequential.Viridis
+                )
+                st.plotly_chart(fig_bar_conteo, use_container_width=True)
+
+                st.markdown("#### Distribución de Monedas (Cantidad)")
+                fig_pie_conteo = figura_torta(tuple(conteo_actual_cajas.index), tuple(conteo_actual_cajas.values.tolist()))
+                st.plotly_chart(fig_pie_conteo, use_container_width=True)
+
+            with col_comp2:
+                st.markdown("#### Valor Monetario por Caja (COP)")
+                fig_bar_valor = figura_barras(
+                    tuple(valor_actual_cajas.index), tuple(valor_actual_cajas.values.tolist()),
+                    "Valor (COP)", "Valor (COP)", px.colors.sequential.Greens
+                )
+                st.plotly_chart(fig_bar_valor, use_container_width=True)
+
+                st.markdown("#### Distribución del Valor Monetario (%)")
+                fig_pie_valor = figura_torta(tuple(valor_actual_cajas.index), tuple(valor_actual_cajas.values.tolist()))
+                st.plotly_chart(fig_pie_valor, use_container_width=True)
 
         # Análisis automático simple
         if not conteo_actual_cajas.empty and not valor_actual_cajas.empty:
@@ -632,7 +721,9 @@ def mostrar_chatbot():
 
     # Cargar datos para el contexto del chatbot
     df_chat, _ = cargar_datos_firebase() # Reutilizar función de carga de datos
-    contexto_proyecto_chat = generar_resumen_proyecto(df_chat) # Generar el texto de resumen
+    with etapa("resumen"):
+        agregados_dia_chat = almacen_monedero().consultar_agregados("dia") if not df_chat.empty else None
+        contexto_proyecto_chat = generar_resumen_proyecto(df_chat, agregados_dia_chat) # Generar el texto de resumen
 
     with st.expander("📋 Ver Resumen de Datos Actuales Usado por el Asistente", expanded=False):
         st.text_area("Contexto del Proyecto:", contexto_proyecto_chat, height=300, disabled=True)
@@ -667,13 +758,15 @@ def mostrar_chatbot():
             mensaje_placeholder = st.empty() # Placeholder para efecto de "escribiendo"
             mensaje_placeholder.markdown("🤔 Consultando al oráculo de DeepSeek...")
             
-            respuesta_llm = consultar_deepseek(prompt_usuario_chat, deepseek_api_key_chat, contexto_proyecto_chat)
+            with etapa("deepseek"):
+                respuesta_llm = consultar_deepseek(prompt_usuario_chat, deepseek_api_key_chat, contexto_proyecto_chat)
             mensaje_placeholder.markdown(respuesta_llm) # Mostrar respuesta final
 
             # Generar audio para la respuesta
             audio_base64_respuesta = None
             with st.spinner("🎵 Preparando la voz del asistente..."):
-                audio_base64_respuesta = texto_a_audio_gtts(respuesta_llm)
+                with etapa("gtts"):
+                    audio_base64_respuesta = texto_a_audio_gtts(respuesta_llm)
 
             if audio_base64_respuesta:
                 reproducir_audio_html_auto(audio_base64_respuesta) # Autoplay (oculto)
@@ -714,10 +807,20 @@ def mostrar_chatbot():
 # ───────────────────────────────────────────────────────────────────────────────
 # NAVEGACIÓN PRINCIPAL DE LA APLICACIÓN
 # ───────────────────────────────────────────────────────────────────────────────
-if pagina_seleccionada == "📊 Dashboard de Monitoreo":
-    mostrar_dashboard()
-elif pagina_seleccionada == "🤖 Asistente AI del Proyecto":
-    mostrar_chatbot()
+# Cada ejecución de la página queda en el perfilador (percentiles por etapa) y en su log
+pagina_perfil = "dashboard" if pagina_seleccionada == "📊 Dashboard de Monitoreo" else "chatbot"
+with perfilador_etapas().ejecucion(pagina_perfil):
+    if pagina_seleccionada == "📊 Dashboard de Monitoreo":
+        mostrar_dashboard()
+    elif pagina_seleccionada == "🤖 Asistente AI del Proyecto":
+        mostrar_chatbot()
+
+if mostrar_rendimiento:
+    with st.sidebar:
+        st.markdown("### ⏱️ Rendimiento por Etapa")
+        st.dataframe(perfilador_etapas().percentiles(pagina_perfil), hide_index=True, use_container_width=True)
+        st.caption(f"Percentiles de las últimas {VENTANA_PERFIL} ejecuciones de cada etapa, en ms. "
+                   "Cada ejecución queda como una línea JSON en perfil_dashboard.jsonl")
 
 # ───────────────────────────────────────────────────────────────────────────────
 # FOOTER (Pie de página)
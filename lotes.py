@@ -0,0 +1,121 @@
+"""
+Ejecución por lotes de simulaciones sin GUI para ajuste y regresión del controlador.
+
+Reparte vueltas de CarLineFollower (pistas x semillas x combinaciones de ganancias)
+entre procesos con ProcessPoolExecutor. Cada proceso abre una sola conexión DIRECT
+de PyBullet y la reutiliza en todas sus vueltas.
+
+Ejemplo:
+    python lotes.py --tracks 1 2 3 --seeds 10 --param steering_gain=15,20,25 --output resultados_lotes.csv
+"""
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pybullet as p
+
+from Carrito import CarLineFollower, CONTROL_PARAMS_DEFAULT, TRACK_TYPES
+
+# Conexión de PyBullet del proceso trabajador (una por proceso)
+_physics_client = None
+
+
+def _init_worker():
+    """Abre la conexión DIRECT del proceso trabajador"""
+    global _physics_client
+    _physics_client = p.connect(p.DIRECT)
+
+
+def run_lap(job):
+    """Corre una vuelta sin GUI y retorna una fila de resultados"""
+    car = CarLineFollower(track_type=job["track"], gui=False, control_params=job["params"], seed=job["seed"])
+    # Los mensajes por paso de la simulación no se muestran en los lotes
+    with contextlib.redirect_stdout(io.StringIO()):
+        car.init_simulation(physics_client=_physics_client)
+        result = car.run_simulation()
+    car.cleanup()
+    result["seed"] = job["seed"]
+    result.update(car.control_params)
+    return result
+
+
+def build_jobs(tracks, seeds, param_grid=None):
+    """Genera una tarea por cada combinación de pista, semilla y parámetros"""
+    param_grid = param_grid or {}
+    keys = list(param_grid)
+    jobs = []
+    for values in itertools.product(*(param_grid[k] for k in keys)):
+        params = dict(zip(keys, values))
+        for track in tracks:
+            for seed in seeds:
+                jobs.append({"track": track, "seed": seed, "params": params})
+    return jobs
+
+
+def run_batch(jobs, workers=None):
+    """Ejecuta las tareas en paralelo y retorna las filas de resultados en el mismo orden"""
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        return list(executor.map(run_lap, jobs, chunksize=chunksize))
+
+
+def write_results(rows, path):
+    """Guarda la tabla de resultados en CSV"""
+    if not rows:
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_summary(rows):
+    """Muestra un resumen por pista: vueltas completadas, tiempo promedio y atascos"""
+    print(f"{'Pista':>5} {'Vueltas':>8} {'Completas':>10} {'Tiempo prom. (s)':>17} {'Atascos':>8}")
+    for track in sorted({row["track"] for row in rows}):
+        track_rows = [row for row in rows if row["track"] == track]
+        completed = [row for row in track_rows if row["completed"]]
+        mean_time = sum(row["lap_time"] for row in completed) / len(completed) if completed else float("nan")
+        stuck = sum(row["stuck_events"] for row in track_rows)
+        print(f"{track:>5} {len(track_rows):>8} {len(completed):>10} {mean_time:>17.2f} {stuck:>8}")
+
+
+def parse_param(text):
+    """Convierte 'nombre=v1,v2,...' en (nombre, [v1, v2, ...])"""
+    name, _, values = text.partition("=")
+    if name not in CONTROL_PARAMS_DEFAULT or not values:
+        raise argparse.ArgumentTypeError(
+            f"Parámetro inválido '{text}'. Use nombre=v1,v2 con nombre en {', '.join(CONTROL_PARAMS_DEFAULT)}"
+        )
+    return name, [float(v) for v in values.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulaciones por lotes sin GUI del carro seguidor de línea")
+    parser.add_argument("--tracks", type=int, nargs="+", default=list(TRACK_TYPES), choices=TRACK_TYPES)
+    parser.add_argument("--seeds", type=int, default=5, help="Número de semillas por pista")
+    parser.add_argument("--param", type=parse_param, action="append", default=[],
+                        help="Valores a probar de un parámetro del controlador, ej. steering_gain=15,20,25")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, uno por núcleo)")
+    parser.add_argument("--output", default="resultados_lotes.csv")
+    args = parser.parse_args()
+
+    jobs = build_jobs(args.tracks, range(args.seeds), dict(args.param))
+    print(f"🚀 Ejecutando {len(jobs)} vueltas sin GUI...")
+    start = time.time()
+    rows = run_batch(jobs, args.workers)
+    print(f"✅ {len(rows)} vueltas en {time.time() - start:.1f} s")
+
+    print_summary(rows)
+    write_results(rows, args.output)
+    print(f"💾 Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
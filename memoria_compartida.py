@@ -0,0 +1,194 @@
+"""
+Anillo de estado de los carros en memoria compartida (multiprocessing.shared_memory).
+
+El simulador (Carrito.py) escribe una muestra por carro y por paso de física en un
+anillo con dtype estructurado; otros procesos del mismo equipo leen las últimas N
+muestras como vistas NumPy sin copiar y sin sockets de por medio.
+
+Distribución del bloque compartido:
+    cabecera: cuatro uint64 (marca SHARED_STATE_MAGIC, muestras escritas en total,
+              capacidad, pid del simulador que escribe)
+    datos:    2 x capacidad muestras de SHARED_STATE_DTYPE
+
+Cada muestra se escribe dos veces (en k y en k + capacidad), así que cualquier tramo
+de hasta `capacidad` muestras recientes es contiguo y se entrega como un slice.
+
+Ejemplo de lectura:
+    reader = PoseRingReader()
+    ultimas, seq = reader.since(reader.sequence - 240)   # vista, sin copia
+    x, y = ultimas["x"], ultimas["y"]
+    assert reader.is_valid(ultimas, seq)
+    del ultimas
+    reader.close()
+"""
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+SHARED_STATE_NAME = "carrito_estado"  # Nombre del bloque de memoria compartida
+SHARED_STATE_CAPACITY = 4096           # Muestras en el anillo (~5.7 s con tres carros a 240 Hz)
+
+# Estado de un carro en un paso de física
+SHARED_STATE_DTYPE = np.dtype([
+    ("seq", "<u8"),             # Número de muestra; permite saber si una vista ya fue sobrescrita
+    ("t", "<f8"),               # Tiempo simulado (s)
+    ("track", "u1"),
+    ("target", "<i4"),          # Índice sobre la trayectoria densa
+    ("x", "<f4"),               # Posición relativa al origen de la pista
+    ("y", "<f4"),
+    ("yaw", "<f4"),
+    ("speed", "<f4"),
+    ("forward_force", "<f4"),
+    ("steering_force", "<f4")
+])
+
+SHARED_STATE_MAGIC = 0x314F544952524143  # "CARRITO1": identifica un bloque de este módulo
+_HEADER_BYTES = 32
+# Posiciones en la cabecera
+_MAGIC, _SEQUENCE, _CAPACITY, _WRITER_PID = range(4)
+
+
+def _header(shm):
+    return np.ndarray((4,), dtype="<u8", buffer=shm.buf)
+
+
+def _views(shm, capacity):
+    """Cabecera y arreglo de muestras sobre el bloque compartido"""
+    samples = np.ndarray((2 * capacity,), dtype=SHARED_STATE_DTYPE, buffer=shm.buf, offset=_HEADER_BYTES)
+    return _header(shm), samples
+
+
+def _process_alive(pid):
+    """True si el proceso sigue corriendo (o no se puede saber)"""
+    if os.name == "nt":
+        # En Windows el bloque desaparece cuando lo cierra el último proceso: si existe, está en uso
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _reuse_stale(name, size, capacity):
+    """Abre el bloque `name` que ya existe, solo si es un anillo de este módulo con la misma
+    capacidad y el simulador que lo escribía ya terminó. Nunca lo borra: si el bloque está en
+    uso o es de otro programa, lanza FileExistsError."""
+    shm = shared_memory.SharedMemory(name=name)
+    header = _header(shm) if shm.size >= _HEADER_BYTES else None
+    if header is None or header[_MAGIC] != SHARED_STATE_MAGIC or shm.size < size or \
+            header[_CAPACITY] != capacity:
+        reason = "no es un anillo de estado compatible"
+    elif _process_alive(int(header[_WRITER_PID])):
+        reason = f"lo está usando el proceso {int(header[_WRITER_PID])}"
+    else:
+        del header
+        return shm
+    del header
+    shm.close()
+    # Al abrirlo quedó registrado para borrarse al salir de este proceso: el bloque no es nuestro
+    resource_tracker.unregister(shm._name, "shared_memory")
+    raise FileExistsError(f"La memoria compartida '{name}' ya existe y {reason}")
+
+
+class PoseRingBuffer:
+    """Escritor del anillo (un solo proceso: el simulador)"""
+
+    def __init__(self, name=SHARED_STATE_NAME, capacity=SHARED_STATE_CAPACITY):
+        size = _HEADER_BYTES + 2 * capacity * SHARED_STATE_DTYPE.itemsize
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Bloque de una ejecución anterior que no se cerró bien: se reutiliza si es seguro
+            self.shm = _reuse_stale(name, size, capacity)
+        self.name = name
+        self.capacity = capacity
+        self.header, self.samples = _views(self.shm, capacity)
+        self.header[:] = (SHARED_STATE_MAGIC, 0, capacity, os.getpid())
+        self.sequence = 0
+
+    def write(self, t, tracks, targets, poses, forward_force, steering_force):
+        """Agrega una muestra por carro; poses es un arreglo (n, 4) con x, y, yaw, velocidad.
+        El contador de la cabecera se actualiza al final, cuando las muestras ya están completas."""
+        n = len(tracks)
+        seqs = np.arange(self.sequence, self.sequence + n, dtype=np.uint64)
+        records = np.empty(n, dtype=SHARED_STATE_DTYPE)
+        records["seq"] = seqs
+        records["t"] = t
+        records["track"] = tracks
+        records["target"] = targets
+        records["x"] = poses[:, 0]
+        records["y"] = poses[:, 1]
+        records["yaw"] = poses[:, 2]
+        records["speed"] = poses[:, 3]
+        records["forward_force"] = forward_force
+        records["steering_force"] = steering_force
+
+        slots = (seqs % self.capacity).astype(np.intp)
+        self.samples[slots] = records
+        self.samples[slots + self.capacity] = records
+        self.sequence += n
+        self.header[_SEQUENCE] = self.sequence
+
+    def close(self):
+        """Libera el bloque compartido (los lectores abiertos conservan su copia del mapeo)"""
+        del self.header, self.samples
+        self.shm.close()
+        self.shm.unlink()
+
+
+class PoseRingReader:
+    """Lector del anillo desde otro proceso. Las vistas que entrega apuntan directamente a la
+    memoria compartida: siguen siendo válidas mientras el escritor no haya avanzado más de
+    `capacity - len(vista)` muestras; para conservarlas más tiempo se deben copiar."""
+
+    def __init__(self, name=SHARED_STATE_NAME):
+        self.shm = shared_memory.SharedMemory(name=name)
+        header = _header(self.shm)
+        if header[_MAGIC] != SHARED_STATE_MAGIC:
+            del header
+            self.shm.close()
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+            raise ValueError(f"La memoria compartida '{name}' no es un anillo de estado de los carros")
+        # El bloque pertenece al simulador: este proceso no debe borrarlo al terminar (si el
+        # simulador es este mismo proceso, el registro es el suyo y se conserva)
+        if int(header[_WRITER_PID]) != os.getpid():
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        capacity = int(header[_CAPACITY])
+        del header
+        self.capacity = capacity
+        self.header, self.samples = _views(self.shm, capacity)
+
+    @property
+    def sequence(self):
+        """Total de muestras escritas por el simulador"""
+        return int(self.header[_SEQUENCE])
+
+    def _window(self, n, sequence):
+        """Slice de las n muestras anteriores a `sequence` (contiguo gracias a la copia doble)"""
+        n = max(0, min(n, sequence, self.capacity))
+        start = (sequence - n) % self.capacity
+        return self.samples[start:start + n]
+
+    def latest(self, n):
+        """Vista de las últimas n muestras (a lo sumo `capacity`), de la más antigua a la más nueva"""
+        return self._window(n, self.sequence)
+
+    def since(self, sequence):
+        """Vista de las muestras escritas desde `sequence` y el nuevo número de secuencia.
+        Si el lector se atrasó más que la capacidad, las más antiguas se pierden."""
+        current = self.sequence
+        return self._window(current - sequence, current), current
+
+    def is_valid(self, view, sequence):
+        """True si ninguna muestra de una vista leída cuando el contador valía `sequence`
+        (ver since) ha sido sobrescrita por el escritor"""
+        return self.sequence - (sequence - len(view)) <= self.capacity
+
+    def close(self):
+        """Cierra el mapeo; antes deben eliminarse las vistas entregadas"""
+        del self.header, self.samples
+        self.shm.close()
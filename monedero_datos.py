@@ -0,0 +1,583 @@
+"""
+Procesamiento de los registros del monedero (/Monedero en Firebase) para dashboard.py.
+
+Aquí solo hay pandas y NumPy: convertir la respuesta de Firebase en un DataFrame y
+guardarlo en AlmacenMonedero, un almacén en memoria por columnas al que un listener de
+Firebase le va agregando los registros nuevos. Sin Streamlit ni Firebase, así se puede
+probar y medir fuera de la aplicación.
+
+El almacén se guarda en disco (.cache_monedero/) con la última clave recibida: al
+reiniciar, la aplicación abre la caché (las columnas numéricas mapeadas en memoria) y
+solo le pide a Firebase los registros posteriores a esa clave.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+# Configuración de valores de monedas colombianas (constante global)
+VALORES_MONEDAS = {
+    "caja1": {"valor": 50, "nombre": "50 pesos"},
+    "caja2": {"valor": 200, "nombre": "200 pesos"},
+    "caja3": {"valor": 1000, "nombre": "1000 pesos"}
+}
+
+COLUMNAS_CONTEO = ["conteo_caja1", "conteo_caja2", "conteo_caja3", "conteo_global", "errores_clasificacion"]
+COLUMNAS_PESO = ["caja1", "caja2", "caja3"]
+# Estado del carro: el ESP8266 envía las claves en minúscula; se aceptan ambas formas
+COLUMNAS_BANDERA = ["movimiento_carro", "Movimiento_carro"]
+COLUMNAS_CATEGORIA = ["posicion_carro", "Posicion_Carro"]
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"   # fecha_hora_recoleccion (format_datetime_list en Monederoooo.py)
+
+# Agregados por periodo: nombre -> unidad de datetime64 de la cubeta
+GRANULARIDADES = {"minuto": "m", "hora": "h", "dia": "D"}
+# Columnas de cada cubeta, según cómo se combinan dos partes de la misma cubeta
+_AGREGADOS_SUMA = ["registros", "monedas_caja1", "monedas_caja2", "monedas_caja3", "monedas", "valor", "errores"]
+_AGREGADOS_MIN = [f"peso_min_{caja}" for caja in COLUMNAS_PESO]
+_AGREGADOS_MAX = [f"peso_max_{caja}" for caja in COLUMNAS_PESO]
+_AGREGADOS_ULTIMO = [f"peso_{caja}" for caja in COLUMNAS_PESO]
+COLUMNAS_AGREGADOS = _AGREGADOS_SUMA + _AGREGADOS_MIN + _AGREGADOS_MAX + _AGREGADOS_ULTIMO
+# Mediciones acumuladas: solo pueden aumentar o mantenerse
+COLUMNAS_ACUMULADAS = ["conteo_caja1", "conteo_caja2", "conteo_caja3", "caja1", "caja2", "caja3", "conteo_global"]
+
+# Figuras de las gráficas históricas del dashboard: tamaño en pulgadas y resolución (la misma
+# con la que st.pyplot las guarda). Su ancho en píxeles es el que recibe reducir_para_grafica.
+TAMANO_GRAFICAS = (10, 4)
+DPI_GRAFICAS = 200
+ANCHO_GRAFICAS = int(TAMANO_GRAFICAS[0] * DPI_GRAFICAS)   # 2000 px
+
+DIRECTORIO_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_monedero")
+VERSION_CACHE = 3   # Cambiar si cambia el procesamiento de los registros o el formato
+
+
+def extraer_registros(datos):
+    """
+    Aplana la respuesta de Firebase en (claves, registros).
+    La raíz puede ser un dict por push ID (cada valor es un registro o una lista de
+    registros) o directamente una lista; en ese caso no hay claves y la lista es vacía.
+    """
+    claves = []
+    registros = []
+    if isinstance(datos, dict):
+        for clave, valor in datos.items():
+            claves.append(clave)
+            if isinstance(valor, dict):
+                registros.append(valor)
+            elif isinstance(valor, list): # Si algún nodo es una lista de registros
+                registros.extend(item for item in valor if isinstance(item, dict))
+    elif isinstance(datos, list): # Si la raíz "/Monedero" es directamente una lista
+        registros.extend(item for item in datos if isinstance(item, dict))
+    return claves, registros
+
+
+def _columna_numerica(valores, dtype):
+    """Arreglo de dtype con los valores; lo que no sea numérico queda en 0"""
+    try:
+        arreglo = np.array(valores, dtype=dtype)
+    except (TypeError, ValueError, OverflowError):
+        # Hay valores faltantes o texto: convertir uno por uno, errores a NaN para luego rellenar
+        return pd.to_numeric(pd.Series(valores, dtype=object), errors="coerce").fillna(0).to_numpy(dtype)
+    if arreglo.dtype.kind == "f":
+        arreglo[np.isnan(arreglo)] = 0 # Los faltantes (None) llegan como NaN
+    return arreglo
+
+
+def _parsear_fechas(valores):
+    """
+    Fechas de fecha_hora_recoleccion. El formato conocido (FORMATO_FECHA, que es ISO 8601)
+    y las épocas Unix en segundos los lee NumPy de una vez. Si hay otros valores, se leen
+    uno por uno: primero con FORMATO_FECHA, luego como época y al final con la detección
+    de formato de pandas; lo que no se pueda leer queda en NaT.
+    """
+    try:
+        return np.array(valores, dtype="datetime64[s]")
+    except (TypeError, ValueError):
+        pass
+    serie = pd.Series(valores, dtype=object)
+    fechas = pd.to_datetime(serie, format=FORMATO_FECHA, errors="coerce")
+    no_leidas = fechas.isna() & serie.notna()
+    if no_leidas.any():
+        resto = serie[no_leidas]
+        epocas = pd.to_numeric(resto, errors="coerce")
+        otras = pd.to_datetime(resto[epocas.isna()], format="mixed", errors="coerce")
+        fechas[no_leidas] = pd.to_datetime(epocas, unit="s").fillna(otras)
+    return fechas.to_numpy()
+
+
+def registros_a_dataframe(registros):
+    """
+    Convierte registros de Firebase en un DataFrame ordenado por fecha. Cada columna se
+    construye directamente con un tipo compacto: conteos int32, pesos float32, banderas
+    bool y posiciones categóricas. fecha_hora_recoleccion se convierte en la columna
+    Fecha (datetime64). Las columnas derivadas se calculan después, en preprocesar().
+    """
+    if not registros:
+        return pd.DataFrame()
+
+    nombres = dict.fromkeys(COLUMNAS_CONTEO + COLUMNAS_PESO + sorted(set().union(*registros)))
+    columnas = {}
+    for col in nombres:
+        valores = list(map(dict.get, registros, repeat(col)))
+        if col in COLUMNAS_CONTEO: # Si la columna no existe, queda en ceros
+            columnas[col] = _columna_numerica(valores, np.int32)
+        elif col in COLUMNAS_PESO:
+            columnas[col] = _columna_numerica(valores, np.float32)
+        elif col in COLUMNAS_BANDERA:
+            columnas[col] = np.array(valores, dtype=bool) # Faltantes como False
+        elif col in COLUMNAS_CATEGORIA:
+            codigos, categorias = pd.factorize(np.array(valores, dtype=object))
+            columnas[col] = pd.Categorical.from_codes(codigos, categorias)
+        elif col == "fecha_hora_recoleccion":
+            columnas["Fecha"] = _parsear_fechas(valores)
+        else:
+            columnas[col] = valores
+    df = pd.DataFrame(columnas, copy=False)
+
+    if "Fecha" in df.columns:
+        df = df.sort_values("Fecha", kind="stable").dropna(subset=["Fecha"]) # Eliminar filas donde la fecha no se pudo parsear
+    else:
+        # Si no hay fecha, no se puede ordenar ni graficar por tiempo de forma fiable
+        df["Fecha"] = pd.NaT # Añadir columna de fecha vacía para evitar errores posteriores
+    return df
+
+
+def memoria_por_registro(df):
+    """Bytes en memoria por registro del DataFrame (incluye el contenido del texto)"""
+    return df.memory_usage(deep=True).sum() / len(df) if len(df) else 0.0
+
+
+def preprocesar(df):
+    """
+    Prepara los registros para el dashboard en una sola etapa vectorizada:
+    - Corrige los valores anómalos (decrecientes) de las mediciones acumuladas: cada valor
+      se lleva al máximo visto hasta ese registro (cummax de todas las columnas a la vez).
+    - Calcula el valor monetario de cada caja y el total con los conteos ya corregidos.
+    No modifica df (puede ser la vista compartida del almacén) ni copia las demás columnas.
+    """
+    if df.empty:
+        return df
+
+    corregidas = df[[col for col in COLUMNAS_ACUMULADAS if col in df.columns]].cummax()
+    valores = {
+        f"valor_{caja}": corregidas[f"conteo_{caja}"].astype(np.int64) * moneda["valor"]
+        for caja, moneda in VALORES_MONEDAS.items()
+    }
+    valores["valor_total"] = valores["valor_caja1"] + valores["valor_caja2"] + valores["valor_caja3"]
+    return df.assign(**dict(corregidas.items()), **valores)
+
+
+def indices_por_fecha(fechas, desde=None, hasta=None):
+    """
+    (inicio, fin) de las filas con desde <= Fecha < hasta (ambos opcionales), por búsqueda
+    binaria sobre fechas, que deben estar ordenadas (así las entrega el almacén).
+    df.iloc[inicio:fin] toma solo esa ventana, sin recorrer ni copiar el resto.
+    """
+    fechas = np.asarray(fechas)
+    inicio = 0 if desde is None else int(np.searchsorted(fechas, np.datetime64(desde), "left"))
+    fin = len(fechas) if hasta is None else int(np.searchsorted(fechas, np.datetime64(hasta), "left"))
+    return inicio, fin
+
+
+def pagina_reciente(df, numero, tamano):
+    """
+    Página numero (desde 0) de tamano filas de df, de la más reciente a la más antigua,
+    lista para la tabla de datos crudos: incluye fecha_hora_recoleccion como la envía el
+    dispositivo (FORMATO_FECHA), reconstruida solo para las filas de la página porque el
+    almacén guarda únicamente la columna Fecha.
+    """
+    fin = max(len(df) - numero * tamano, 0)
+    pagina = df.iloc[max(fin - tamano, 0):fin].iloc[::-1]
+    if "Fecha" in pagina.columns and "fecha_hora_recoleccion" not in pagina.columns:
+        pagina = pagina.copy()
+        pagina.insert(pagina.columns.get_loc("Fecha"), "fecha_hora_recoleccion",
+                      pagina["Fecha"].dt.strftime(FORMATO_FECHA))
+    return pagina
+
+
+def reducir_para_grafica(x, y, ancho):
+    """
+    Índices de los puntos de la serie (x, y) que hay que graficar en ancho píxeles.
+    Divide el rango de x en ancho intervalos iguales, uno por columna de píxeles, y de
+    cada uno conserva el primero, el último, el mínimo y el máximo (M4): la línea que se
+    dibuja es la misma que con todos los puntos, pero con a lo sumo 4 puntos por píxel.
+    x debe estar ordenado (números o datetime64). Todo el cálculo es vectorizado.
+    """
+    n = len(x)
+    if n <= 4 * ancho:
+        return np.arange(n)
+    x = np.asarray(x)
+    x = (x.view(np.int64) if x.dtype.kind == "M" else x).astype(float)
+    y = np.asarray(y, dtype=float)
+
+    rango = x[-1] - x[0]
+    cubeta = np.minimum(((x - x[0]) * (ancho / rango)).astype(np.int64), ancho - 1) if rango > 0 else np.zeros(n, dtype=np.int64)
+    inicios = np.flatnonzero(np.diff(cubeta, prepend=-1))
+    finales = np.append(inicios[1:], n) - 1
+    tamanos = finales - inicios + 1
+
+    indices = [inicios, finales]
+    for extremo in (np.minimum, np.maximum):
+        # Primera posición de cada cubeta donde está su mínimo (o máximo)
+        posiciones = np.flatnonzero(y == np.repeat(extremo.reduceat(y, inicios), tamanos))
+        indices.append(posiciones[np.diff(cubeta[posiciones], prepend=-1) != 0])
+    return np.unique(np.concatenate(indices))
+
+
+class AgregadosMonedero:
+    """
+    Agregados por minuto, hora y día, actualizados con cada lote de registros que llega
+    (no se recorren todas las filas al consultar). Por cubeta: registros, monedas
+    depositadas (por caja y en total), valor agregado en pesos (VALORES_MONEDAS), errores
+    nuevos y peso de cada caja (mínimo, máximo y último).
+    Los conteos son acumulados: lo depositado es lo que aumenta el máximo visto, con la
+    misma corrección de preprocesar(); antes del primer registro los contadores están en 0.
+    """
+
+    def __init__(self):
+        # Último máximo de conteo_caja1..3, conteo_global y errores_clasificacion
+        self._maximos = np.zeros(5)
+        self._tablas = {
+            nombre: {"fechas": np.empty(0, dtype=f"datetime64[{unidad}]"),
+                     "valores": np.empty((0, len(COLUMNAS_AGREGADOS))), "n": 0}
+            for nombre, unidad in GRANULARIDADES.items()
+        }
+
+    def agregar(self, df):
+        """Suma un lote de registros ordenado por Fecha y posterior a los ya agregados"""
+        # Un lote vacío (/Monedero vacío o un put con None) no trae la columna Fecha
+        if df.empty or "Fecha" not in df:
+            return
+        df = df[df["Fecha"].notna()]
+        if df.empty:
+            return
+
+        contadores = df[["conteo_caja1", "conteo_caja2", "conteo_caja3", "conteo_global",
+                         "errores_clasificacion"]].to_numpy(dtype=float)
+        corregidos = np.maximum.accumulate(np.vstack([self._maximos, contadores]), axis=0)
+        incrementos = np.diff(corregidos, axis=0)
+        self._maximos = corregidos[-1]
+        valor = incrementos[:, :3] @ [moneda["valor"] for moneda in VALORES_MONEDAS.values()]
+        sumas = np.column_stack([np.ones(len(df)), incrementos[:, :4], valor, incrementos[:, 4]])
+        pesos = df[COLUMNAS_PESO].to_numpy(dtype=float)
+
+        fechas = df["Fecha"].to_numpy()
+        for nombre, unidad in GRANULARIDADES.items():
+            claves = fechas.astype(f"datetime64[{unidad}]")
+            inicios = np.flatnonzero(np.diff(claves, prepend=claves[0] - 1))
+            finales = np.append(inicios[1:], len(claves)) - 1
+            valores = np.hstack([
+                np.add.reduceat(sumas, inicios), np.minimum.reduceat(pesos, inicios),
+                np.maximum.reduceat(pesos, inicios), pesos[finales]
+            ])
+            self._agregar_cubetas(self._tablas[nombre], claves[inicios], valores)
+
+    def _agregar_cubetas(self, tabla, claves, valores):
+        n = tabla["n"]
+        if n and claves[0] == tabla["fechas"][n - 1]:
+            # El lote continúa la última cubeta: combinarla con su primera parte
+            ultima, primera = tabla["valores"][n - 1], valores[0]
+            s, m = len(_AGREGADOS_SUMA), len(_AGREGADOS_MIN)
+            ultima[:s] += primera[:s]
+            ultima[s:s + m] = np.minimum(ultima[s:s + m], primera[s:s + m])
+            ultima[s + m:s + 2 * m] = np.maximum(ultima[s + m:s + 2 * m], primera[s + m:s + 2 * m])
+            ultima[s + 2 * m:] = primera[s + 2 * m:]
+            claves, valores = claves[1:], valores[1:]
+
+        fin = n + len(claves)
+        if fin > len(tabla["fechas"]):
+            capacidad = max(fin, 2 * len(tabla["fechas"]), 64)
+            fechas = np.empty(capacidad, dtype=tabla["fechas"].dtype)
+            fechas[:n] = tabla["fechas"][:n]
+            matriz = np.empty((capacidad, len(COLUMNAS_AGREGADOS)))
+            matriz[:n] = tabla["valores"][:n]
+            tabla["fechas"], tabla["valores"] = fechas, matriz
+        tabla["fechas"][n:fin] = claves
+        tabla["valores"][n:fin] = valores
+        tabla["n"] = fin
+
+    def tabla(self, granularidad, desde=None, hasta=None):
+        """
+        DataFrame (copia) con las cubetas de granularidad ("minuto", "hora" o "dia") que
+        tienen registros entre desde (incluido) y hasta (excluido), ambos opcionales; se
+        ubican por búsqueda binaria sobre las fechas de las cubetas.
+        """
+        tabla = self._tablas[granularidad]
+        fechas = tabla["fechas"][:tabla["n"]]
+        inicio = 0 if desde is None else np.searchsorted(fechas, np.datetime64(desde, GRANULARIDADES[granularidad]), "left")
+        fin = len(fechas) if hasta is None else np.searchsorted(fechas, np.datetime64(hasta), "left")
+        df = pd.DataFrame(tabla["valores"][inicio:fin], columns=COLUMNAS_AGREGADOS)
+        df.insert(0, "Fecha", fechas[inicio:fin])
+        return df.astype({col: np.int64 for col in _AGREGADOS_SUMA})
+
+
+def _valor_faltante(dtype):
+    """Tipo y valor para las filas que no traen una columna"""
+    if dtype.kind == "f":
+        return dtype, np.nan
+    if dtype.kind == "M":
+        return dtype, np.datetime64("NaT")
+    if dtype.kind in "iu":
+        return np.dtype(float), np.nan
+    if dtype.kind == "b":
+        return dtype, False
+    return np.dtype(object), np.nan
+
+
+class AlmacenMonedero:
+    """
+    Almacén en memoria de los registros del monedero, seguro entre hilos y de solo agregar.
+    Cada columna es un arreglo NumPy con capacidad de sobra (se duplica al llenarse): agregar
+    registros cuesta según los registros nuevos, y dataframe() entrega un DataFrame cuyas
+    columnas son vistas de las primeras n filas, sin copiar. Como nunca se sobrescriben
+    filas ya escritas, una vista entregada sigue siendo válida aunque lleguen más registros.
+    Las columnas categóricas se guardan como códigos y sus categorías solo se amplían.
+    """
+
+    def __init__(self, capacidad=1024):
+        self.lock = threading.Lock()
+        self.sincronizado = threading.Event()  # Se activa con la primera carga completa
+        self.ultima_clave = None               # Mayor push ID recibido
+        self.version = 0                       # Aumenta con cada cambio del contenido
+        self._capacidad = capacidad
+        self._columnas = {}
+        self._categorias = {}     # Categorías de las columnas categóricas (en _columnas van los códigos)
+        self._n = 0
+        self._df = pd.DataFrame()
+        self._df_version = 0
+        self._version_guardada = 0
+        self._guardado = 0.0
+        self._generacion = None   # Carpeta de la caché leída o escrita por este almacén
+        self.agregados = AgregadosMonedero()
+
+    def __len__(self):
+        return self._n
+
+    def _actualizar_clave(self, claves):
+        if claves and (self.ultima_clave is None or max(claves) > self.ultima_clave):
+            self.ultima_clave = max(claves)
+
+    def _faltante(self, col, dtype):
+        """Tipo y valor para las filas sin la columna col (código -1 si es categórica)"""
+        return (dtype, -1) if col in self._categorias else _valor_faltante(dtype)
+
+    def _codigos(self, col, serie):
+        """Códigos de una columna categórica según las categorías del almacén, que se amplían con las nuevas"""
+        serie = serie.astype("category")
+        categorias = self._categorias.get(col, serie.cat.categories[:0])
+        nuevas = serie.cat.categories[~serie.cat.categories.isin(categorias)]
+        self._categorias[col] = categorias = categorias.append(nuevas)
+        return pd.Categorical(serie, categories=categorias).codes
+
+    def _escribir(self, df):
+        """Escribe las filas de df después de las actuales (con el lock tomado)"""
+        inicio, fin = self._n, self._n + len(df)
+        if fin > self._capacidad:
+            self._capacidad = max(fin, 2 * self._capacidad)
+            for col, arreglo in self._columnas.items():
+                nuevo = np.empty(self._capacidad, dtype=arreglo.dtype)
+                nuevo[:inicio] = arreglo[:inicio]
+                self._columnas[col] = nuevo
+
+        for col in df.columns:
+            serie = df[col]
+            if col in self._categorias or (col not in self._columnas and isinstance(serie.dtype, pd.CategoricalDtype)):
+                valores = self._codigos(col, serie)
+            else:
+                valores = serie.to_numpy()
+            arreglo = self._columnas.get(col)
+            if arreglo is None:
+                # Columna nueva: las filas anteriores quedan como faltantes
+                dtype, faltante = self._faltante(col, valores.dtype) if inicio else (valores.dtype, None)
+                arreglo = np.empty(self._capacidad, dtype=dtype)
+                if inicio:
+                    arreglo[:inicio] = faltante
+            else:
+                dtype = np.result_type(arreglo.dtype, valores.dtype)
+                if dtype != arreglo.dtype:
+                    arreglo = arreglo.astype(dtype)
+            arreglo[inicio:fin] = valores
+            self._columnas[col] = arreglo
+
+        for col in self._columnas.keys() - set(df.columns):
+            dtype, faltante = self._faltante(col, self._columnas[col].dtype)
+            if dtype != self._columnas[col].dtype:
+                self._columnas[col] = self._columnas[col].astype(dtype)
+            self._columnas[col][inicio:fin] = faltante
+        self._n = fin
+
+    def reemplazar(self, claves, registros):
+        """Reemplaza todo el contenido (carga inicial o reconexión del listener)"""
+        df = registros_a_dataframe(registros)
+        with self.lock:
+            self._columnas = {}
+            self._categorias = {}
+            self._n = 0
+            self._escribir(df)
+            self.agregados = AgregadosMonedero()
+            self.agregados.agregar(df)
+            self.ultima_clave = None
+            self._actualizar_clave(claves)
+            self.version += 1
+        self.sincronizado.set()
+
+    def agregar(self, claves, registros):
+        """Agrega registros nuevos; el procesamiento se hace antes de tomar el lock"""
+        nuevos = registros_a_dataframe(registros)
+        with self.lock:
+            self._actualizar_clave(claves)
+            if nuevos.empty:
+                return
+            desordenado = self._n and nuevos["Fecha"].min() < self._columnas["Fecha"][self._n - 1]
+            self._escribir(nuevos)
+            if desordenado:
+                # Caso raro: llegó un registro anterior al último cargado; reordenar todo
+                # en arreglos nuevos (las vistas ya entregadas no cambian)
+                orden = np.argsort(self._columnas["Fecha"][:self._n], kind="stable")
+                self._columnas = {col: arreglo[:self._n][orden] for col, arreglo in self._columnas.items()}
+                self._capacidad = self._n
+                self.agregados = AgregadosMonedero()
+                self.agregados.agregar(self._vista())
+            else:
+                self.agregados.agregar(nuevos)
+            self.version += 1
+
+    def aplicar_evento(self, tipo, ruta, datos):
+        """
+        Aplica un evento de db.Reference("/Monedero").listen(): el primero es un 'put' en
+        '/' con todo el árbol; después llega un 'put' en '/<push ID>' por cada registro nuevo.
+        """
+        if ruta == "/":
+            if tipo == "put" and not (self.sincronizado.is_set() and isinstance(datos, dict)):
+                self.reemplazar(*extraer_registros(datos))
+                return
+            if tipo == "put" and self.ultima_clave is not None:
+                # Árbol completo con datos ya cargados (caché o reconexión): solo lo nuevo
+                datos = {clave: valor for clave, valor in datos.items() if clave > self.ultima_clave}
+            self.agregar(*extraer_registros(datos))
+        elif ruta.count("/") == 1 and datos is not None:
+            self.agregar(*extraer_registros({ruta[1:]: datos}))
+        # Los cambios dentro de un registro y los borrados se ignoran: el ESP8266 solo
+        # agrega registros completos (POST a /Monedero)
+
+    def consultar_agregados(self, granularidad, desde=None, hasta=None):
+        """Cubetas de AgregadosMonedero.tabla() con el contenido actual"""
+        with self.lock:
+            return self.agregados.tabla(granularidad, desde, hasta)
+
+    def _vista(self):
+        columnas = {}
+        for col, arreglo in self._columnas.items():
+            if col in self._categorias:
+                columnas[col] = pd.Categorical.from_codes(arreglo[:self._n], categories=self._categorias[col])
+            else:
+                columnas[col] = arreglo[:self._n]
+        return pd.DataFrame(columnas, copy=False)
+
+    def dataframe(self):
+        """
+        DataFrame con el contenido actual (compartido: no se debe modificar en el sitio).
+        df.attrs["version"] es la versión de los datos, para usar como clave de caché.
+        """
+        with self.lock:
+            if self._df_version != self.version:
+                self._df = self._vista()
+                self._df.attrs["version"] = self._df_version = self.version
+            return self._df
+
+    def guardar(self, directorio=DIRECTORIO_CACHE, origen="", intervalo=0.0):
+        """
+        Guarda el contenido en directorio si cambió y pasaron al menos intervalo segundos
+        desde el último guardado. Cada guardado es una carpeta nueva con un archivo por
+        columna (.npy, o .json para las de texto; de las categóricas se guardan los códigos
+        y las categorías van en meta.json); meta.json apunta a la vigente y se
+        reemplaza al final, así nunca se lee una caché a medias. Retorna si guardó.
+        """
+        with self.lock:
+            if self.version == self._version_guardada or time.time() - self._guardado < intervalo:
+                return False
+            version, clave, n = self.version, self.ultima_clave, self._n
+            # Las filas escritas nunca cambian: estas vistas se pueden leer fuera del lock
+            columnas = {col: arreglo[:n] for col, arreglo in self._columnas.items()}
+            categorias = dict(self._categorias)
+
+        generacion = f"{version}_{os.getpid()}_{time.time_ns()}"
+        ruta = os.path.join(directorio, generacion)
+        os.makedirs(ruta)
+        formatos = []
+        for i, (col, valores) in enumerate(columnas.items()):
+            if col in categorias:
+                np.save(os.path.join(ruta, f"{i}.npy"), valores)
+                formatos.append([col, "cat", categorias[col].tolist()])
+            elif valores.dtype == object:
+                lista = np.where(pd.isna(valores), None, valores).tolist()
+                with open(os.path.join(ruta, f"{i}.json"), "w", encoding="utf-8") as f:
+                    json.dump(lista, f, default=lambda v: v.item() if isinstance(v, np.generic) else str(v))
+                formatos.append([col, "json"])
+            else:
+                np.save(os.path.join(ruta, f"{i}.npy"), valores)
+                formatos.append([col, "npy"])
+
+        meta = {"version_cache": VERSION_CACHE, "origen": origen, "ultima_clave": clave,
+                "filas": n, "generacion": generacion, "columnas": formatos}
+        ruta_meta = os.path.join(directorio, "meta.json")
+        with open(f"{ruta_meta}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(f"{ruta_meta}.{os.getpid()}.tmp", ruta_meta)
+
+        # La carpeta anterior ya no está referenciada (quien la tenga mapeada la sigue leyendo)
+        if self._generacion is not None:
+            shutil.rmtree(os.path.join(directorio, self._generacion), ignore_errors=True)
+        self._generacion = generacion
+        self._version_guardada = version
+        self._guardado = time.time()
+        return True
+
+    @classmethod
+    def desde_cache(cls, directorio=DIRECTORIO_CACHE, origen=""):
+        """
+        Almacén con el contenido guardado en directorio, o None si no hay una caché válida
+        para este origen (URL de la base de datos). Las columnas numéricas quedan mapeadas
+        en memoria y se leen del disco a medida que se usan; el primer registro agregado
+        las copia a memoria.
+        """
+        try:
+            with open(os.path.join(directorio, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["version_cache"] != VERSION_CACHE or meta["origen"] != origen or meta["ultima_clave"] is None:
+                return None
+
+            ruta = os.path.join(directorio, meta["generacion"])
+            n = meta["filas"]
+            columnas = {}
+            categorias = {}
+            for i, (col, formato, *extra) in enumerate(meta["columnas"]):
+                if formato == "cat":
+                    categorias[col] = pd.Index(extra[0])
+                if formato in ("npy", "cat"):
+                    valores = np.load(os.path.join(ruta, f"{i}.npy"), mmap_mode="r")
+                else:
+                    with open(os.path.join(ruta, f"{i}.json"), encoding="utf-8") as f:
+                        lista = json.load(f)
+                    valores = np.empty(len(lista), dtype=object)
+                    valores[:] = [np.nan if v is None else v for v in lista]
+                if len(valores) != n:
+                    return None
+                columnas[col] = valores
+        except (OSError, ValueError, KeyError, TypeError):
+            # Sin caché (o dañada): cargar todo desde Firebase
+            return None
+
+        almacen = cls()
+        almacen._columnas = columnas
+        almacen._categorias = categorias
+        almacen._n = almacen._capacidad = n
+        almacen.ultima_clave = meta["ultima_clave"]
+        almacen.version = almacen._version_guardada = 1
+        almacen._generacion = meta["generacion"]
+        almacen.agregados.agregar(almacen._vista())
+        return almacen
@@ -0,0 +1,179 @@
+"""
+Optimizador de parámetros del controlador por pista.
+
+Busca (aleatoria o en rejilla) combinaciones de ganancias y límites del controlador,
+las evalúa en paralelo con vueltas sin GUI (lotes.run_batch) y luego refina localmente
+la mejor de cada pista. El puntaje combina tiempo de vuelta, vueltas no completadas y
+eventos de atasco. Los mejores parámetros se guardan en perfiles_control.json, que
+CarLineFollower carga al iniciar.
+
+Ejemplo:
+    python optimizador.py --samples 40 --refine-rounds 4 --seeds 3
+    python optimizador.py --mode grid --param steering_gain=10,20,30 --param lookahead=1,1.5,2
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from Carrito import CONTROL_PARAMS_DEFAULT, CONTROL_PROFILES_FILE, TRACK_TIME_LIMITS, TRACK_TYPES
+from lotes import parse_param, run_batch
+
+# Rango de búsqueda de cada parámetro (mínimo, máximo)
+SEARCH_SPACE = {
+    "max_force": (30.0, 120.0),
+    "min_force": (5.0, 40.0),
+    "steering_gain": (5.0, 40.0),
+    "max_steering": (10.0, 80.0),
+    "lookahead": (0.5, 3.0),
+    "max_speed": (4.0, 14.0)
+}
+
+# Segundos de penalización por cada evento de atasco (un atasco se confirma tras ~1.5 s:
+# ventana de 0.5 s y 1 s de evaluaciones seguidas, más lo que tarda la recuperación)
+STUCK_PENALTY = 2.0
+
+
+def clip_params(params):
+    """Ajusta una combinación al espacio de búsqueda y evita min_force > max_force"""
+    params = {key: float(np.clip(value, *SEARCH_SPACE[key])) for key, value in params.items()}
+    params["min_force"] = min(params["min_force"], params["max_force"])
+    return params
+
+
+def random_candidates(rng, count):
+    """Combinaciones aleatorias uniformes dentro de SEARCH_SPACE (incluye los valores por defecto)"""
+    candidates = [dict(CONTROL_PARAMS_DEFAULT)]
+    for _ in range(count):
+        candidates.append(clip_params({key: rng.uniform(low, high) for key, (low, high) in SEARCH_SPACE.items()}))
+    return candidates
+
+
+def grid_candidates(param_grid):
+    """Rejilla sobre los parámetros indicados; los demás quedan en su valor por defecto"""
+    keys = list(param_grid)
+    grids = np.meshgrid(*(param_grid[key] for key in keys), indexing="ij")
+    candidates = []
+    for values in zip(*(g.ravel() for g in grids)):
+        params = dict(CONTROL_PARAMS_DEFAULT)
+        params.update(zip(keys, values))
+        candidates.append(clip_params(params))
+    return candidates
+
+
+def neighbours(rng, params, count, scale):
+    """Perturbaciones gaussianas de una combinación, con desviación relativa al rango"""
+    result = []
+    for _ in range(count):
+        result.append(clip_params({
+            key: value + rng.normal(0.0, scale * (SEARCH_SPACE[key][1] - SEARCH_SPACE[key][0]))
+            for key, value in params.items()
+        }))
+    return result
+
+
+def lap_score(track, rows):
+    """Puntaje de una combinación en una pista (menor es mejor)"""
+    limit = TRACK_TIME_LIMITS.get(track, 180)
+    lap_times = [row["lap_time"] if row["completed"] else limit for row in rows]
+    stuck = [row["stuck_events"] for row in rows]
+    return float(np.mean(lap_times) + STUCK_PENALTY * np.mean(stuck))
+
+
+def evaluate(candidates_by_track, seeds, workers):
+    """Evalúa todas las combinaciones de todas las pistas en un solo lote paralelo.
+    Retorna, por pista, una lista de (puntaje, parámetros, filas) en el orden de entrada."""
+    jobs = []
+    owners = []
+    for track, candidates in candidates_by_track.items():
+        for c, params in enumerate(candidates):
+            for seed in seeds:
+                jobs.append({"track": track, "seed": seed, "params": params})
+                owners.append((track, c))
+
+    grouped = {}
+    for owner, row in zip(owners, run_batch(jobs, workers)):
+        grouped.setdefault(owner, []).append(row)
+
+    return {
+        track: [(lap_score(track, grouped[(track, c)]), params, grouped[(track, c)])
+                for c, params in enumerate(candidates)]
+        for track, candidates in candidates_by_track.items()
+    }
+
+
+def optimize(tracks, candidates, seeds, workers, refine_rounds, refine_count, rng):
+    """Búsqueda inicial seguida de refinamiento local con paso decreciente"""
+    print(f"🔎 Evaluando {len(candidates)} combinaciones en {len(tracks)} pista(s)...")
+    results = evaluate({track: candidates for track in tracks}, seeds, workers)
+    best = {track: min(results[track], key=lambda r: r[0]) for track in tracks}
+
+    scale = 0.15
+    for round_number in range(1, refine_rounds + 1):
+        proposals = {track: neighbours(rng, best[track][1], refine_count, scale) for track in tracks}
+        results = evaluate(proposals, seeds, workers)
+        for track in tracks:
+            candidate = min(results[track], key=lambda r: r[0])
+            if candidate[0] < best[track][0]:
+                best[track] = candidate
+        print(f"   Ronda {round_number}: " + ", ".join(f"pista {t} = {best[t][0]:.2f}" for t in tracks))
+        scale *= 0.6
+
+    return best
+
+
+def save_profiles(best, path=CONTROL_PROFILES_FILE):
+    """Guarda los mejores parámetros por pista, conservando los perfiles de otras pistas"""
+    profiles = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            profiles = json.load(f)
+    for track, (score, params, rows) in best.items():
+        profile = {key: round(value, 4) for key, value in params.items()}
+        profile["score"] = round(score, 4)
+        profile["completion_rate"] = sum(row["completed"] for row in rows) / len(rows)
+        profiles[str(track)] = profile
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimiza por pista los parámetros del controlador")
+    parser.add_argument("--tracks", type=int, nargs="+", default=list(TRACK_TYPES), choices=TRACK_TYPES)
+    parser.add_argument("--mode", choices=["random", "grid"], default="random")
+    parser.add_argument("--samples", type=int, default=30, help="Combinaciones aleatorias (modo random)")
+    parser.add_argument("--param", type=parse_param, action="append", default=[],
+                        help="Valores de la rejilla (modo grid), ej. steering_gain=10,20,30")
+    parser.add_argument("--seeds", type=int, default=3, help="Semillas por combinación")
+    parser.add_argument("--refine-rounds", type=int, default=3)
+    parser.add_argument("--refine-count", type=int, default=8, help="Vecinos evaluados por ronda")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--random-seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.random_seed)
+    if args.mode == "grid":
+        if not args.param:
+            parser.error("El modo grid necesita al menos un --param")
+        candidates = grid_candidates(dict(args.param))
+    else:
+        candidates = random_candidates(rng, args.samples)
+
+    start = time.time()
+    best = optimize(args.tracks, candidates, list(range(args.seeds)), args.workers,
+                    args.refine_rounds, args.refine_count, rng)
+    print(f"✅ Optimización terminada en {time.time() - start:.1f} s")
+
+    for track, (score, params, rows) in best.items():
+        values = ", ".join(f"{key}={value:.2f}" for key, value in params.items())
+        print(f"🏁 Pista {track}: puntaje {score:.2f} - {values}")
+
+    # Siempre en el archivo que lee CarLineFollower, para que el simulador use los perfiles
+    save_profiles(best)
+    print(f"💾 Perfiles guardados en {CONTROL_PROFILES_FILE}")
+
+
+if __name__ == "__main__":
+    main()
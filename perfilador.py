@@ -0,0 +1,185 @@
+"""
+Perfilador por etapas del dashboard (dashboard.py).
+
+Cada ejecución de la página (cada rerun de Streamlit) mide cuánto tarda cada etapa:
+espera de Firebase, construcción del DataFrame, preprocesamiento, gráficas, DeepSeek,
+gTTS... Los tiempos se acumulan en ventanas de las últimas ejecuciones para sacar
+percentiles por etapa, y cada ejecución se escribe como una línea JSON para analizarla
+después.
+
+Uso en el dashboard:
+    with perfilador.ejecucion("dashboard"):
+        ...
+        with etapa("preprocesar"):
+            df = preprocesar(df)
+
+Resumen de un log guardado:
+    python perfilador.py perfil_dashboard.jsonl
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+PERCENTILES = (50, 90, 99)
+# Log de ejecuciones, junto a este archivo
+ARCHIVO_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perfil_dashboard.jsonl")
+
+# Ejecución en curso de cada hilo: Streamlit corre cada sesión en su propio hilo
+_local = threading.local()
+
+
+class _Etapa:
+    """Suma la duración del bloque a la etapa nombre de la ejecución en curso del hilo"""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ejecucion = getattr(_local, "ejecucion", None)
+        if ejecucion is not None:
+            duracion = time.perf_counter() - self._inicio
+            ejecucion.etapas[self.nombre] = ejecucion.etapas.get(self.nombre, 0.0) + duracion
+        return False
+
+
+def etapa(nombre):
+    """
+    Context manager que mide una etapa. Fuera de una ejecución del perfilador no registra
+    nada, así las funciones se pueden llamar igual desde otros scripts. Si una etapa se
+    repite en la misma ejecución, sus tiempos se suman.
+    """
+    return _Etapa(nombre)
+
+
+class _Ejecucion:
+    """Una ejecución de la página; al terminar (aunque sea por st.stop o st.rerun) se registra"""
+
+    def __init__(self, perfilador, pagina):
+        self.perfilador = perfilador
+        self.pagina = pagina
+        self.etapas = {}
+
+    def __enter__(self):
+        self._anterior = getattr(_local, "ejecucion", None)
+        _local.ejecucion = self
+        self.fecha = datetime.now().isoformat(timespec="seconds")
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, *exc):
+        self.etapas["total"] = time.perf_counter() - self._inicio
+        _local.ejecucion = self._anterior
+        self.perfilador.registrar(self, None if tipo is None else tipo.__name__)
+        return False
+
+
+class PerfiladorEtapas:
+    """
+    Tiempos por etapa de las últimas `ventana` ejecuciones, compartidos por todas las
+    sesiones (el dashboard crea uno por proceso). Si archivo_log no es None, cada
+    ejecución se agrega como una línea JSON.
+    """
+
+    def __init__(self, ventana=200, archivo_log=ARCHIVO_LOG):
+        self.ventana = ventana
+        self.archivo_log = archivo_log
+        self._lock = threading.Lock()
+        self._tiempos = {}   # (página, etapa) -> deque de segundos
+        self.ejecuciones = 0
+
+    def ejecucion(self, pagina):
+        """Context manager que envuelve una ejecución completa de la página"""
+        return _Ejecucion(self, pagina)
+
+    def registrar(self, ejecucion, interrumpida=None):
+        linea = {
+            "fecha": ejecucion.fecha,
+            "pagina": ejecucion.pagina,
+            "etapas_ms": {nombre: round(s * 1e3, 2) for nombre, s in ejecucion.etapas.items()}
+        }
+        if interrumpida:
+            linea["interrumpida"] = interrumpida
+        with self._lock:
+            self.ejecuciones += 1
+            for nombre, segundos in ejecucion.etapas.items():
+                clave = (ejecucion.pagina, nombre)
+                if clave not in self._tiempos:
+                    self._tiempos[clave] = deque(maxlen=self.ventana)
+                self._tiempos[clave].append(segundos)
+            if self.archivo_log:
+                try:
+                    with open(self.archivo_log, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(linea, ensure_ascii=False) + "\n")
+                except OSError as e:
+                    print(f"⚠️ No se pudo escribir el log de rendimiento: {e}")
+
+    def percentiles(self, pagina=None):
+        """
+        DataFrame con una fila por (página, etapa): muestras en la ventana y percentiles
+        PERCENTILES en milisegundos. pagina filtra a una sola página.
+        """
+        with self._lock:
+            tiempos = {clave: np.array(valores) for clave, valores in self._tiempos.items()
+                       if pagina is None or clave[0] == pagina}
+        return tabla_percentiles(tiempos)
+
+
+def tabla_percentiles(tiempos):
+    """Percentiles en ms de {(página, etapa): segundos}, con el total de cada página al final"""
+    filas = []
+    for (pagina, nombre), valores in tiempos.items():
+        fila = {"pagina": pagina, "etapa": nombre, "n": len(valores)}
+        for p, valor in zip(PERCENTILES, np.percentile(valores, PERCENTILES)):
+            fila[f"p{p}_ms"] = round(float(valor) * 1e3, 1)
+        filas.append(fila)
+    columnas = ["pagina", "etapa", "n"] + [f"p{p}_ms" for p in PERCENTILES]
+    if not filas:
+        return pd.DataFrame(columns=columnas)
+    df = pd.DataFrame(filas, columns=columnas)
+    # Ordenar por página y de la etapa más lenta a la más rápida, con el total al final
+    df["_es_total"] = df["etapa"] == "total"
+    df = df.sort_values(["pagina", "_es_total", f"p{PERCENTILES[0]}_ms"], ascending=[True, True, False])
+    return df.drop(columns="_es_total").reset_index(drop=True)
+
+
+def leer_log(archivo):
+    """{(página, etapa): segundos} de un log de ejecuciones"""
+    tiempos = {}
+    with open(archivo, encoding="utf-8") as f:
+        for linea in f:
+            if not linea.strip():
+                continue
+            ejecucion = json.loads(linea)
+            for nombre, ms in ejecucion["etapas_ms"].items():
+                tiempos.setdefault((ejecucion["pagina"], nombre), []).append(ms / 1e3)
+    return {clave: np.array(valores) for clave, valores in tiempos.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Percentiles por etapa de un log de rendimiento del dashboard")
+    parser.add_argument("archivo", nargs="?", default=ARCHIVO_LOG)
+    parser.add_argument("--ultimas", type=int, default=None, help="Usar solo las últimas N muestras de cada etapa")
+    args = parser.parse_args()
+
+    tiempos = leer_log(args.archivo)
+    if args.ultimas:
+        tiempos = {clave: valores[-args.ultimas:] for clave, valores in tiempos.items()}
+    if not tiempos:
+        raise SystemExit(f"ℹ️ No hay ejecuciones registradas en {args.archivo}")
+    print(f"⏱️ Rendimiento por etapa ({args.archivo})")
+    print(tabla_percentiles(tiempos).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Definiciones de las pistas y caché de su geometría compilada.
+
+Cada pista se describe en un archivo JSON de pistas/ (número, nombres, colores, cámara,
+tiempo límite, origen en el mundo compartido y waypoints, en línea o en un CSV con
+columnas x,y). De los waypoints se compila la geometría que usa el simulador:
+trayectoria densa (spline Catmull-Rom remuestreada por longitud de arco), curvatura,
+límite de velocidad por segmento y posiciones de los marcadores.
+
+La geometría compilada se guarda en pistas/.cache/<hash>.npz, donde el hash cubre el
+contenido de la definición y los parámetros de compilación: cargar una pista ya
+compilada es una sola lectura, y cualquier cambio en su archivo genera otra entrada.
+"""
+import csv
+import glob
+import hashlib
+import json
+import os
+import zipfile
+
+import numpy as np
+
+TRACKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pistas")
+TRACK_CACHE_DIR = os.path.join(TRACKS_DIR, ".cache")
+
+TRACK_SPACING = 0.1       # Separación (m) entre muestras de la pista densa
+SPLINE_SAMPLES = 20       # Muestras por segmento antes de remuestrear por longitud de arco
+MARKER_SPACING = 1.0      # Separación (m) entre marcadores visuales de la pista
+MIN_SPEED_LIMIT = 1.0     # Límite de velocidad (m/s) mínimo, aun en las curvas más cerradas
+TRACK_CACHE_VERSION = 1   # Cambiar si cambia la forma de compilar la geometría
+
+# Valores de los campos opcionales de una definición
+TRACK_DEFAULTS = {
+    "time_limit": 180,
+    "world_origin": [0, 0],
+    "camera": {"target": [0, 0], "distance": 2},
+    "car_color": [1, 0, 0, 1],
+    "marker_color": [0, 1, 0, 1],
+    "max_lateral_accel": 20.0,   # Aceleración lateral (m/s²) que define el límite en curvas
+    "speed_limit": 14.0          # Límite de velocidad (m/s) en rectas
+}
+
+
+def read_waypoints_csv(path):
+    """Lee waypoints de un CSV con columnas x,y"""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [[float(row["x"]), float(row["y"])] for row in csv.DictReader(f)]
+
+
+def read_track_definition(path):
+    """Lee la definición de una pista, completa los campos opcionales y resuelve los
+    waypoints si vienen en un CSV (ruta relativa al JSON)"""
+    with open(path, encoding="utf-8") as f:
+        definition = json.load(f)
+    for field in ("track", "name", "waypoints"):
+        if field not in definition:
+            raise ValueError(f"La pista {path} no tiene el campo '{field}'")
+
+    definition = {**TRACK_DEFAULTS, **definition}
+    definition.setdefault("car_name", f"Carro {definition['track']}")
+    definition.setdefault("description", definition["name"])
+    if isinstance(definition["waypoints"], str):
+        definition["waypoints"] = read_waypoints_csv(
+            os.path.join(os.path.dirname(path), definition["waypoints"])
+        )
+    if len(definition["waypoints"]) < 2:
+        raise ValueError(f"La pista {path} necesita al menos dos waypoints")
+    return definition
+
+
+def load_track_definitions(directory=TRACKS_DIR):
+    """Lee todas las definiciones de pistas/*.json; retorna {número de pista: definición}"""
+    definitions = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        definition = read_track_definition(path)
+        definitions[definition["track"]] = definition
+    return dict(sorted(definitions.items()))
+
+
+def build_track_path(points, spacing=TRACK_SPACING):
+    """Convierte los waypoints de la pista en una trayectoria densa (spline Catmull-Rom)
+    remuestreada a longitud de arco constante. Si el primer y último punto coinciden
+    la pista se trata como cerrada."""
+    pts = np.asarray(points, dtype=float)
+    closed = len(pts) > 2 and np.allclose(pts[0], pts[-1])
+
+    # Puntos de control extra para que la spline pase por los extremos
+    if closed:
+        pts = pts[:-1]
+        padded = np.vstack([pts[-1:], pts, pts[:2]])
+    else:
+        padded = np.vstack([2 * pts[0] - pts[1], pts, 2 * pts[-1] - pts[-2]])
+
+    p0, p1, p2, p3 = padded[:-3], padded[1:-2], padded[2:-1], padded[3:]
+    t = np.linspace(0.0, 1.0, SPLINE_SAMPLES, endpoint=False)[None, :, None]
+    curve = 0.5 * (2 * p1[:, None] + (p2 - p0)[:, None] * t
+                   + (2 * p0 - 5 * p1 + 4 * p2 - p3)[:, None] * t ** 2
+                   + (3 * p1 - p0 - 3 * p2 + p3)[:, None] * t ** 3)
+    curve = np.vstack([curve.reshape(-1, 2), p2[-1]])
+
+    # Longitud de arco acumulada y remuestreo uniforme
+    seg_len = np.hypot(*np.diff(curve, axis=0).T)
+    arc = np.concatenate([[0.0], np.cumsum(seg_len)])
+    s = np.append(np.arange(0.0, arc[-1], spacing), arc[-1])
+    path = np.column_stack([np.interp(s, arc, curve[:, 0]), np.interp(s, arc, curve[:, 1])])
+
+    # Índice denso de cada waypoint original (para reportar avance)
+    waypoint_s = arc[::SPLINE_SAMPLES]
+    waypoint_indices = np.searchsorted(s, waypoint_s)
+    return {
+        "points": path,
+        "s": s,
+        "closed": closed,
+        "waypoint_indices": waypoint_indices
+    }
+
+
+def compile_track(definition):
+    """Compila la geometría de una pista en coordenadas locales (sin el origen del mundo)"""
+    geometry = build_track_path(definition["waypoints"])
+    points, s = geometry["points"], geometry["s"]
+
+    # Curvatura: derivada de la orientación de la tangente respecto a la longitud de arco
+    tangent = np.gradient(points, s, axis=0)
+    heading = np.unwrap(np.arctan2(tangent[:, 1], tangent[:, 0]))
+    curvature = np.gradient(heading, s)
+
+    # Límite de velocidad por segmento para no superar la aceleración lateral máxima
+    with np.errstate(divide="ignore"):
+        speed_limits = np.sqrt(definition["max_lateral_accel"] / np.abs(curvature))
+    speed_limits = np.clip(speed_limits, MIN_SPEED_LIMIT, definition["speed_limit"])
+
+    marker_step = max(1, int(round(MARKER_SPACING / TRACK_SPACING)))
+    geometry.update({
+        "curvature": curvature,
+        "speed_limits": speed_limits,
+        "markers": points[::marker_step]
+    })
+    return geometry
+
+
+def track_hash(definition):
+    """Hash del contenido de una definición y de los parámetros de compilación"""
+    content = json.dumps({
+        "definition": definition,
+        "compile": [TRACK_CACHE_VERSION, TRACK_SPACING, SPLINE_SAMPLES, MARKER_SPACING, MIN_SPEED_LIMIT]
+    }, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+def load_track_geometry(definition, cache_dir=TRACK_CACHE_DIR):
+    """Geometría compilada de una pista: se lee de la caché o se compila y se guarda"""
+    path = os.path.join(cache_dir, f"pista_{definition['track']}_{track_hash(definition)}.npz")
+    try:
+        with np.load(path) as data:
+            geometry = {key: data[key] for key in data.files}
+        geometry["closed"] = bool(geometry["closed"])
+        return geometry
+    except (OSError, ValueError, zipfile.BadZipFile):
+        # Sin caché para este contenido (o caché dañada): compilar
+        pass
+
+    geometry = compile_track(definition)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Escribir a un archivo temporal y renombrar, para que otro proceso nunca lea una caché a medias
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **geometry)
+    os.replace(tmp_path, path)
+    return geometry
@@ -0,0 +1,61 @@
+"""
+Receptor de la telemetría UDP del simulador (Carrito.py).
+
+Escucha los datagramas que publica TelemetryPublisher y muestra la pose de cada carro
+y los eventos de fin de vuelta. Sirve como ejemplo de consumidor del formato binario
+(TELEMETRY_HEADER_DTYPE, TELEMETRY_POSE_DTYPE y TELEMETRY_LAP_DTYPE).
+
+Ejemplo:
+    python telemetria.py --port 9870
+"""
+import argparse
+import socket
+
+from Carrito import (CAR_NAMES, LAP_STATUS_CODES, TELEMETRY_LAP, TELEMETRY_PORT, TELEMETRY_POSE,
+                     decode_telemetry)
+
+LAP_STATUS_NAMES = {code: name for name, code in LAP_STATUS_CODES.items()}
+
+
+def listen(host, port):
+    """Recibe datagramas y los muestra hasta Ctrl+C"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    print(f"📡 Escuchando telemetría en {host}:{port}...")
+    last_seq = None
+    lost = 0
+    try:
+        while True:
+            data, _ = sock.recvfrom(65535)
+            header, records = decode_telemetry(data)
+            seq = int(header["seq"])
+            if last_seq is not None and seq > last_seq + 1:
+                lost += seq - last_seq - 1
+            last_seq = seq
+
+            if header["kind"] == TELEMETRY_POSE:
+                poses = ", ".join(
+                    f"{CAR_NAMES[int(r['track'])]} ({r['x']:.2f}, {r['y']:.2f}) {r['speed']:.1f} m/s obj {r['target']}"
+                    for r in records
+                )
+                print(f"[{header['sim_time']:8.2f} s] {poses}")
+            elif header["kind"] == TELEMETRY_LAP:
+                r = records[0]
+                print(f"🏁 {CAR_NAMES[int(r['track'])]}: {LAP_STATUS_NAMES[int(r['status'])]} "
+                      f"en {r['lap_time']:.2f} s, {r['stuck_events']} atascos")
+    except KeyboardInterrupt:
+        print(f"\n🛑 Receptor detenido ({lost} datagramas perdidos)")
+    finally:
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Muestra la telemetría UDP del simulador")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=TELEMETRY_PORT)
+    args = parser.parse_args()
+    listen(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
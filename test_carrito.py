@@ -0,0 +1,184 @@
+"""Pruebas del simulador (Carrito.py) sin GUI"""
+import contextlib
+import socket
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import Carrito
+from Carrito import (LAP_STATUS_CODES, PHYSICS_TIMESTEP, STUCK_OFF_TRACK, STUCK_OSCILLATING, STUCK_STALLED,
+                     TELEMETRY_LAP, TELEMETRY_POSE, TRACK_TYPES, FixedStepScheduler, LapStore, MultiCarWorld,
+                     StuckDetector, TelemetryPublisher, TrajectoryRecorder, decode_telemetry,
+                     load_recording, recording_paths)
+
+
+def test_mundos_simultaneos_independientes():
+    # Cada mundo usa su propio cliente de PyBullet: dos a la vez dan las mismas vueltas
+    mundos = [MultiCarWorld(gui=False, record=False) for _ in range(2)]
+    for mundo in mundos:
+        for pista in TRACK_TYPES:
+            mundo.request_start(pista)
+    hilos = [threading.Thread(target=mundo.run, kwargs={"exit_when_idle": True}) for mundo in mundos]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(timeout=60)
+
+    vueltas = [sorted((v["track"], v["status"], v["lap_time"]) for v in mundo.lap_history) for mundo in mundos]
+    assert [pista for pista, _, _ in vueltas[0]] == sorted(TRACK_TYPES)
+    assert all(estado == "completed" for _, estado, _ in vueltas[0])
+    assert vueltas[0] == vueltas[1]
+
+
+def test_planificador_pasos_pendientes():
+    planificador = FixedStepScheduler(max_catchup_steps=24)
+    planificador.last_time = time.perf_counter() - 3.5 * PHYSICS_TIMESTEP
+    assert planificador.due_steps() == 3
+    # El sobrante (medio paso) queda para la siguiente iteración
+    assert planificador.accumulator == pytest.approx(0.5 * PHYSICS_TIMESTEP, abs=0.2 * PHYSICS_TIMESTEP)
+
+
+def test_planificador_limita_la_recuperacion():
+    # Un segundo de atraso serían 240 pasos: se ejecutan a lo sumo 24 y el resto se descarta
+    planificador = FixedStepScheduler(max_catchup_steps=24)
+    planificador.last_time = time.perf_counter() - 1.0
+    assert planificador.due_steps() == 24
+    assert planificador.accumulator == 0.0
+    planificador.last_time = time.perf_counter()
+    assert planificador.due_steps() == 0
+
+
+def test_planificador_sin_tiempo_real():
+    planificador = FixedStepScheduler(realtime=False)
+    planificador.last_time = time.perf_counter() - 1.0
+    assert planificador.due_steps() == 1
+
+
+def grabar(directorio, pista, estado, x, origen=(0, 0)):
+    grabadora = TrajectoryRecorder(pista, 1.0, origen)
+    grabadora.append(0.0, (x, 2.0, 0.1), (0, 0, 0, 1), (1.0, 0.0), 30.0, -2.0, 5)
+    return grabadora.save(estado, directorio)
+
+
+def test_grabacion_ida_y_vuelta(tmp_path):
+    grabar(tmp_path, 2, "completed", 13.0, origen=(10, 0))
+    muestras = load_recording(2, tmp_path)
+    assert len(muestras) == 1
+    # Las posiciones quedan relativas al origen de la pista
+    assert np.allclose(muestras[0]["pos"], (3.0, 2.0, 0.1))
+    assert muestras[0]["target"] == 5
+    assert load_recording(1, tmp_path) is None
+
+
+def test_reproduce_la_ultima_vuelta_completada(tmp_path, monkeypatch):
+    monkeypatch.setattr(Carrito, "RECORDINGS_KEEP", 3)
+    for x, estado in enumerate(["completed", "completed", "completed", "timeout"]):
+        grabar(tmp_path, 1, estado, float(x))
+    # Cada vuelta en su propio archivo; solo se conservan las más recientes
+    assert len(recording_paths(1, tmp_path)) == 3
+    assert load_recording(1, tmp_path)[0]["pos"][0] == 2.0
+
+
+def test_telemetria_ida_y_vuelta():
+    receptor = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receptor.bind(("127.0.0.1", 0))
+    receptor.settimeout(2.0)
+    publicador = TelemetryPublisher(port=receptor.getsockname()[1])
+    try:
+        poses = np.array([[1.5, -2.0, 0.25, 3.0], [4.0, 5.0, -1.0, 0.5]])
+        publicador.publish_poses(1.25, [1, 3], [10, 700], poses)
+        publicador.publish_lap(2.5, 3, "timeout", 20.0, 2)
+
+        cabecera, registros = decode_telemetry(receptor.recv(2048))
+        assert (cabecera["kind"], cabecera["count"], cabecera["seq"]) == (TELEMETRY_POSE, 2, 0)
+        assert cabecera["sim_time"] == pytest.approx(1.25)
+        assert registros["track"].tolist() == [1, 3] and registros["target"].tolist() == [10, 700]
+        assert np.allclose(np.column_stack([registros[c] for c in ("x", "y", "yaw", "speed")]), poses)
+
+        cabecera, registros = decode_telemetry(receptor.recv(2048))
+        assert (cabecera["kind"], cabecera["seq"]) == (TELEMETRY_LAP, 1)
+        assert registros[0]["status"] == LAP_STATUS_CODES["timeout"]
+        assert (registros[0]["lap_time"], registros[0]["stuck_events"]) == (20.0, 2)
+    finally:
+        publicador.close()
+        receptor.close()
+
+
+def vueltas_guardadas(ruta):
+    with contextlib.closing(sqlite3.connect(ruta)) as conn:
+        return conn.execute("SELECT track, status, client FROM laps ORDER BY rowid").fetchall()
+
+
+def vuelta(pista):
+    return {"finished_at": "2025-01-01 10:00:00", "track": pista, "status": "completed", "lap_time": 7.5,
+            "stuck_events": 0}
+
+
+def test_vueltas_por_lotes_al_llenarse(tmp_path):
+    ruta = tmp_path / "vueltas.db"
+    almacen = LapStore(ruta, batch_size=3, flush_interval=60)
+    almacen.add(vuelta(1), "127.0.0.1:5000")
+    almacen.add(vuelta(2))
+    assert vueltas_guardadas(ruta) == []
+    almacen.add(vuelta(3))
+    assert vueltas_guardadas(ruta) == [(1, "completed", "127.0.0.1:5000"), (2, "completed", None),
+                                       (3, "completed", None)]
+    assert almacen.pending == []
+
+
+def test_vueltas_por_lotes_al_vencer_el_intervalo(tmp_path):
+    ruta = tmp_path / "vueltas.db"
+    almacen = LapStore(ruta, batch_size=20, flush_interval=5)
+    almacen.add(vuelta(1))
+    almacen.flush_if_due()
+    assert vueltas_guardadas(ruta) == []
+    almacen.last_flush -= 5
+    almacen.flush_if_due()
+    assert len(vueltas_guardadas(ruta)) == 1
+
+
+def muestras_de_carros(paso, pausa=range(0)):
+    """Posición, avance y distancia a la pista en un paso para cuatro carros: uno sano,
+    uno detenido, uno que va y viene sin avanzar y uno que se aleja de la pista. El carro
+    sano se detiene durante los pasos de `pausa`."""
+    avance = 0.05 * (min(paso, pausa.start) + max(0, paso - pausa.stop)) if pausa else 0.05 * paso
+    ida = 0.5 * ((paso // 4) % 2)
+    posiciones = np.array([[avance, 0.0], [2.0, 2.0], [ida, 0.01 * paso], [0.05 * paso, 3.5 + 0.05 * paso]])
+    return posiciones, np.array([avance, 0.0, 0.0, 0.05 * paso]), np.array([0.1, 0.1, 0.5, 3.5 + 0.05 * paso])
+
+
+def detectar(detector, pasos, **kwargs):
+    """Motivos confirmados de cada carro por paso"""
+    filas = np.arange(4)
+    return np.array([detector.update(filas, *muestras_de_carros(paso, **kwargs)) for paso in range(pasos)])
+
+
+def test_atascos_por_motivo():
+    detector = StuckDetector(4, window=20, check_interval=4, warmup=20, confirm_checks=3)
+    motivos = detectar(detector, 80)
+    assert not motivos[:, 0].any()
+    for carro, esperado in ((1, STUCK_STALLED), (2, STUCK_OSCILLATING), (3, STUCK_OFF_TRACK)):
+        assert set(motivos[:, carro]) == {0, esperado}
+        # Primera evaluación al completar el calentamiento (muestra 20) y confirmación en la
+        # tercera evaluación seguida, 2 x 4 pasos después
+        assert np.flatnonzero(motivos[:, carro])[0] == 20 + 2 * 4 - 1
+
+
+def test_una_pausa_breve_no_es_atasco():
+    # Detenido toda una ventana en dos evaluaciones, pero arranca antes de la tercera
+    detector = StuckDetector(4, window=20, check_interval=4, warmup=20, confirm_checks=3)
+    assert not detectar(detector, 120, pausa=range(40, 64))[:, 0].any()
+    detector = StuckDetector(4, window=20, check_interval=4, warmup=20, confirm_checks=3)
+    assert set(detectar(detector, 120, pausa=range(40, 80))[:, 0]) == {0, STUCK_STALLED}
+
+
+def test_reiniciar_repite_el_calentamiento():
+    detector = StuckDetector(4, window=20, check_interval=4, warmup=20, confirm_checks=3)
+    detectar(detector, 80)
+    detector.reset(1)
+    filas = np.arange(4)
+    motivos = [detector.update(filas, *muestras_de_carros(80 + paso))[1] for paso in range(20)]
+    assert not any(motivos)
@@ -0,0 +1,66 @@
+"""Pruebas del anillo de estado en memoria compartida (memoria_compartida.py)"""
+import subprocess
+import sys
+import uuid
+
+import numpy as np
+import pytest
+
+from memoria_compartida import PoseRingBuffer, PoseRingReader
+
+
+@pytest.fixture
+def anillo():
+    escritor = PoseRingBuffer(name=f"prueba_{uuid.uuid4().hex[:8]}", capacity=8)
+    yield escritor
+    escritor.close()
+
+
+def escribir_pasos(escritor, pasos, carros=3):
+    for _ in range(pasos):
+        poses = np.column_stack([np.arange(carros, dtype=float) + escritor.sequence, np.zeros((carros, 3))])
+        escritor.write(escritor.sequence / 240, np.arange(1, carros + 1), np.zeros(carros), poses,
+                       np.zeros(carros), np.zeros(carros))
+
+
+def test_vistas_contiguas_tras_dar_la_vuelta(anillo):
+    lector = PoseRingReader(anillo.name)
+    escribir_pasos(anillo, 4)   # 12 muestras en un anillo de 8
+    ultimas = lector.latest(8)
+    assert lector.sequence == 12
+    assert ultimas["seq"].tolist() == list(range(4, 12))
+    assert ultimas["x"].tolist() == list(range(4, 12))
+
+    nuevas, secuencia = lector.since(10)
+    assert nuevas["seq"].tolist() == [10, 11] and secuencia == 12
+    # Atrasado más que la capacidad: solo quedan las `capacity` más recientes
+    assert len(lector.since(0)[0]) == 8
+    del ultimas, nuevas
+    lector.close()
+
+
+def test_vista_invalida_al_sobrescribirse(anillo):
+    lector = PoseRingReader(anillo.name)
+    escribir_pasos(anillo, 1)
+    vista, secuencia = lector.since(0)   # Muestras 0 a 2
+    escribir_pasos(anillo, 1)            # 6 escritas: aún caben
+    assert lector.is_valid(vista, secuencia)
+    escribir_pasos(anillo, 1)            # 9 escritas: la muestra 0 ya se sobrescribió
+    assert not lector.is_valid(vista, secuencia)
+    del vista
+    lector.close()
+
+
+def test_no_borra_un_anillo_en_uso(anillo):
+    # Otro simulador con el mismo nombre no debe borrar el bloque de uno que sigue corriendo
+    codigo = ("import sys\n"
+              "from memoria_compartida import PoseRingBuffer\n"
+              "try:\n"
+              "    PoseRingBuffer(name=sys.argv[1], capacity=8)\n"
+              "except FileExistsError:\n"
+              "    sys.exit(3)\n")
+    assert subprocess.run([sys.executable, "-c", codigo, anillo.name]).returncode == 3
+    escribir_pasos(anillo, 1)
+    lector = PoseRingReader(anillo.name)
+    assert lector.sequence == 3
+    lector.close()
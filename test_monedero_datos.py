@@ -0,0 +1,175 @@
+"""Pruebas de regresión del almacén de /Monedero (monedero_datos.py)"""
+import numpy as np
+import pandas as pd
+
+from benchmark_monedero import generar_registros, preprocesar_por_filas
+from monedero_datos import (COLUMNAS_ACUMULADAS, COLUMNAS_AGREGADOS, COLUMNAS_PESO, GRANULARIDADES, VALORES_MONEDAS,
+                            AgregadosMonedero, AlmacenMonedero, extraer_registros, pagina_reciente, preprocesar,
+                            reducir_para_grafica, registros_a_dataframe)
+
+
+def registro(minuto, conteo=0, **campos):
+    return {"fecha_hora_recoleccion": f"2025-01-01 10:{minuto:02d}:00", "conteo_caja1": conteo, **campos}
+
+
+def test_reemplazar_con_monedero_vacio():
+    almacen = AlmacenMonedero()
+    almacen.reemplazar([], [])
+    assert almacen.sincronizado.is_set()
+    assert almacen.dataframe().empty
+    for granularidad in GRANULARIDADES:
+        assert almacen.consultar_agregados(granularidad).empty
+
+
+def test_put_inicial_sin_datos():
+    # Con /Monedero vacío el listener entrega un 'put' en '/' con None
+    almacen = AlmacenMonedero()
+    almacen.aplicar_evento("put", "/", None)
+    assert almacen.sincronizado.is_set()
+    assert almacen.dataframe().empty
+
+    # Los registros que llegan después se agregan normalmente
+    almacen.aplicar_evento("put", "/-N1", {"fecha_hora_recoleccion": "2025-01-01 10:00:00", "conteo_caja1": 2})
+    assert len(almacen.dataframe()) == 1
+    assert almacen.consultar_agregados("dia")["monedas_caja1"].tolist() == [2]
+
+
+def test_pagina_conserva_fecha_original():
+    fechas = [f"2025-01-0{dia} 10:00:0{dia}" for dia in range(1, 6)]
+    df = registros_a_dataframe([{"fecha_hora_recoleccion": fecha, "conteo_caja1": 1} for fecha in fechas])
+    pagina = pagina_reciente(df, 0, 2)
+    assert pagina["fecha_hora_recoleccion"].tolist() == [fechas[4], fechas[3]]
+    assert "fecha_hora_recoleccion" not in df.columns  # El almacén no guarda el texto
+    assert pagina_reciente(df, 5, 2).empty
+
+
+def test_extraer_registros():
+    assert extraer_registros({"-N1": registro(0), "-N2": [registro(1), None, registro(2)]}) == \
+        (["-N1", "-N2"], [registro(0), registro(1), registro(2)])
+    assert extraer_registros([None, registro(0)]) == ([], [registro(0)])
+    assert extraer_registros(None) == ([], [])
+
+
+def test_carga_incremental_por_push_id():
+    almacen = AlmacenMonedero()
+    almacen.aplicar_evento("put", "/", {"-N1": registro(0, 1), "-N2": registro(1, 2)})
+    assert (len(almacen), almacen.ultima_clave) == (2, "-N2")
+
+    # Árbol completo otra vez (reconexión): solo se agrega lo posterior al último push ID
+    almacen.aplicar_evento("put", "/", {"-N1": registro(0, 1), "-N2": registro(1, 2), "-N3": registro(2, 3)})
+    assert (len(almacen), almacen.ultima_clave) == (3, "-N3")
+
+    # Un registro nuevo con fecha anterior al último cargado: se reordena por fecha
+    almacen.aplicar_evento("put", "/-N4", registro(1, 4))
+    df = almacen.dataframe()
+    assert almacen.ultima_clave == "-N4"
+    assert df["Fecha"].is_monotonic_increasing
+    assert df["conteo_caja1"].tolist() == [1, 2, 4, 3]
+    assert df["Fecha"].iloc[-1] == pd.Timestamp("2025-01-01 10:02:00")
+
+
+def test_cache_en_disco_ida_y_vuelta(tmp_path):
+    almacen = AlmacenMonedero()
+    almacen.reemplazar(["-N1", "-N2", "-N3"], [
+        registro(0, 1, caja1=10.5, posicion_carro="A", movimiento_carro=True, nota="hola"),
+        registro(1, 2, caja1=11.0, posicion_carro="B"),
+        registro(2, 3, caja1=12.5, posicion_carro="A", nota="chao")
+    ])
+    assert almacen.guardar(tmp_path, origen="https://db")
+    assert not almacen.guardar(tmp_path, origen="https://db")  # Sin cambios no se vuelve a guardar
+
+    leido = AlmacenMonedero.desde_cache(tmp_path, origen="https://db")
+    assert leido.ultima_clave == "-N3"
+    # Las columnas leídas están mapeadas desde el disco (np.memmap): se comparan los valores
+    pd.testing.assert_frame_equal(leido.dataframe().copy(), almacen.dataframe(), check_like=True)
+    pd.testing.assert_frame_equal(leido.consultar_agregados("minuto"), almacen.consultar_agregados("minuto"))
+    # Otra base de datos no usa esta caché
+    assert AlmacenMonedero.desde_cache(tmp_path, origen="https://otra") is None
+
+    # Lo que llega después se agrega sobre lo leído y el nuevo guardado reemplaza al anterior
+    leido.agregar(["-N4"], [registro(3, 4, posicion_carro="C")])
+    assert leido.dataframe()["posicion_carro"].tolist() == ["A", "B", "A", "C"]
+    assert leido.guardar(tmp_path, origen="https://db")
+    assert len([ruta for ruta in tmp_path.iterdir() if ruta.is_dir()]) == 1
+    assert len(AlmacenMonedero.desde_cache(tmp_path, origen="https://db")) == 4
+
+
+def test_preprocesar_igual_a_la_version_por_filas():
+    df = registros_a_dataframe(generar_registros(500))
+    original = df.copy()
+    esperado = preprocesar_por_filas(df.copy())
+    obtenido = preprocesar(df)
+    for col in COLUMNAS_ACUMULADAS + ["valor_caja1", "valor_caja2", "valor_caja3", "valor_total"]:
+        assert np.array_equal(obtenido[col].to_numpy(), esperado[col].to_numpy()), col
+    # Las lecturas en cero se corrigieron, pero df (la vista del almacén) queda intacto
+    assert (obtenido["conteo_caja1"] == 0).sum() < (original["conteo_caja1"] == 0).sum()
+    pd.testing.assert_frame_equal(df, original)
+    assert preprocesar(pd.DataFrame()).empty
+
+
+def test_reducir_conserva_extremos_de_cada_pixel():
+    rng = np.random.default_rng(0)
+    x = np.cumsum(rng.exponential(1.0, 10000))
+    y = np.round(rng.normal(size=10000).cumsum(), 1)   # Con empates: cuenta la primera posición
+    ancho = 50
+    indices = reducir_para_grafica(x, y, ancho)
+
+    # Referencia por cubeta: primero, último, mínimo y máximo de cada columna de píxeles
+    cubetas = np.minimum(((x - x[0]) * (ancho / (x[-1] - x[0]))).astype(int), ancho - 1)
+    esperados = set()
+    for cubeta in np.unique(cubetas):
+        posiciones = np.flatnonzero(cubetas == cubeta)
+        tramo = y[posiciones]
+        esperados |= {posiciones[0], posiciones[-1], posiciones[np.argmin(tramo)], posiciones[np.argmax(tramo)]}
+    assert indices.tolist() == sorted(esperados)
+    assert len(indices) <= 4 * ancho
+
+
+def test_reducir_fechas_y_series_cortas():
+    fechas = np.datetime64("2025-01-01") + np.arange(1000) * np.timedelta64(5, "s")
+    valores = np.sin(np.arange(1000) / 10)
+    indices = reducir_para_grafica(fechas, valores, 100)
+    assert indices[0] == 0 and indices[-1] == 999 and len(indices) <= 400
+    assert valores[indices].max() == valores.max() and valores[indices].min() == valores.min()
+    # Con pocos puntos por píxel no se descarta ninguno
+    assert reducir_para_grafica(fechas[:300], valores[:300], 100).tolist() == list(range(300))
+
+
+def agregados_con_groupby(df, frecuencia):
+    """Agregados de referencia: incrementos de los máximos acumulados agrupados por cubeta"""
+    contadores = ["conteo_caja1", "conteo_caja2", "conteo_caja3", "conteo_global", "errores_clasificacion"]
+    maximos = df[contadores].astype(float).cummax()
+    incrementos = maximos.diff().fillna(maximos.iloc[0])
+    columnas = {"registros": 1.0, "monedas_caja1": incrementos["conteo_caja1"],
+                "monedas_caja2": incrementos["conteo_caja2"], "monedas_caja3": incrementos["conteo_caja3"],
+                "monedas": incrementos["conteo_global"],
+                "valor": sum(incrementos[f"conteo_{caja}"] * moneda["valor"] for caja, moneda in VALORES_MONEDAS.items()),
+                "errores": incrementos["errores_clasificacion"]}
+    grupos = pd.DataFrame(columnas).groupby(df["Fecha"].dt.floor(frecuencia))
+    pesos = df[COLUMNAS_PESO].astype(float).groupby(df["Fecha"].dt.floor(frecuencia))
+    esperado = pd.concat([grupos.sum(), pesos.min().add_prefix("peso_min_"), pesos.max().add_prefix("peso_max_"),
+                          pesos.last().add_prefix("peso_")], axis=1)
+    return esperado[COLUMNAS_AGREGADOS]
+
+
+def test_agregados_por_lotes_igual_a_groupby():
+    df = registros_a_dataframe(generar_registros(3000))   # Un registro cada 5 s: ~4 horas
+    agregados = AgregadosMonedero()
+    # Lotes que cortan minutos y horas por la mitad
+    for inicio, fin in [(0, 7), (7, 500), (500, 1234), (1234, 3000)]:
+        agregados.agregar(df.iloc[inicio:fin])
+
+    for granularidad, frecuencia in (("minuto", "min"), ("hora", "h"), ("dia", "D")):
+        tabla = agregados.tabla(granularidad)
+        esperado = agregados_con_groupby(df, frecuencia)
+        assert np.array_equal(tabla["Fecha"].to_numpy().astype("datetime64[s]"),
+                              esperado.index.to_numpy().astype("datetime64[s]")), granularidad
+        assert np.allclose(tabla[COLUMNAS_AGREGADOS].to_numpy(dtype=float), esperado.to_numpy()), granularidad
+
+
+def test_agregados_rango_semiabierto():
+    df = registros_a_dataframe(generar_registros(3000))
+    agregados = AgregadosMonedero()
+    agregados.agregar(df)
+    horas = agregados.tabla("hora", desde="2025-01-01 01:30", hasta="2025-01-01 03:00")["Fecha"]
+    assert horas.astype(str).tolist() == ["2025-01-01 01:00:00", "2025-01-01 02:00:00"]
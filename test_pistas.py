@@ -0,0 +1,68 @@
+"""Pruebas de las definiciones de pistas y la caché de geometría (pistas.py)"""
+import json
+
+import numpy as np
+import pytest
+
+import pistas
+from pistas import load_track_definitions, load_track_geometry, read_track_definition, track_hash
+
+
+def definicion_cuadrada():
+    return {**pistas.TRACK_DEFAULTS, "track": 9, "name": "Cuadrada",
+            "waypoints": [[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]]}
+
+
+def test_compilar_y_leer_de_la_cache(tmp_path, monkeypatch):
+    definicion = definicion_cuadrada()
+    compilada = load_track_geometry(definicion, tmp_path)
+    assert [ruta.name for ruta in tmp_path.iterdir()] == [f"pista_9_{track_hash(definicion)}.npz"]
+    assert compilada["closed"]
+
+    # La segunda carga sale de la caché, sin compilar
+    def sin_compilar(_):
+        raise AssertionError("La geometría debía salir de la caché")
+    monkeypatch.setattr(pistas, "compile_track", sin_compilar)
+    leida = load_track_geometry(definicion, tmp_path)
+    assert leida.keys() == compilada.keys()
+    assert leida["closed"] is True
+    for clave in ("points", "s", "curvature", "speed_limits", "markers", "waypoint_indices"):
+        assert np.array_equal(leida[clave], compilada[clave])
+
+
+def test_la_clave_cambia_con_la_definicion(tmp_path):
+    definicion = definicion_cuadrada()
+    movida = {**definicion, "waypoints": [[0, 0], [5, 0], [4, 4], [0, 4], [0, 0]]}
+    mas_rapida = {**definicion, "speed_limit": 20.0}
+    claves = {track_hash(definicion), track_hash(movida), track_hash(mas_rapida)}
+    assert len(claves) == 3
+    assert track_hash(dict(reversed(list(definicion.items())))) == track_hash(definicion)
+
+    load_track_geometry(definicion, tmp_path)
+    assert not np.array_equal(load_track_geometry(movida, tmp_path)["points"],
+                              load_track_geometry(definicion, tmp_path)["points"])
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_definicion_con_waypoints_en_csv(tmp_path):
+    (tmp_path / "puntos.csv").write_text("x,y\n0,0\n3,1\n6,0\n", encoding="utf-8")
+    (tmp_path / "pista_7.json").write_text(json.dumps({"track": 7, "name": "Recta", "waypoints": "puntos.csv"}),
+                                           encoding="utf-8")
+    definicion = load_track_definitions(tmp_path)[7]
+    assert definicion["waypoints"] == [[0.0, 0.0], [3.0, 1.0], [6.0, 0.0]]
+    assert definicion["time_limit"] == pistas.TRACK_DEFAULTS["time_limit"]
+    assert definicion["car_name"] == "Carro 7"
+
+
+def test_definicion_incompleta(tmp_path):
+    ruta = tmp_path / "pista_8.json"
+    ruta.write_text(json.dumps({"track": 8, "waypoints": [[0, 0], [1, 0]]}), encoding="utf-8")
+    with pytest.raises(ValueError, match="name"):
+        read_track_definition(ruta)
+
+
+def test_pistas_del_repositorio():
+    definiciones = load_track_definitions()
+    assert list(definiciones) == [1, 2, 3]
+    # La pista 2 toma sus waypoints de pista_2.csv
+    assert all(len(punto) == 2 for punto in definiciones[2]["waypoints"])